@@ -0,0 +1,141 @@
+"""Static asset sync of the catalogue: copies the Catalogue Explorer files
+(static/) to the catalogue folder, skipping the files that are unchanged.
+Pure Python (used by the Rhino command and the headless batch exporter).
+
+The state of the synced files is kept in data/cache/assets.json:
+- "sources": size, mtime and sha1 of every source file, so a source is only
+  hashed again when its size or mtime changed
+- "targets": size, mtime and sha1 of every file written to the catalogue
+A target is left alone when its size and mtime match the recorded ones and
+its recorded hash is the source hash (no read of the target at all); a
+target unknown to the manifest is hashed once and kept if identical.
+Changed files are copied, or hard-linked/reflinked from the source folder
+(shared asset store) with link="hardlink"/"reflink", falling back to a copy.
+production=True leaves out dev-only files (DEV_PATTERNS, e.g. source maps).
+Files synced by a previous run that are no longer wanted are removed."""
+
+import fnmatch
+import json
+import os
+import shutil
+
+from CatalogueCache import FileHash, ReplaceFile
+
+#optional: reflinks (copy-on-write clones, e.g. Btrfs, XFS)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+ASSETS_VERSION = 1
+DEV_PATTERNS = ["*.map", ".gitignore"]
+#ioctl FICLONE (Linux)
+FICLONE = 0x40049409
+
+def AssetsPath(pathWebRoot):
+    return os.path.join(pathWebRoot, "data", "cache", "assets.json")
+
+def LoadAssets(pathWebRoot):
+    """returns the sync manifest, empty if missing, unreadable or outdated"""
+    try:
+        with open(AssetsPath(pathWebRoot)) as f:
+            assets = json.load(f)
+        if assets.get("version") == ASSETS_VERSION: return assets
+    except (IOError, OSError, ValueError):
+        pass
+    return {"version": ASSETS_VERSION, "sources": {}, "targets": {}}
+
+def SaveAssets(pathWebRoot, assets):
+    path = AssetsPath(pathWebRoot)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path + ".tmp", "w") as f:
+        json.dump(assets, f, indent=1, sort_keys=True)
+    ReplaceFile(path + ".tmp", path)
+
+def _Stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+def _Reflink(pathSource, pathTarget):
+    with open(pathSource, "rb") as src:
+        with open(pathTarget, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copystat(pathSource, pathTarget)
+
+def PlaceFile(pathSource, pathTarget, link="copy"):
+    """writes pathTarget from pathSource ("copy", "hardlink" or "reflink",
+    falling back to a copy); returns the method used"""
+    folder = os.path.dirname(pathTarget)
+    if not os.path.exists(folder): os.makedirs(folder)
+    pathTmp = pathTarget + ".tmp"
+    if os.path.exists(pathTmp): os.remove(pathTmp)
+    method = "copy"
+    try:
+        if link == "hardlink" and hasattr(os, "link"):
+            os.link(pathSource, pathTmp)
+            method = link
+        elif link == "reflink" and fcntl is not None:
+            _Reflink(pathSource, pathTmp)
+            method = link
+    except (IOError, OSError):
+        if os.path.exists(pathTmp): os.remove(pathTmp)
+    if method == "copy": shutil.copy2(pathSource, pathTmp)
+    ReplaceFile(pathTmp, pathTarget)
+    return method
+
+def IsDevFile(relPath):
+    name = os.path.basename(relPath)
+    return any(fnmatch.fnmatch(name, pattern) for pattern in DEV_PATTERNS)
+
+def SyncStatic(pathStatic, pathWebRoot, production=False, link="copy"):
+    """syncs the files of pathStatic to pathWebRoot, returns the counts
+    {"copied", "linked", "skipped", "removed", "bytes" (written)}"""
+    assets = LoadAssets(pathWebRoot)
+    sources, targets = {}, {}
+    counts = {"copied": 0, "linked": 0, "skipped": 0, "removed": 0, "bytes": 0}
+    for folder, dirs, files in os.walk(pathStatic):
+        dirs.sort()
+        for name in sorted(files):
+            pathSource = os.path.join(folder, name)
+            rel = os.path.relpath(pathSource, pathStatic).replace(os.sep, "/")
+            if production and IsDevFile(rel): continue
+
+            # Source hash, reused while its size and mtime are unchanged
+            stat = _Stat(pathSource)
+            known = assets["sources"].get(rel)
+            if known and known[:2] == stat: digest = known[2]
+            else: digest = FileHash(pathSource)
+            sources[rel] = stat + [digest]
+
+            pathTarget = os.path.join(pathWebRoot, *rel.split("/"))
+            if os.path.exists(pathTarget):
+                targetStat = _Stat(pathTarget)
+                known = assets["targets"].get(rel)
+                if known and known[:2] == targetStat: targetDigest = known[2]
+                elif targetStat[0] == stat[0]: targetDigest = FileHash(pathTarget)
+                else: targetDigest = None
+                if targetDigest == digest:
+                    targets[rel] = targetStat + [digest]
+                    counts["skipped"] += 1
+                    continue
+
+            method = PlaceFile(pathSource, pathTarget, link)
+            targets[rel] = _Stat(pathTarget) + [digest]
+            if method == "copy":
+                counts["copied"] += 1
+                counts["bytes"] += stat[0]
+            else:
+                counts["linked"] += 1
+
+    #files of a previous sync that are gone from the source or left out
+    for rel in assets["targets"]:
+        if rel in targets: continue
+        pathTarget = os.path.join(pathWebRoot, *rel.split("/"))
+        if os.path.exists(pathTarget):
+            os.remove(pathTarget)
+            counts["removed"] += 1
+
+    assets["sources"], assets["targets"] = sources, targets
+    SaveAssets(pathWebRoot, assets)
+    return counts
@@ -0,0 +1,123 @@
+"""Headless catalogue exporter: builds the catalogue of the CatalogueExporter
+Rhino command from point cloud files (.ply/.xyz/.3dm) without Rhino, e.g. on
+Linux compute nodes, spreading the per-object work over a process pool.
+
+Runs the catalogue core (CatalogueCore) with the local backend
+(LocalBackend): per object, in a worker process, read cloud, point count,
+Poisson mesh (open3d, optional), voxel downsample, minimal bounding box
+(MinimumBoundingBoxNp), .3dm export of the layers under data/3dm, binary
+point clouds for the web viewer under data/pcb (PointCloudBinary) and their
+octree level of detail under data/octree (PointCloudOctree), decimated
+meshes (MeshDecimation) and binary meshes under data/pcm (MeshBinary).
+With --precompress, .gz/.br variants of the catalogue files are written
+(CatalogueCompression).
+The catalogue itself (static files, synced by CatalogueAssets, and
+data/database.csv) is only written by the main process, with rows in input
+order, so the output is deterministic.
+Inputs whose file content and parameters match the catalogue cache
+(CatalogueCache) and whose artifacts exist are skipped.
+The Iris viewer export needs Rhino and is not produced here.
+
+usage: python CatalogueBatch.py CATALOGUE_DIR CLOUD [CLOUD ...] [options]"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import CatalogueAssets as assets
+import CatalogueCompression as compression
+import CatalogueCore as core
+import CatalogueTree as treeTools
+import PointCloudIO as pcio
+from LocalBackend import LocalBackend
+
+DEFAULT_PARAMS = core.DEFAULT_PARAMS
+
+PATH_CATALOGUE_EXPORTER = os.path.dirname(os.path.realpath(__file__))
+
+def CopyStatic(pathWebRoot, production=False, link="copy"):
+    # Sync static files to the catalogue dir, unchanged files are skipped
+    return assets.SyncStatic(os.path.join(PATH_CATALOGUE_EXPORTER, "static"), pathWebRoot, production, link)
+
+def RunBatch(paths, pathWebRoot, params=None, strDataTreeBranch="", labels=None, workers=None, precompress=False, production=False, assetLink="copy"):
+    """processes the point cloud files with a pool of worker processes
+    (workers=1: in the current process) and writes the catalogue
+    precompress: writes .gz/.br variants of the catalogue files
+    production: leaves out the dev-only static files (source maps)
+    assetLink: "copy", "hardlink" or "reflink" of the static files
+    returns the CSV rows of the objects (processed or up to date)"""
+    if pcio.rhino3dm is None: raise ImportError("rhino3dm is required to write the catalogue .3dm files")
+
+    CopyStatic(pathWebRoot, production, assetLink)
+    for folder in ["3dm", "pcb", "pcm"]:
+        pathFolder = os.path.join(pathWebRoot, "data", folder)
+        if not os.path.exists(pathFolder):
+            os.makedirs(pathFolder)
+
+    executor = None
+    if workers != 1: executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        #map keeps the input order whatever the completion order
+        mapper = executor.map if executor else map
+        backend = LocalBackend(os.path.join(pathWebRoot, "data", "cache", "normals"))
+        rows = core.ExportCatalogue(backend, paths, pathWebRoot, params, strDataTreeBranch, labels, mapper)
+    finally:
+        if executor: executor.shutdown()
+    if precompress: compression.CompressTree(pathWebRoot, workers)
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless catalogue export of point cloud files")
+    parser.add_argument("catalogue", help="catalogue folder (web root)")
+    parser.add_argument("clouds", nargs="+", help=".ply/.xyz/.3dm point cloud files")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--branch", default="", help="DataTree branch, e.g. 'Stones.Basalt.Batch42'")
+    parser.add_argument("--labels", action="store_true", help="use the file names as item labels")
+    parser.add_argument("--info", action="store_true", help="print the point cloud metadata and exit")
+    parser.add_argument("--precompress", action="store_true", help="write .gz (and .br with brotli) variants of the catalogue files")
+    parser.add_argument("--production", action="store_true", help="leave out the dev-only static files (source maps)")
+    parser.add_argument("--asset-link", dest="assetLink", choices=["copy", "hardlink", "reflink"], default="copy", help="how changed static files are placed in the catalogue")
+    parser.add_argument("--downsample", type=int, default=DEFAULT_PARAMS["downsample"])
+    parser.add_argument("--normals-neighbours", dest="normalsNeighbours", type=int, default=DEFAULT_PARAMS["normalsNeighbours"])
+    parser.add_argument("--normals-orientation", dest="normalsOrientation", choices=["centroid", "propagate"], default=DEFAULT_PARAMS["normalsOrientation"])
+    parser.add_argument("--poisson-max-depth", dest="poisonMaxDepth", type=int, default=DEFAULT_PARAMS["poisonMaxDepth"])
+    parser.add_argument("--poisson-min-depth", dest="poisonMinDepth", type=int, default=DEFAULT_PARAMS["poisonMinDepth"])
+    parser.add_argument("--poisson-scale", dest="poisonScale", type=float, default=DEFAULT_PARAMS["poisonScale"])
+    parser.add_argument("--poisson-linear", dest="poissonLinear", action="store_true")
+    parser.add_argument("--poisson-auto-depth", dest="poissonAutoDepth", action="store_true", help="depth fitted to the point spacing of every cloud")
+    parser.add_argument("--poisson-resolution", dest="poissonResolution", type=float, default=DEFAULT_PARAMS["poissonResolution"], help="auto depth: mesh cell size, in point spacings")
+    parser.add_argument("--mesh-target-faces", dest="meshTargetFaces", type=int, nargs="*", default=DEFAULT_PARAMS["meshTargetFaces"], help="face counts of the decimated meshes, the first one is loaded by the viewer")
+    parser.add_argument("--voxel-size", dest="voxelSize", type=float, default=DEFAULT_PARAMS["voxelSize"])
+    parser.add_argument("--voxel-pyramid", dest="voxelPyramid", type=float, nargs="*", default=DEFAULT_PARAMS["voxelPyramid"], help="extra voxel sizes, exported as PointCloud_Downsampled_<size>")
+    parser.add_argument("--voxel-selection", dest="voxelSelection", choices=["first", "centroid", "nearest"], default=DEFAULT_PARAMS["voxelSelection"])
+    parser.add_argument("--no-hull-reduction", dest="hullReduction", action="store_false")
+    parser.add_argument("--minbbox-algorithm", dest="minBBoxAlgorithm", choices=["sampling", "hullface"], default=DEFAULT_PARAMS["minBBoxAlgorithm"])
+    parser.add_argument("--minbbox-pca-seed", dest="minBBoxPcaSeed", action="store_true")
+    parser.add_argument("--octree-budget", dest="octreeBudget", type=int, default=DEFAULT_PARAMS["octreeBudget"], help="points per octree node (0: no octree)")
+    args = parser.parse_args(argv)
+
+    if args.info:
+        for path in args.clouds:
+            print("{} | {}".format(path, pcio.FileMetadata(path)))
+        return 0
+
+    params = dict((k, getattr(args, k)) for k in DEFAULT_PARAMS)
+    labels = None
+    if args.labels:
+        labels = [os.path.splitext(os.path.basename(p))[0] for p in args.clouds]
+    try:
+        rows = RunBatch(args.clouds, args.catalogue, params, args.branch, labels, args.workers, args.precompress,
+            args.production, args.assetLink)
+    except treeTools.DataTreeConflict as e:
+        #e.g. a DataTree name already used under another branch
+        sys.stderr.write("error: {}\n".format(e))
+        return 1
+    for row in rows:
+        line = "{} | points: {} | min. bbox volume: {} | mesh volume: {}".format(row[0], row[3], row[4], row[5])
+        if len(row) > 8: line += " | poisson depth: {}".format(row[8]) #rows cached before the depth column
+        print(line)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
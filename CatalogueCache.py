@@ -0,0 +1,81 @@
+"""Incremental export cache stored in the catalogue folder (data/cache.json).
+Pure Python (used by the Rhino command and the headless batch exporter).
+
+Every exported object has an entry keyed on its physicalObjectId:
+- "key": hash of the point data plus the processing parameters
+- "artifacts": exported files, relative to the catalogue folder
+- "row": its database.csv row
+- "metadata": statistics of its point cloud (count, bounding box, ...)
+An object whose key is unchanged and whose artifacts all exist is skipped."""
+
+import hashlib
+import json
+import os
+
+CACHE_VERSION = 1
+
+def CachePath(pathWebRoot):
+    return os.path.join(pathWebRoot, "data", "cache.json")
+
+def CacheKey(dataHash, params):
+    """combines the hash of the point data with the processing parameters"""
+    h = hashlib.sha1()
+    h.update(dataHash.encode("ascii"))
+    h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+def FileHash(path, blockSize=1 << 20):
+    #streamed sha1 of a file content
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(blockSize)
+            if not block: break
+            h.update(block)
+    return h.hexdigest()
+
+def LoadCache(pathWebRoot):
+    """returns the cache manifest, empty if missing, unreadable or outdated"""
+    try:
+        with open(CachePath(pathWebRoot)) as f:
+            cache = json.load(f)
+        if cache.get("version") == CACHE_VERSION: return cache
+    except (IOError, OSError, ValueError):
+        pass
+    return {"version": CACHE_VERSION, "items": {}}
+
+def ReplaceFile(pathTmp, path):
+    #rename over an existing file (os.replace is not available in IronPython 2.7)
+    if hasattr(os, "replace"):
+        os.replace(pathTmp, path)
+    else:
+        if os.path.exists(path): os.remove(path)
+        os.rename(pathTmp, path)
+
+def SaveCache(pathWebRoot, cache):
+    path = CachePath(pathWebRoot)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path + ".tmp", "w") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    ReplaceFile(path + ".tmp", path)
+
+def CachedRow(cache, pathWebRoot, physicalObjectId, key):
+    """returns the cached CSV row if the object is up to date, else None"""
+    entry = cache["items"].get(physicalObjectId)
+    if entry is None or entry["key"] != key: return
+    for artifact in entry["artifacts"]:
+        if not os.path.exists(os.path.join(pathWebRoot, artifact)): return
+    return list(entry["row"])
+
+def KeyIndex(cache):
+    #key -> physicalObjectId, for inputs whose id is only known after processing
+    return dict((entry["key"], item) for item, entry in cache["items"].items())
+
+def UpdateCache(cache, physicalObjectId, key, artifacts, row, metadata=None):
+    cache["items"][physicalObjectId] = {
+        "key": key,
+        "artifacts": list(artifacts),
+        "row": list(row),
+        "metadata": metadata,
+    }
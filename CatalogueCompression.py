@@ -0,0 +1,170 @@
+"""Precompressed catalogue files: .gz (and .br if the brotli module is
+installed) siblings of the static assets and exported data, written once at
+export time so that static servers (e.g. `sirv --gzip --brotli`, nginx
+gzip_static/brotli_static) serve them without compressing on every request.
+Pure Python (gzip only in IronPython, unless brotli is available).
+
+- files whose extension is not in COMPRESSED_EXTENSIONS (images, already
+  compressed data) or smaller than MIN_SIZE are left alone
+- a variant gets the modification time of its source: files whose variants
+  are up to date are skipped, so repeated exports only compress what changed
+- a variant that is not smaller than its source is not kept, and the
+  decision is recorded in data/cache/compression.json (size and mtime of the
+  source), so the file is not compressed again until it changes
+- files are compressed in parallel by a thread pool (zlib and brotli release
+  the GIL), serially where concurrent.futures is missing (IronPython)
+
+usage: python CatalogueCompression.py CATALOGUE_DIR [--workers N] [--no-brotli]"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+
+from CatalogueCache import ReplaceFile
+
+#optional: brotli variants
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+COMPRESSED_EXTENSIONS = [".html", ".js", ".css", ".map", ".json", ".csv", ".svg", ".txt", ".wasm",
+    ".pcb", ".pcm", ".3dm"]
+MIN_SIZE = 1024
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+#internal files of the exporter under data/, not served
+SKIPPED_DATA = ["cache", "cache.json"]
+COMPRESSION_VERSION = 1
+
+def Encodings(useBrotli=True):
+    """file suffixes of the available encodings"""
+    if useBrotli and brotli is not None: return [".gz", ".br"]
+    return [".gz"]
+
+def Compress(data, suffix):
+    if suffix == ".br": return brotli.compress(data, quality=BROTLI_QUALITY)
+    buf = io.BytesIO()
+    #no name nor date in the header: same bytes for the same content
+    with gzip.GzipFile(filename="", mode="wb", fileobj=buf, compresslevel=GZIP_LEVEL, mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+def CompressionPath(pathRoot):
+    return os.path.join(pathRoot, "data", "cache", "compression.json")
+
+def LoadIncompressible(pathRoot):
+    """{relative path: [size, mtime, suffixes]} of the files whose variants
+    were not smaller, empty if missing, unreadable or outdated"""
+    try:
+        with open(CompressionPath(pathRoot)) as f:
+            state = json.load(f)
+        if state.get("version") == COMPRESSION_VERSION: return state["incompressible"]
+    except (IOError, OSError, ValueError):
+        pass
+    return {}
+
+def SaveIncompressible(pathRoot, incompressible):
+    path = CompressionPath(pathRoot)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path + ".tmp", "w") as f:
+        json.dump({"version": COMPRESSION_VERSION, "incompressible": incompressible}, f, indent=1, sort_keys=True)
+    ReplaceFile(path + ".tmp", path)
+
+def CompressFile(path, encodings=None, skipped=()):
+    """writes the variants of path that are missing or outdated; suffixes in
+    skipped (known not to be smaller for this version of the file) are not
+    tried again
+    returns the written variant paths and the suffixes whose variant is not
+    smaller than the file"""
+    if encodings is None: encodings = Encodings()
+    stat = os.stat(path)
+    written = []
+    incompressible = []
+    data = None
+    for suffix in encodings:
+        pathOut = path + suffix
+        if suffix in skipped:
+            incompressible.append(suffix)
+            continue
+        if os.path.exists(pathOut) and os.stat(pathOut).st_mtime == stat.st_mtime: continue
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        compressed = Compress(data, suffix)
+        if len(compressed) >= len(data):
+            if os.path.exists(pathOut): os.remove(pathOut)
+            incompressible.append(suffix)
+            continue
+        with open(pathOut + ".tmp", "wb") as f:
+            f.write(compressed)
+        ReplaceFile(pathOut + ".tmp", pathOut)
+        os.utime(pathOut, (stat.st_atime, stat.st_mtime))
+        written.append(pathOut)
+    return written, incompressible
+
+def CompressibleFiles(pathRoot):
+    """files under pathRoot that get compressed variants; variants whose
+    source no longer exists are removed"""
+    paths = []
+    for folder, dirs, files in os.walk(pathRoot):
+        if os.path.relpath(folder, pathRoot) == "data":
+            dirs[:] = [d for d in dirs if d not in SKIPPED_DATA]
+            files = [f for f in files if f not in SKIPPED_DATA]
+        for name in files:
+            path = os.path.join(folder, name)
+            base, ext = os.path.splitext(name)
+            if ext in (".gz", ".br") and os.path.splitext(base)[1].lower() in COMPRESSED_EXTENSIONS:
+                if base not in files: os.remove(path)
+                continue
+            if ext.lower() not in COMPRESSED_EXTENSIONS: continue
+            if os.path.getsize(path) >= MIN_SIZE: paths.append(path)
+    return paths
+
+def CompressTree(pathRoot, workers=None, useBrotli=True):
+    """writes the compressed variants of the catalogue files (workers=1: in
+    the current thread, None: one per core)
+    returns the written variant paths"""
+    encodings = Encodings(useBrotli)
+    paths = CompressibleFiles(pathRoot)
+    # Variants known not to be smaller, while the file is unchanged
+    known = LoadIncompressible(pathRoot)
+    tasks = []
+    for path in paths:
+        rel = os.path.relpath(path, pathRoot).replace(os.sep, "/")
+        stat = os.stat(path)
+        entry = known.get(rel)
+        skipped = entry[2] if entry and entry[:2] == [stat.st_size, stat.st_mtime] else []
+        tasks.append((path, rel, [stat.st_size, stat.st_mtime], skipped))
+    if workers is None: workers = getattr(os, "cpu_count", lambda: 1)() or 1
+    if ThreadPoolExecutor is None or workers <= 1:
+        results = [CompressFile(task[0], encodings, task[3]) for task in tasks]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda task: CompressFile(task[0], encodings, task[3]), tasks))
+    incompressible = {}
+    for (path, rel, stat, skipped), (written, suffixes) in zip(tasks, results):
+        if suffixes: incompressible[rel] = stat + [suffixes]
+    if incompressible != known: SaveIncompressible(pathRoot, incompressible)
+    return [path for written, suffixes in results for path in written]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompressed variants of the catalogue files")
+    parser.add_argument("catalogue", help="catalogue folder (web root)")
+    parser.add_argument("--workers", type=int, default=None, help="compression threads (default: all cores)")
+    parser.add_argument("--no-brotli", dest="brotli", action="store_false")
+    args = parser.parse_args(argv)
+    written = CompressTree(args.catalogue, args.workers, args.brotli)
+    print("{} compressed files written ({})".format(len(written), ", ".join(Encodings(args.brotli))))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,276 @@
+"""Catalogue processing core, independent of Rhino.
+Pure Python (runs in IronPython 2.7 for the Rhino command and in CPython for
+the headless batch exporter).
+
+The per-object pipeline (metadata, normals, Poisson mesh, voxel downsample,
+minimal bounding box, export) is written against GeometryBackend; the
+geometry work is done by an adapter:
+- RhinoBackend: Rhino document objects, Cockroach commands (CatalogueExporter)
+- LocalBackend: point cloud files, NumPy/open3d (CatalogueBatch)
+ExportCatalogue runs the pipeline over the objects and maintains the
+catalogue data: DataTree (CatalogueTree), incremental cache (CatalogueCache),
+database.csv (CatalogueStore) and its manifest (CatalogueManifest)."""
+
+import datetime
+import getpass
+import math
+
+import CatalogueCache as cacheTools
+import CatalogueManifest as manifestTools
+import CatalogueStore as storeTools
+import CatalogueTree as treeTools
+from GeometryTools import SymmetricEigen3
+
+# Processing parameters, the cache key of the exported artifacts
+DEFAULT_PARAMS = {
+    "downsample": 0,
+    "normalsNeighbours": 30,
+    "normalsOrientation": "propagate",
+    "poisonMaxDepth": 6,
+    "poisonMinDepth": 0,
+    "poisonScale": 1.1,
+    "poissonLinear": False,
+    "poissonAutoDepth": False, # depth from the point spacing of every object
+    "poissonResolution": 2.0, # auto depth: target octree cell, in point spacings
+    "meshTargetFaces": [50000], # decimated meshes for the viewer, one layer each
+    "voxelSize": 0.002,
+    "voxelSelection": "first",
+    "voxelPyramid": [], # extra voxel sizes, one layer each
+    "hullReduction": True,
+    "minBBoxAlgorithm": "sampling",
+    "minBBoxPcaSeed": False,
+    "octreeBudget": 20000,
+}
+
+# Layers of an exported object
+OBJECT_SUFFIX = ["PointCloud", "Mesh", "PointCloud_Downsampled", "MinBBox"]
+
+# Auto Poisson depth: sampled points, depth range
+SPACING_SAMPLE = 2000
+AUTO_DEPTH_MIN = 4
+AUTO_DEPTH_MAX = 12
+
+def PyramidSuffix(voxelSize):
+    #layer of an extra downsample level, e.g. PointCloud_Downsampled_0.008
+    return "PointCloud_Downsampled_{:g}".format(voxelSize)
+
+def DecimatedSuffix(targetFaces, level):
+    #layer of a decimated mesh: Mesh_Decimated (loaded by the viewer), then
+    #e.g. Mesh_Decimated_200000
+    if level == 0: return "Mesh_Decimated"
+    return "Mesh_Decimated_{}".format(targetFaces)
+
+class GeometryBackend(object):
+    """geometry operations of the pipeline; a source is whatever identifies
+    an input point cloud for the backend (document object id, file path),
+    a cloud/mesh/box the backend's own handle on the geometry"""
+
+    def DataHash(self, source):
+        """content hash of the source points (cache key)"""
+        raise NotImplementedError
+
+    def ObjectId(self, source, label, cloud=None):
+        """physicalObjectId of the source, None if it is only known once
+        the cloud is loaded"""
+        raise NotImplementedError
+
+    def LoadCloud(self, source):
+        raise NotImplementedError
+
+    def Metadata(self, cloud):
+        """per-object statistics read from the geometry itself, in one pass:
+        {"pointCount", "boundingBox": [min, max], "hasColors", "hasNormals",
+        "memoryBytes"}"""
+        raise NotImplementedError
+
+    def EstimateNormals(self, cloud, physicalObjectId, params, dataHash=None):
+        """returns the cloud with normals, computed once for the later
+        stages (meshing, downsampling, export); dataHash: DataHash of the
+        source if already known"""
+        raise NotImplementedError
+
+    def PointSpacing(self, cloud, params):
+        """median distance of sampled points (about SPACING_SAMPLE) to their
+        nearest neighbour"""
+        raise NotImplementedError
+
+    def PoissonMesh(self, cloud, physicalObjectId, params):
+        """returns the mesh, None if it could not be computed"""
+        raise NotImplementedError
+
+    def MeshProperties(self, mesh):
+        """{"volume", "area", "centroid", "inertia" (3x3 about the centroid,
+        unit density), "watertight"}"""
+        raise NotImplementedError
+
+    def DecimateMesh(self, mesh, physicalObjectId, targetFaces, params):
+        """returns one decimated mesh per target face count, the full mesh
+        is left unchanged (download artifact)"""
+        raise NotImplementedError
+
+    def VoxelDownsample(self, cloud, physicalObjectId, voxelSizes, params):
+        """returns one downsampled cloud per voxel size"""
+        raise NotImplementedError
+
+    def MinBBox(self, cloud, physicalObjectId, params):
+        """returns (box, volume)"""
+        raise NotImplementedError
+
+    def Export(self, pathWebRoot, physicalObjectId, layers, params):
+        """exports the layers [(suffix, geometry or None)] of an object,
+        returns the written files, relative to pathWebRoot"""
+        raise NotImplementedError
+
+def DataTreeRows(strDataTreeBranch, tree=None):
+    """parent/child rows of the DataTree branch, and the parent of the items
+    tree: catalogue tree the branch is added to (checks name conflicts)"""
+    if tree is None: tree = treeTools.CatalogueTree()
+    parentItem = tree.AddPath(strDataTreeBranch)
+    return tree.Rows([parentItem]), parentItem
+
+def PoissonDepth(spacing, boundingBox, params):
+    """octree depth whose cells (bounding box * poisonScale / 2^depth) are
+    about poissonResolution point spacings, poisonMaxDepth without auto
+    depth or spacing"""
+    if not params["poissonAutoDepth"] or not spacing or boundingBox is None:
+        return params["poisonMaxDepth"]
+    extent = max(boundingBox[1][i] - boundingBox[0][i] for i in range(3)) * params["poisonScale"]
+    cells = extent / (params["poissonResolution"] * spacing)
+    if cells <= 1: return AUTO_DEPTH_MIN
+    return max(AUTO_DEPTH_MIN, min(AUTO_DEPTH_MAX, int(math.ceil(math.log(cells, 2)))))
+
+def ShapeDescriptors(meshProperties):
+    """sphericity (area of the sphere of same volume / area), elongation and
+    flatness (intermediate / long and short / intermediate axes of the
+    ellipsoid of same inertia); None unless the mesh is watertight"""
+    shape = {"sphericity": None, "elongation": None, "flatness": None}
+    if meshProperties is None or not meshProperties["watertight"]: return shape
+    volume, area = meshProperties["volume"], meshProperties["area"]
+    if volume <= 0 or area <= 0: return shape
+    shape["sphericity"] = math.pi ** (1.0 / 3) * (6 * volume) ** (2.0 / 3) / area
+    #solid ellipsoid: I_k = volume / 5 * (sum of the other two squared axes)
+    moments = SymmetricEigen3(meshProperties["inertia"])[0]
+    axes = sorted([max(0.0, 5.0 / (2 * volume) * (sum(moments) - 2 * m)) ** 0.5 for m in moments], reverse=True)
+    if axes[0] > 0: shape["elongation"] = axes[1] / axes[0]
+    if axes[1] > 0: shape["flatness"] = axes[2] / axes[1]
+    return shape
+
+def ProcessObject(backend, source, physicalObjectId, label, pathWebRoot, params, dataHash=None):
+    """runs the pipeline on one object (dataHash: DataHash of the source)
+    returns its CSV row (parent not set), the exported files and the
+    metadata of the point cloud"""
+    cloud = backend.LoadCloud(source)
+    if physicalObjectId is None:
+        physicalObjectId = backend.ObjectId(source, label, cloud)
+
+    # Original point cloud info
+    metadata = backend.Metadata(cloud)
+    pcNbOfPoints = metadata["pointCount"]
+
+    # Normals, shared by the next stages
+    cloud = backend.EstimateNormals(cloud, physicalObjectId, params, dataHash)
+
+    # Mesh Poisson, at a depth fitted to the point density in auto mode
+    if params["poissonAutoDepth"]:
+        metadata["pointSpacing"] = backend.PointSpacing(cloud, params)
+    depth = PoissonDepth(metadata.get("pointSpacing"), metadata["boundingBox"], params)
+    meshParams = dict(params)
+    meshParams["poisonMaxDepth"] = depth
+    meshParams["poisonMinDepth"] = min(params["poisonMinDepth"], depth)
+    mesh = backend.PoissonMesh(cloud, physicalObjectId, meshParams)
+
+    # Mesh properties and shape, from the mesh arrays/object in one pass
+    meshProperties = None
+    meshVolume = 0
+    if mesh is not None:
+        meshProperties = backend.MeshProperties(mesh)
+        meshVolume = meshProperties["volume"]
+        metadata["mesh"] = meshProperties
+    shape = ShapeDescriptors(meshProperties)
+
+    # Light meshes for the web viewer
+    targetFaces = list(params["meshTargetFaces"])
+    meshesDecimated = [None] * len(targetFaces)
+    if mesh is not None and targetFaces:
+        meshesDecimated = backend.DecimateMesh(mesh, physicalObjectId, targetFaces, params)
+
+    # Point cloud voxel downsample, and the levels of the pyramid
+    voxelSizes = [params["voxelSize"]] + list(params["voxelPyramid"])
+    cloudsDownsampled = backend.VoxelDownsample(cloud, physicalObjectId, voxelSizes, params)
+
+    # Minimal BBox computation
+    box, minBBoxVol = backend.MinBBox(cloud, physicalObjectId, params)
+
+    # Exports
+    layers = list(zip(OBJECT_SUFFIX, [cloud, mesh, cloudsDownsampled[0], box]))
+    for i in range(1, len(voxelSizes)):
+        layers.append((PyramidSuffix(voxelSizes[i]), cloudsDownsampled[i]))
+    for i in range(len(targetFaces)):
+        layers.append((DecimatedSuffix(targetFaces[i], i), meshesDecimated[i]))
+    artifacts = backend.Export(pathWebRoot, physicalObjectId, layers, params)
+
+    date_time = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+    row = [physicalObjectId, None, label, pcNbOfPoints, minBBoxVol, meshVolume, date_time, getpass.getuser(), depth,
+        meshProperties["area"] if meshProperties else None, meshProperties["watertight"] if meshProperties else None,
+        shape["sphericity"], shape["elongation"], shape["flatness"]]
+    return row, artifacts, metadata
+
+def _ProcessTask(task):
+    #module-level for process pools
+    return ProcessObject(*task)
+
+def ExportCatalogue(backend, sources, pathWebRoot, params=None, strDataTreeBranch="", labels=None, mapper=map, log=None):
+    """processes the sources and writes the catalogue data; objects whose
+    points and parameters are unchanged are skipped
+    mapper: map-like function running the per-object work (e.g. the map of
+    a process pool), results must come in input order
+    returns the CSV rows of the objects"""
+    allParams = dict(DEFAULT_PARAMS)
+    allParams.update(params or {})
+    if labels is None: labels = [""] * len(sources)
+
+    #rows are journaled as soon as they are known, committed at the end
+    store = storeTools.CatalogueStore(pathWebRoot)
+    csvRowsDataTree, parentItem = DataTreeRows(strDataTreeBranch, treeTools.CatalogueTree.FromRows(store.Rows()))
+    cache = cacheTools.LoadCache(pathWebRoot)
+    keyIndex = cacheTools.KeyIndex(cache)
+    store.UpsertMany(csvRowsDataTree)
+    #branches whose manifest shards change: the export branch, the previous
+    #branches of the objects, the rows of an interrupted run
+    touched = set([parentItem]) | store.replayedParents
+
+    #sources are hashed once: cache keys, and normals cache of the backend
+    hashes = list(mapper(backend.DataHash, sources))
+    keys = [cacheTools.CacheKey(h, allParams) for h in hashes]
+    csvObjectRows = [None] * len(sources)
+    tasks = []
+    todo = []
+    for i in range(len(sources)):
+        physicalObjectId = backend.ObjectId(sources[i], labels[i])
+        cachedRow = cacheTools.CachedRow(
+            cache, pathWebRoot, physicalObjectId or keyIndex.get(keys[i]), keys[i])
+        if cachedRow is not None:
+            if log: log(cachedRow[0] + " is up to date, skipped")
+            if cachedRow[0] in store: touched.add(store.Get(cachedRow[0])[1])
+            cachedRow[1] = parentItem
+            csvObjectRows[i] = cachedRow
+            store.Upsert(cachedRow)
+            continue
+        tasks.append((backend, sources[i], physicalObjectId, labels[i], pathWebRoot, allParams, hashes[i]))
+        todo.append(i)
+
+    for i, (row, artifacts, metadata) in zip(todo, mapper(_ProcessTask, tasks)):
+        cacheTools.UpdateCache(cache, row[0], keys[i], artifacts, row, metadata)
+        if row[0] in store: touched.add(store.Get(row[0])[1])
+        row[1] = parentItem
+        csvObjectRows[i] = row
+        store.Upsert(row)
+
+    store.Commit()
+    #prebuilt tree and manifest for the front end, items included
+    tree = treeTools.CatalogueTree.FromRows(store.Rows())
+    tree.WriteJson(treeTools.TreePath(pathWebRoot))
+    manifestTools.WriteManifest(manifestTools.ManifestPath(pathWebRoot), manifestTools.BuildManifest(store.Rows(), tree))
+    manifestTools.UpdateShards(pathWebRoot, store.Rows(), tree, touched)
+    cacheTools.SaveCache(pathWebRoot, cache)
+    return csvObjectRows
@@ -1,20 +1,13 @@
 import os
-from distutils.dir_util import copy_tree
-import System
-import System.Collections.Generic.IEnumerable as IEnumerable
-import math
-import time
-import uuid
 import Rhino
 import scriptcontext as sc
 import rhinoscriptsyntax as rs
-import MinimumBoundingBox as MinBBox
 import FolderSelect as fs
-import DictTools as dt
-import csv
-import datetime
-import getpass
-import random
+import CatalogueAssets as assets
+import CatalogueCompression as compression
+import CatalogueCore as core
+import CatalogueTree as treeTools
+from RhinoBackend import RhinoBackend
 
 __commandname__ = "CatalogueExporter"
 
@@ -48,7 +41,16 @@ def RunCommand(is_interactive):
         poisonMinDepth = 0
         poisonScale = 1.1
         poissonLinear = [False]
+        poissonAutoDepth = False
+        poissonResolution = 2.0
+        meshTargetFaces = [50000]
         voxelSize = 0.002
+        voxelPyramid = []
+        hullReduction = True
+        minBBoxAlgorithm = sc.sticky.get("MinBBAlgorithm", "sampling") # last choice
+        if (minBBoxAlgorithm not in ("sampling", "hullface")):
+            minBBoxAlgorithm = "sampling"
+        minBBoxPcaSeed = False
 
         specifyParameters = rs.GetBoolean(
             message = "Do you want to specify processing parameters or accept defaults?",
@@ -107,6 +109,28 @@ def RunCommand(is_interactive):
             )[0]
             if (poissonLinear == None):
                 return 1
+            poissonAutoDepth = rs.GetBoolean(
+                message = "PoissonDepth: fixed (PoisonMaxDepth) or fitted to the point spacing of every object",
+                items = [("PoissonDepth", "Fixed", "Auto")],
+                defaults = [poissonAutoDepth],
+            )
+            if (poissonAutoDepth == None):
+                return 1
+            poissonAutoDepth = poissonAutoDepth[0]
+            if (poissonAutoDepth):
+                poissonResolution = rs.GetReal(
+                    message = "PoissonResolution: mesh cell size, in point spacings",
+                    number = poissonResolution,
+                )
+                if (poissonResolution == None):
+                    return 1
+            strMeshTargetFaces = rs.GetString(
+                message = "MeshTargetFaces: face counts of the decimated meshes, space separated (e.g. '50000 200000'), the first one is shown in the viewer",
+                defaultString = " ".join(str(faces) for faces in meshTargetFaces)
+            )
+            if (strMeshTargetFaces == None):
+                return 1
+            meshTargetFaces = [int(faces) for faces in strMeshTargetFaces.split()]
     
             # Get params :voxel downsample
             Rhino.RhinoApp.WriteLine(
@@ -117,6 +141,45 @@ def RunCommand(is_interactive):
             )
             if (voxelSize == None):
                 return 1
+            strVoxelPyramid = rs.GetString(
+                message = "VoxelPyramid: extra voxel sizes, space separated (e.g. '0.008 0.032'), one layer each",
+                defaultString = ""
+            )
+            if (strVoxelPyramid == None):
+                return 1
+            voxelPyramid = [float(size) for size in strVoxelPyramid.split()]
+    
+            # Get params: minimal bbox
+            Rhino.RhinoApp.WriteLine(
+                "Set parameters for the 'Minimal bounding box' operation")
+            hullReduction = rs.GetBoolean(
+                message = "HullReduction",
+                items = [("HullReduction", "False", "True")],
+                defaults = [hullReduction],
+            )
+            if (hullReduction == None):
+                return 1
+            hullReduction = hullReduction[0]
+            hullFaceMinBBox = rs.GetBoolean(
+                message = "MinBBoxAlgorithm",
+                items = [("MinBBoxAlgorithm", "Sampling", "HullFace")],
+                defaults = [minBBoxAlgorithm == "hullface"],
+            )
+            if (hullFaceMinBBox == None):
+                return 1
+            if (hullFaceMinBBox[0]):
+                minBBoxAlgorithm = "hullface"
+            else:
+                minBBoxAlgorithm = "sampling"
+            sc.sticky["MinBBAlgorithm"] = minBBoxAlgorithm
+            minBBoxPcaSeed = rs.GetBoolean(
+                message = "MinBBoxSeed",
+                items = [("MinBBoxSeed", "WorldXY", "PrincipalAxes")],
+                defaults = [minBBoxPcaSeed],
+            )
+            if (minBBoxPcaSeed == None):
+                return 1
+            minBBoxPcaSeed = minBBoxPcaSeed[0]
         
         # Get manual DataTree Branch
         strDataTreeBranch = rs.GetString(
@@ -126,22 +189,39 @@ def RunCommand(is_interactive):
         if (strDataTreeBranch == None):
             return 1
         
-        # Prepare CSV
-        if (strDataTreeBranch == ""):
-            arrDataTreePath = ["","root"]
-        else:
-            arrDataTreePath = ("root." + strDataTreeBranch).split(".")
-        csvRowsDataTree = [["root", ""]]
-        for i in range(len(arrDataTreePath) - 1):
-            csvRowsDataTree.append([arrDataTreePath[i+1], arrDataTreePath[i]])
-            
-        parentItem = arrDataTreePath[-1]
-        csvObjectRows = []
+        # Precompressed (.gz/.br) variants for static hosting
+        precompress = rs.GetBoolean(
+            message = "Write precompressed copies of the catalogue files for static hosting?",
+            items = [("Precompress", "No", "Yes")],
+            defaults = [False]
+        )
+        if (precompress == None):
+            return 1
         
-        # Copy static files to the catalogue dir
+        # Parameters the exported artifacts depend on (cache key)
+        processingParams = {
+            "downsample": downsample,
+            "normalsNeighbours": normalsNeighbours,
+            "poisonMaxDepth": poisonMaxDepth,
+            "poisonMinDepth": poisonMinDepth,
+            "poisonScale": poisonScale,
+            "poissonLinear": poissonLinear,
+            "poissonAutoDepth": poissonAutoDepth,
+            "poissonResolution": poissonResolution,
+            "meshTargetFaces": meshTargetFaces,
+            "voxelSize": voxelSize,
+            "voxelPyramid": voxelPyramid,
+            "hullReduction": hullReduction,
+            "minBBoxAlgorithm": minBBoxAlgorithm,
+            "minBBoxPcaSeed": minBBoxPcaSeed,
+            "octreeBudget": 0, # no octree without NumPy
+        }
+        
+        # Sync static files to the catalogue dir, unchanged files are skipped
         pathCatalogueExporter = os.path.dirname(os.path.realpath(__file__)) + "\\"
         pathWebRoot = pathToExportCatalogue
-        copy_tree(pathCatalogueExporter + "static", pathToExportCatalogue)
+        synced = assets.SyncStatic(pathCatalogueExporter + "static", pathWebRoot)
+        Rhino.RhinoApp.WriteLine("Static files: {} copied, {} unchanged".format(synced["copied"] + synced["linked"], synced["skipped"]))
         
         labels = []
 
@@ -165,195 +245,28 @@ def RunCommand(is_interactive):
                 labels.append("")
         
         # Point cloud 1-by-1 processing and exporting
-        counter = -1
-        for idPC in idListPC:
-            counter += 1
-
-            # Generate and set physicalObjectId to point cloud
-            objPC = doc.Objects.FindId(idPC)
-            physicalObjectId = objPC.Attributes.GetUserString("physicalObjectId")
-            if (physicalObjectId == None):
-                if (labels[counter] != ""):
-                    physicalObjectId = labels[counter] + "_" + str(uuid.uuid4())
-                else:
-                    physicalObjectId = str(uuid.uuid4())
-                objPC.Attributes.SetUserString("physicalObjectId", physicalObjectId)
-            
-            # Original point cloud info
-            doc.Objects.UnselectAll()
-            doc.Objects.Select(idPC)
-            Rhino.RhinoApp.RunScript("Cockroach_Properties", True)
-            pcNbOfPoints = Rhino.RhinoApp.CommandHistoryWindowText.splitlines()[-4][28:]
-            
-            # Mesh Poisson
-            objMostRecent = doc.Objects.MostRecentObject()
-            doc.Objects.UnselectAll()
-            doc.Objects.Select(idPC)
-            Rhino.RhinoApp.RunScript(
-                "Cockroach_MeshPoisson"
-                + " Downsample="
-                + str(downsample)
-                + " NormalsNeighbours="
-                + str(normalsNeighbours)
-                + " PoisonMaxDepth="
-                + str(poisonMaxDepth)
-                + " PoisonMinDepth="
-                + str(poisonMinDepth)
-                + " PoisonScale="
-                + str(poisonScale)
-                + " PoisonLinear="
-                + str(poissonLinear)
-                + " -Enter"
-                + " -Enter"
-                + " -Cancel", True
-            )
-            objListLastCreated = doc.Objects.AllObjectsSince(
-                objMostRecent.RuntimeSerialNumber)
-            objmesh = None
-            meshVolume = 0
-            for item in objListLastCreated:
-                if(item.ObjectType != Rhino.DocObjects.ObjectType.Mesh):
-                    doc.Objects.Delete(item, True)
-                else:
-                    item.Attributes.SetUserString("physicalObjectId", physicalObjectId)
-                    objMesh = item
-                    meshVolume = item.Geometry.Volume()
-                    
-            # Point cloud voxel downsample
-            doc.Objects.UnselectAll()
-            doc.Objects.Select(idPC)
-            Rhino.RhinoApp.RunScript(
-                "Cockroach_VoxelDownsample"
-                + " VoxelSize="
-                + str(voxelSize)
-                + " -Enter", True
-            )
-            objPCDownsampled = doc.Objects.MostRecentObject()
-            objPCDownsampled.Attributes.SetUserString(
-                "physicalObjectId", physicalObjectId)
-
-            # Minimal BBox computation
-            minBBoxVol = MinBBox.CombinedMinBB([idPC])
-            objMinBBox = doc.Objects.MostRecentObject()
-            objMinBBox.Attributes.SetUserString(
-                "physicalObjectId", physicalObjectId)
-
-            # Arrange in layers
-            objectSuffix = [
-                "PointCloud",
-                "Mesh",
-                "PointCloud_Downsampled",
-                "MinBBox"
-            ]
-            idList = [
-                idPC,
-                objMesh.Id,
-                objPCDownsampled.Id,
-                objMinBBox.Id
-            ]
-            for i in range(len(idList)):
-                newLayer = Rhino.DocObjects.Layer()
-                newLayer.Name = objectSuffix[i]
-                doc.Layers.Add(newLayer)
-                obj = doc.Objects.Find(idList[i])
-                obj.Attributes.LayerIndex = doc.Layers.FindName(
-                    objectSuffix[i]).Index
-                obj.CommitChanges()
-
-        # Exports
-
-            # Geometries export
-            path3dm = pathWebRoot + "data\\3dm\\"
-            if(not os.path.exists(path3dm)):
-                os.makedirs(path3dm)
-
-            for i in range(len(idList)):
-                doc.Objects.UnselectAll()
-                doc.Objects.Select(idList[i])
-                Rhino.RhinoApp.RunScript(
-                    "-Export \"" + path3dm
-                    + physicalObjectId
-                    + "_" + objectSuffix[i]
-                    + ".3dm\" -Enter", True)
-
-            # Iris export
-            pathIris = pathWebRoot + "data\\iris\\"
-            pathIrisData = pathIris + "data\\"
-            if(not os.path.exists(pathIrisData)):
-                os.makedirs(pathIrisData)
-
-            doc.Objects.UnselectAll()
-            doc.Objects.Select.Overloads[IEnumerable[System.Guid]](
-                [idPC, objMesh.Id, objPCDownsampled.Id, objMinBBox.Id])
-            pathIrisDataJson = pathIrisData + physicalObjectId + ".json"
-            Rhino.RhinoApp.RunScript(
-                "-Export \"" + pathIrisDataJson + "\" -Enter", True)
-
-            irisJson = ""
-            with open(pathIrisDataJson) as f:
-                irisJson = f.read()
-            os.remove(pathIrisDataJson)
-            irisJs = "var irisdata = " + irisJson
-            with open(pathIrisData + physicalObjectId + ".js", "w") as f:
-                f.write(irisJs)
-
-            irisHtml = ""
-            with open(pathCatalogueExporter + "iris\\templates\\" + "templateUi.html") as f:
-                irisHtml = f.read()
-            irisHtml = irisHtml.replace("physicalObjectId", physicalObjectId)
-            with open(pathIris + physicalObjectId + ".html", "w") as f:
-                f.write(irisHtml)
-            
-            now = datetime.datetime.now()
-            date_time = now.strftime("%Y-%m-%dT%H:%M:%SZ")
-            
-            # Build CSV row      ["item",           "parent",  "label",         "original_point_cloud_count", "minimal_bounding_box_volume", "mesh_volume", "date_created", "user"            ]
-            csvObjectRows.append([physicalObjectId, parentItem, labels[counter], pcNbOfPoints               ,  minBBoxVol                  ,  meshVolume  ,  date_time,      getpass.getuser()])
-        
-        # Write CSV
-        csv_header = ["item", "parent", "label", "original_point_cloud_count", "minimal_bounding_box_volume", "mesh_volume", "date_created", "user"]
-        
-        fullCsvDataTree = [csv_header] + csvRowsDataTree + csvObjectRows
-        
-        csvOldRows = []
         try:
-            with open(pathWebRoot + "data\\database.csv", "r") as csv_file:
-                csv_reader = csv.reader(csv_file)
-                for row in csv_reader:
-                    csvOldRows.append(row)
-        except:
-            pass
-            
-        with open(pathWebRoot + "data\\database.csv", "wb") as csv_file:
-            if (len(csvOldRows) > 0):
-                for rowO in csvOldRows:
-                    appendOld = True
-                    for rowN in  fullCsvDataTree:
-                        if (rowO[0] == rowN[0]):
-                            appendOld = False
-                    if (appendOld):
-                        fullCsvDataTree.append(rowO)
-            
-            
-#            for newRow in fullCsvDataTree:
-#                for i in range(len(csvOldRows)):
-#                    if (newRow[0] == csvOldRows[i][0]):
-#                        csvOldRows.pop(i)
-#                csvOldRows.append(newRow)
-            
-            csv_writer = csv.writer(csv_file)
-            for row in fullCsvDataTree:
-                csv_writer.writerow(row)
+            core.ExportCatalogue(
+                RhinoBackend(doc), idListPC, pathWebRoot, processingParams,
+                strDataTreeBranch, labels, log = Rhino.RhinoApp.WriteLine)
+        except treeTools.DataTreeConflict as e:
+            # e.g. a DataTree name already used under another branch
+            Rhino.RhinoApp.WriteLine("Export failed: {}".format(e))
+            return 3
+        if (precompress[0]):
+            written = compression.CompressTree(pathWebRoot, workers = 1)
+            Rhino.RhinoApp.WriteLine("{} precompressed files written".format(len(written)))
         
         return 0
 
-    catalogueProcessing()
+    return catalogueProcessing()
 
     # you can optionally return a value from this function
     # to signify command result. Return values that make
     # sense are
     #   0 == success
     #   1 == cancel
+    #   3 == failure
     # If this function does not return a value, success is assumed
     
 
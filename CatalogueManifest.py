@@ -0,0 +1,217 @@
+"""Precomputed catalogue manifest for the Catalogue Explorer (data/manifest.json),
+written next to database.csv by every export.
+Pure Python (used by the Rhino command and the headless batch exporter).
+
+Object rows are stored column by column, in DataTree order (depth first), so
+that filters are array slices instead of full scans of the CSV:
+- "items": physicalObjectIds, "columns": one array per CSV column (numbers
+  and booleans parsed, null for missing values)
+- "branches": [start, stop) range of the items of every branch, descendants
+  included
+- "sorted": per numeric column, item positions by increasing value (missing
+  values left out): a range filter is a binary search, then a slice
+- "histograms": per numeric column, HISTOGRAM_BINS counts between min and max
+See static/manifest.js for the queries.
+
+For very large collections the same data is also sharded by branch
+(data/manifest/): every branch has pages of PAGE_SIZE of its own items
+(columns and sorted positions), and a small root index (index.json) maps
+every branch to its parent, item counts and shard files, with the global
+histograms. The front end only fetches the shards of the visible branches.
+An export only rewrites the shards of the branches it touched, and only the
+pages whose content changed (content hash kept in the index)."""
+
+import hashlib
+import json
+import os
+import re
+
+from CatalogueCache import ReplaceFile
+from CatalogueStore import CSV_HEADER
+
+MANIFEST_VERSION = 1
+HISTOGRAM_BINS = 32
+#items per shard page
+PAGE_SIZE = 1000
+
+NUMERIC_COLUMNS = ["original_point_cloud_count", "minimal_bounding_box_volume", "mesh_volume", "poisson_depth",
+    "surface_area", "sphericity", "elongation", "flatness"]
+BOOLEAN_COLUMNS = ["watertight"]
+
+def ParseNumber(value):
+    #CSV strings or numbers, None for missing values
+    if value is None or value == "": return
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return
+    if value != value or value in (float("inf"), float("-inf")): return
+    if value == int(value) and abs(value) < 2 ** 53: return int(value)
+    return value
+
+def ParseBoolean(value):
+    if value is None or value == "": return
+    if isinstance(value, bool): return value
+    return str(value).lower() in ("true", "1")
+
+def Histogram(values, bins=HISTOGRAM_BINS):
+    """{"min", "max", "counts"} of the values (None left out), bins of equal
+    width between min and max"""
+    values = [v for v in values if v is not None]
+    if not values: return {"min": None, "max": None, "counts": []}
+    lo, hi = min(values), max(values)
+    counts = [0] * bins
+    width = float(hi - lo) / bins
+    for v in values:
+        i = int((v - lo) / width) if width > 0 else 0
+        counts[min(i, bins - 1)] += 1
+    return {"min": lo, "max": hi, "counts": counts}
+
+def SortedIndex(values):
+    #positions of the values by increasing value, None left out
+    return sorted((i for i in range(len(values)) if values[i] is not None), key=lambda i: values[i])
+
+def BuildManifest(rows, tree, header=CSV_HEADER):
+    """manifest dict of the database.csv rows; tree: CatalogueTree of the
+    rows (items are its nodes that have a row with object columns)"""
+    objectRows = dict((row[0], row) for row in rows if len(row) > 2)
+    # Items in depth first order: every branch is a contiguous range
+    items = []
+    branches = {}
+    stack = [(tree.root, False)]
+    while stack:
+        node, done = stack.pop()
+        name = node["name"]
+        if done:
+            branches[name][1] = len(items)
+            continue
+        if name in objectRows and not node["children"]:
+            items.append(name)
+            continue
+        branches[name] = [len(items), None]
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(node["children"]))
+
+    columns = Columns(items, objectRows, header)
+    return {
+        "version": MANIFEST_VERSION,
+        "count": len(items),
+        "items": items,
+        "columns": columns,
+        "branches": branches,
+        "sorted": dict((c, SortedIndex(columns[c])) for c in NUMERIC_COLUMNS if c in columns),
+        "histograms": dict((c, Histogram(columns[c])) for c in NUMERIC_COLUMNS if c in columns),
+    }
+
+def Columns(items, objectRows, header=CSV_HEADER):
+    """{column: values} of the items, numbers and booleans parsed"""
+    columns = {}
+    for k in range(1, len(header)):
+        column = header[k]
+        values = [objectRows[item][k] if k < len(objectRows[item]) else None for item in items]
+        if column in NUMERIC_COLUMNS: values = [ParseNumber(v) for v in values]
+        elif column in BOOLEAN_COLUMNS: values = [ParseBoolean(v) for v in values]
+        else: values = [v if v not in (None, "") else None for v in values]
+        columns[column] = values
+    return columns
+
+def WriteManifest(path, manifest):
+    #compact and atomic, like database.csv
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    ReplaceFile(path + ".tmp", path)
+
+def ManifestPath(pathWebRoot):
+    return os.path.join(pathWebRoot, "data", "manifest.json")
+
+def ShardsPath(pathWebRoot):
+    return os.path.join(pathWebRoot, "data", "manifest")
+
+def ShardName(branch, page):
+    """shard file of a branch page, e.g. Batch42_0.json (names that are not
+    file safe get a hash suffix)"""
+    safe = re.sub(r"[^A-Za-z0-9_\-]", "_", branch)
+    if safe != branch: safe += "_" + hashlib.sha1(branch.encode("utf-8")).hexdigest()[:8]
+    return "{}_{}.json".format(safe, page)
+
+def BuildShard(branch, page, items, objectRows, header=CSV_HEADER):
+    columns = Columns(items, objectRows, header)
+    return {
+        "version": MANIFEST_VERSION,
+        "branch": branch,
+        "page": page,
+        "items": items,
+        "columns": columns,
+        "sorted": dict((c, SortedIndex(columns[c])) for c in NUMERIC_COLUMNS if c in columns),
+    }
+
+def LoadShardIndex(pathWebRoot):
+    """root index of the shards, None if missing, unreadable or outdated"""
+    try:
+        with open(os.path.join(ShardsPath(pathWebRoot), "index.json")) as f:
+            index = json.load(f)
+        if index.get("version") == MANIFEST_VERSION and index.get("pageSize") == PAGE_SIZE: return index
+    except (IOError, OSError, ValueError):
+        pass
+
+def UpdateShards(pathWebRoot, rows, tree, touched=None, header=CSV_HEADER):
+    """writes the shards of the touched branches (all branches if touched is
+    None or there is no valid index yet) and the root index
+    returns the names of the shard files written"""
+    pathShards = ShardsPath(pathWebRoot)
+    if not os.path.exists(pathShards): os.makedirs(pathShards)
+    objectRows = dict((row[0], row) for row in rows if len(row) > 2)
+    index = LoadShardIndex(pathWebRoot)
+    previous = index["branches"] if index else {}
+    if index is None: touched = None
+
+    branches = {}
+    totals = {}
+    written = []
+    # Children after parents: totals are summed bottom-up
+    order = tree.Rows()
+    for name, parent in order:
+        node = tree.Node(name)
+        if name in objectRows and not node["children"]: continue
+        items = [child["name"] for child in node["children"] if child["name"] in objectRows and not child["children"]]
+        entry = {"parent": parent, "items": len(items), "shards": [], "hashes": []}
+        old = previous.get(name)
+        if touched is not None and name not in touched and old is not None and old["items"] == len(items):
+            entry["shards"], entry["hashes"] = old["shards"], old["hashes"]
+        else:
+            for page in range(0, (len(items) + PAGE_SIZE - 1) // PAGE_SIZE):
+                shard = BuildShard(name, page, items[page * PAGE_SIZE:(page + 1) * PAGE_SIZE], objectRows, header)
+                fileName = ShardName(name, page)
+                digest = hashlib.sha1(json.dumps(shard, sort_keys=True).encode("utf-8")).hexdigest()
+                #unchanged pages are not rewritten
+                if (old is None or fileName not in old["shards"] or old["hashes"][old["shards"].index(fileName)] != digest
+                        or not os.path.exists(os.path.join(pathShards, fileName))):
+                    WriteManifest(os.path.join(pathShards, fileName), shard)
+                    written.append(fileName)
+                entry["shards"].append(fileName)
+                entry["hashes"].append(digest)
+            #pages beyond the new last page
+            for fileName in (old["shards"] if old else []):
+                if fileName not in entry["shards"] and os.path.exists(os.path.join(pathShards, fileName)):
+                    os.remove(os.path.join(pathShards, fileName))
+        branches[name] = entry
+        totals[name] = len(items)
+    for name, parent in reversed(order):
+        if parent in totals and name in totals: totals[parent] += totals[name]
+    for name in branches: branches[name]["total"] = totals[name]
+    #shards of branches that no longer exist
+    for name in previous:
+        if name in branches: continue
+        for fileName in previous[name]["shards"]:
+            if os.path.exists(os.path.join(pathShards, fileName)): os.remove(os.path.join(pathShards, fileName))
+
+    columns = Columns(list(objectRows), objectRows, header)
+    WriteManifest(os.path.join(pathShards, "index.json"), {
+        "version": MANIFEST_VERSION,
+        "pageSize": PAGE_SIZE,
+        "count": len(objectRows),
+        "root": tree.root["name"],
+        "branches": branches,
+        "histograms": dict((c, Histogram(columns[c])) for c in NUMERIC_COLUMNS if c in columns),
+    })
+    return written
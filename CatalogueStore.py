@@ -0,0 +1,98 @@
+"""Catalogue metadata store behind data/database.csv.
+Pure Python (used by the Rhino command and the headless batch exporter).
+
+- rows are indexed by item (first column) in an ordered dict: O(1) lookup
+  and upsert, a new row replaces the previous row of the same item in place
+- every upsert is appended to data/database.journal (one JSON row per line)
+  and flushed, so rows of an interrupted run are replayed at next opening
+- Commit() writes database.csv to a temporary file and renames it over the
+  previous one (atomic), then clears the journal
+
+database.csv keeps the layout read by the Catalogue Explorer front end."""
+
+import csv
+import json
+import os
+import sys
+from collections import OrderedDict
+
+from CatalogueCache import ReplaceFile
+
+CSV_HEADER = ["item", "parent", "label", "original_point_cloud_count", "minimal_bounding_box_volume", "mesh_volume", "date_created", "user", "poisson_depth",
+    "surface_area", "watertight", "sphericity", "elongation", "flatness"]
+
+def _OpenCsv(path, mode):
+    #csv module needs binary files in Python 2 and newline="" in Python 3
+    if sys.version_info[0] < 3: return open(path, mode + "b")
+    return open(path, mode, newline="")
+
+class CatalogueStore(object):
+
+    def __init__(self, pathWebRoot, header=CSV_HEADER):
+        self.pathData = os.path.join(pathWebRoot, "data")
+        self.pathCsv = os.path.join(self.pathData, "database.csv")
+        self.pathJournal = os.path.join(self.pathData, "database.journal")
+        self.header = list(header)
+        self.rows = OrderedDict()
+        if os.path.exists(self.pathCsv):
+            with _OpenCsv(self.pathCsv, "r") as csv_file:
+                for row in csv.reader(csv_file):
+                    if row and row[0] != self.header[0]: self.rows[row[0]] = row
+        #replay rows of a run that did not commit
+        #replayedParents: parents of the replayed rows, old and new (their
+        #manifest shards are outdated)
+        self.replayedParents = set()
+        if os.path.exists(self.pathJournal):
+            with open(self.pathJournal) as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        break #truncated last line
+                    if row[0] in self.rows: self.replayedParents.add(self.rows[row[0]][1])
+                    if len(row) > 1: self.replayedParents.add(row[1])
+                    self.rows[row[0]] = row
+        self.journal = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, item):
+        return item in self.rows
+
+    def Get(self, item):
+        return self.rows.get(item)
+
+    def Rows(self):
+        return list(self.rows.values())
+
+    def Upsert(self, row):
+        self.UpsertMany([row])
+
+    def UpsertMany(self, rows):
+        if self.journal is None:
+            if not os.path.exists(self.pathData): os.makedirs(self.pathData)
+            self.journal = open(self.pathJournal, "a")
+        for row in rows:
+            row = list(row)
+            self.rows[row[0]] = row
+            self.journal.write(json.dumps(row) + "\n")
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def Commit(self):
+        """writes database.csv atomically and clears the journal"""
+        if not os.path.exists(self.pathData): os.makedirs(self.pathData)
+        pathTmp = self.pathCsv + ".tmp"
+        with _OpenCsv(pathTmp, "w") as csv_file:
+            csv_writer = csv.writer(csv_file)
+            csv_writer.writerow(self.header)
+            for row in self.rows.values():
+                csv_writer.writerow(row)
+            csv_file.flush()
+            os.fsync(csv_file.fileno())
+        ReplaceFile(pathTmp, self.pathCsv)
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if os.path.exists(self.pathJournal): os.remove(self.pathJournal)
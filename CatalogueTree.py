@@ -0,0 +1,144 @@
+"""Catalogue DataTree: the hierarchy of branches (e.g. Stones.Basalt.Batch42)
+and items of database.csv, with a name-to-node hash index.
+Pure Python (used by the Rhino command and the headless batch exporter).
+
+- names are unique in the catalogue (they are the item column of
+  database.csv): every node is indexed by name, child lookup is O(1)
+- inserting a path walks it once from the root, existing branches are reused,
+  a name already used under another parent raises DataTreeConflict
+- serialises to the parent/child rows of database.csv and to the nested
+  {"name", "children"} JSON (data/tree.json) loaded by the front end instead
+  of rebuilding the tree from the CSV"""
+
+import json
+import os
+
+from CatalogueCache import ReplaceFile
+
+ROOT = "root"
+
+class DataTreeConflict(ValueError):
+    """a DataTree name already used under another parent"""
+
+class CatalogueTree(object):
+
+    def __init__(self, root=ROOT):
+        self.root = {"name": root, "children": []}
+        self.nodes = {root: self.root}
+        self.parents = {root: ""}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, name):
+        return name in self.nodes
+
+    def Node(self, name):
+        return self.nodes.get(name)
+
+    def Child(self, parent, name):
+        """child node of parent named name, None if there is none"""
+        if self.parents.get(name) != parent: return
+        return self.nodes[name]
+
+    def Add(self, name, parent):
+        """adds (or returns the existing) node name under parent"""
+        if parent not in self.nodes: raise KeyError("unknown DataTree parent: {}".format(parent))
+        node = self.nodes.get(name)
+        if node is not None:
+            if self.parents[name] != parent:
+                raise DataTreeConflict("DataTree name {} is already used under {}".format(name, self.parents[name]))
+            return node
+        node = {"name": name, "children": []}
+        self.nodes[name] = node
+        self.parents[name] = parent
+        self.nodes[parent]["children"].append(node)
+        return node
+
+    def AddPath(self, path):
+        """adds a branch path ("Stones.Basalt.Batch42" or a list of names,
+        below the root), returns the name of its last node"""
+        if not isinstance(path, list): path = [name for name in path.split(".") if name]
+        parent = self.root["name"]
+        for name in path:
+            self.Add(name, parent)
+            parent = name
+        return parent
+
+    def AddPaths(self, paths):
+        """batch insertion, returns the last node name of every path"""
+        return [self.AddPath(path) for path in paths]
+
+    def Path(self, name):
+        """names from the root to name"""
+        path = []
+        while name:
+            path.append(name)
+            name = self.parents[name]
+        return path[::-1]
+
+    def Rows(self, names=None):
+        """parent/child rows [name, parent], parents first (all the nodes,
+        or the nodes of names and their ancestors)"""
+        if names is not None:
+            ordered = []
+            seen = set()
+            for name in names:
+                for n in self.Path(name):
+                    if n not in seen:
+                        seen.add(n)
+                        ordered.append(n)
+            return [[n, self.parents[n]] for n in ordered]
+        rows = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            rows.append([node["name"], self.parents[node["name"]]])
+            stack.extend(reversed(node["children"]))
+        return rows
+
+    def ToDict(self):
+        """nested {"name", "children"} dicts (shared, not copied)"""
+        return self.root
+
+    def WriteJson(self, path):
+        #atomic, like database.csv
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.root, f, separators=(",", ":"))
+        ReplaceFile(path + ".tmp", path)
+
+    @classmethod
+    def FromRows(cls, rows, root=ROOT):
+        """tree of rows [name, parent, ...] in any order (database.csv rows);
+        rows whose parent is missing are attached to the root"""
+        tree = cls(root)
+        pending = {}
+        rowNames = set()
+        for row in rows:
+            name, parent = row[0], row[1] or root
+            if name == root: continue
+            pending.setdefault(parent, []).append(name)
+            rowNames.add(name)
+        #breadth first from the root: parents are always added first
+        queue = [root]
+        i = 0
+        while True:
+            while i < len(queue):
+                parent = queue[i]
+                i += 1
+                for name in pending.pop(parent, []):
+                    if name in tree.nodes: continue
+                    tree.Add(name, parent)
+                    queue.append(name)
+            if not pending: break
+            #rows of an unknown parent: attached to the root, with their subtrees
+            missing = [parent for parent in pending if parent not in rowNames] or list(pending) #cycles
+            names = pending.pop(missing[0])
+            for name in names:
+                if name in tree.nodes: continue
+                tree.Add(name, root)
+                queue.append(name)
+        return tree
+
+def TreePath(pathWebRoot):
+    return os.path.join(pathWebRoot, "data", "tree.json")
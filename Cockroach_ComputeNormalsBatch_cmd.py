@@ -3,6 +3,9 @@ import Rhino
 
 __commandname__ = "Cockroach_ComputeNormalsBatch"
 
+# Outside Rhino, PointCloudNormals.py computes the normals of point cloud
+# files in parallel (k-d tree, batched eigen-decompositions)
+
 def RunCommand(is_interactive):
 
     pcGUIDList = rs.GetObjects(
@@ -10,12 +13,19 @@ def RunCommand(is_interactive):
         filter = 2, # Point cloud
         preselect = True
     )
+    if (pcGUIDList == None):
+        return 1
 
     normalsNeighbours = rs.GetReal(
         message = "NormalsNeighbours"
     )
+    if (normalsNeighbours == None):
+        return 1
 
     for pcGUID in pcGUIDList:
+        # One cloud selected at a time, not the clouds of previous iterations
+        rs.UnselectAllObjects()
         rs.SelectObject(pcGUID)
         rs.Command("Cockroach_ComputePointCloudNormals NormalsNeighbours " + str(normalsNeighbours) + " Enter")
-        print(str(pcGUID) + " normals computed")
\ No newline at end of file
+        print(str(pcGUID) + " normals computed")
+    rs.UnselectAllObjects()
@@ -2,9 +2,23 @@ import rhinoscriptsyntax as rs
 import scriptcontext as sc
 import Rhino
 import scriptcontext
+import time
 
 __commandname__ = "Cockroach_MeshPoissonBatch"
 
+# Cockroach meshes one cloud at a time in Rhino. Outside Rhino,
+# PoissonBatch.py meshes point cloud files in parallel worker processes.
+# Meshes are tagged with their cloud and parameters: re-running the batch
+# after a cancellation (Esc) skips the clouds already meshed.
+
+def MeshedClouds(doc, paramsKey):
+    """ids of the point clouds already meshed with paramsKey"""
+    meshed = set()
+    for obj in doc.Objects.FindByObjectType(Rhino.DocObjects.ObjectType.Mesh):
+        if obj.Attributes.GetUserString("poissonParams") == paramsKey:
+            meshed.add(obj.Attributes.GetUserString("poissonSource"))
+    return meshed
+
 def RunCommand(is_interactive):
 
     doc = sc.doc.ActiveDoc
@@ -46,32 +60,65 @@ def RunCommand(is_interactive):
             message="PoissonLinear",
             items = [("PoissonLinear", "False", "True")],
             defaults = [False],
-        )[0]
-        
-        for pcGUID in pcGUIDList:
-            objMostRecent = doc.Objects.MostRecentObject()
+        )
+        if None in (downsample, normalsNeighbours, poisonMaxDepth, poisonMinDepth, poisonScale, poissonLinear):
+            return 1
+        poissonLinear = poissonLinear[0]
+
+        strParams = (" Downsample=" + str(downsample)
+            + " NormalsNeighbours=" + str(normalsNeighbours)
+            + " PoisonMaxDepth=" + str(poisonMaxDepth)
+            + " PoisonMinDepth=" + str(poisonMinDepth)
+            + " PoisonScale=" + str(poisonScale)
+            + " PoisonLinear=" + str(poissonLinear))
+        meshed = MeshedClouds(doc, strParams)
+
+        total = len(pcGUIDList)
+        Rhino.UI.StatusBar.ShowProgressMeter(0, total, "Poisson meshing (Esc to cancel)", True, True)
+        try:
+            for i, pcGUID in enumerate(pcGUIDList):
+                if sc.escape_test(False):
+                    Rhino.RhinoApp.WriteLine("Poisson batch cancelled, {}/{} clouds meshed".format(i, total))
+                    return 1
+                Rhino.UI.StatusBar.UpdateProgressMeter(i, True)
+                if str(pcGUID) in meshed:
+                    Rhino.RhinoApp.WriteLine("[{}/{}] {} already meshed".format(i + 1, total, pcGUID))
+                    continue
+
+                t = time.time()
+                objMostRecent = doc.Objects.MostRecentObject()
+                doc.Objects.UnselectAll()
+                doc.Objects.Select(pcGUID)
+                Rhino.RhinoApp.RunScript(
+                    "Cockroach_MeshPoisson"
+                    + strParams
+                    + " -Enter"
+                    + " -Enter"
+                    + " -Cancel", True
+                )
+                objListLastCreated = doc.Objects.AllObjectsSince(
+                    objMostRecent.RuntimeSerialNumber)
+                meshes = []
+                for item in objListLastCreated:
+                    if(item.ObjectType != Rhino.DocObjects.ObjectType.Mesh):
+                        doc.Objects.Delete(item, True)
+                    else:
+                        meshes.append(item)
+
+                # Tag the meshes for resuming, report the object
+                strStats = ""
+                for item in meshes:
+                    item.Attributes.SetUserString("poissonSource", str(pcGUID))
+                    item.Attributes.SetUserString("poissonParams", strParams)
+                    item.CommitChanges()
+                    mesh = item.Geometry
+                    strStats += " | {} vertices | {} faces".format(mesh.Vertices.Count, mesh.Faces.Count)
+                    if mesh.IsClosed:
+                        strStats += " | volume {}".format(Rhino.Geometry.VolumeMassProperties.Compute(mesh).Volume)
+                if not meshes: strStats = " | no mesh"
+                Rhino.RhinoApp.WriteLine("[{}/{}] {} {:.1f}s{}".format(i + 1, total, pcGUID, time.time() - t, strStats))
+                Rhino.RhinoApp.Wait()
+        finally:
+            Rhino.UI.StatusBar.HideProgressMeter()
             doc.Objects.UnselectAll()
-            doc.Objects.Select(pcGUID)
-            Rhino.RhinoApp.RunScript(
-                "Cockroach_MeshPoisson"
-                + " Downsample="
-                + str(downsample)
-                + " NormalsNeighbours="
-                + str(normalsNeighbours)
-                + " PoisonMaxDepth="
-                + str(poisonMaxDepth)
-                + " PoisonMinDepth="
-                + str(poisonMinDepth)
-                + " PoisonScale="
-                + str(poisonScale)
-                + " PoisonLinear="
-                + str(poissonLinear)
-                + " -Enter"
-                + " -Enter"
-                + " -Cancel", True
-            )
-            objListLastCreated = doc.Objects.AllObjectsSince(
-                objMostRecent.RuntimeSerialNumber)
-            for item in objListLastCreated:
-                if(item.ObjectType != Rhino.DocObjects.ObjectType.Mesh):
-                    doc.Objects.Delete(item, True)
+            doc.Views.Redraw()
@@ -1,14 +1,20 @@
 
 
 
+# Nested {"name", "children"} trees: see CatalogueTree (name index, O(1)
+# child lookup, batch insertion of DataTree paths, CSV/JSON serialisation)
+
 def recurDictConstruct(children, items):
-    if (len(items) > 0):
+    # chain of items under children[0], one pass (items is emptied)
+    top = children
+    for name in items:
         children.append({
-            "name": items.pop(0),
+            "name": name,
             "children": []
         })
-        recurDictConstruct(children[0]["children"], items)
-    return children
+        children = children[0]["children"]
+    del items[:]
+    return top
 
 ## recurDictConstruct example
 #db = {
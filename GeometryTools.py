@@ -0,0 +1,356 @@
+"""Pure Python geometry helpers shared by the Rhino commands and the headless
+modules (no Rhino, no NumPy: runs in IronPython 2.7 and CPython).
+Points are (x,y) or (x,y,z) tuples/lists, results are point indices.
+
+- ConvexHull2D: Andrew's monotone chain
+- ConvexHull3D: quickhull, used to reduce point clouds to their hull
+  vertices before the minimum bounding box search (the minimum box only
+  depends on the convex hull)"""
+
+from __future__ import division
+
+#2D cross product of vectors oa and ob
+def _Cross2D(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+def ConvexHull2D(pts):
+    """returns the indices of the convex hull vertices, counter-clockwise
+    collinear points on the hull edges are dropped"""
+    order = sorted(range(len(pts)), key=lambda i: (pts[i][0], pts[i][1]))
+    if len(order) < 3: return order
+    lower = []
+    for i in order:
+        while len(lower) >= 2 and _Cross2D(pts[lower[-2]], pts[lower[-1]], pts[i]) <= 0:
+            lower.pop()
+        lower.append(i)
+    upper = []
+    for i in reversed(order):
+        while len(upper) >= 2 and _Cross2D(pts[upper[-2]], pts[upper[-1]], pts[i]) <= 0:
+            upper.pop()
+        upper.append(i)
+    return lower[:-1] + upper[:-1]
+
+def _HullFace(pts, a, b, c):
+    #face record: [a, b, c, normal, offset, outside point indices]
+    pa, pb, pc = pts[a], pts[b], pts[c]
+    ux, uy, uz = pb[0] - pa[0], pb[1] - pa[1], pb[2] - pa[2]
+    vx, vy, vz = pc[0] - pa[0], pc[1] - pa[1], pc[2] - pa[2]
+    nx, ny, nz = uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx
+    length = (nx * nx + ny * ny + nz * nz) ** 0.5
+    if length > 0:
+        nx, ny, nz = nx / length, ny / length, nz / length
+    return [a, b, c, (nx, ny, nz), nx * pa[0] + ny * pa[1] + nz * pa[2], []]
+
+def _FaceDist(face, p):
+    n = face[3]
+    return n[0] * p[0] + n[1] * p[1] + n[2] * p[2] - face[4]
+
+def _InitialSimplex(pts, eps):
+    """returns 4 point indices spanning a non-degenerate tetrahedron,
+    or None if all points are (nearly) coplanar"""
+    n = len(pts)
+    #extreme points along the axis of largest extent
+    best = None
+    for k in range(3):
+        i_min = min(range(n), key=lambda i: pts[i][k])
+        i_max = max(range(n), key=lambda i: pts[i][k])
+        ext = pts[i_max][k] - pts[i_min][k]
+        if best is None or ext > best[0]: best = (ext, i_min, i_max)
+    ext, i0, i1 = best
+    if ext <= eps: return
+    p0, p1 = pts[i0], pts[i1]
+    d = (p1[0] - p0[0], p1[1] - p0[1], p1[2] - p0[2])
+    #farthest point from line i0-i1
+    def LineDist(i):
+        p = pts[i]
+        w = (p[0] - p0[0], p[1] - p0[1], p[2] - p0[2])
+        cx, cy, cz = w[1] * d[2] - w[2] * d[1], w[2] * d[0] - w[0] * d[2], w[0] * d[1] - w[1] * d[0]
+        return cx * cx + cy * cy + cz * cz
+    i2 = max(range(n), key=LineDist)
+    if LineDist(i2) ** 0.5 / ext <= eps: return
+    #farthest point from plane i0-i1-i2
+    face = _HullFace(pts, i0, i1, i2)
+    i3 = max(range(n), key=lambda i: abs(_FaceDist(face, pts[i])))
+    if abs(_FaceDist(face, pts[i3])) <= eps: return
+    return i0, i1, i2, i3
+
+def ConvexHull3D(pts, eps=None):
+    """quickhull; returns (vertex indices, faces) where faces are (a,b,c)
+    index triples counter-clockwise seen from outside
+    points within eps of the hull are treated as inside (default eps is
+    relative to the point set size); returns None for (nearly) coplanar sets"""
+    if len(pts) < 4: return
+    if eps is None:
+        scale = max(max(abs(c) for c in p) for p in pts)
+        scale = max(scale, max(max(p[k] for p in pts) - min(p[k] for p in pts) for k in range(3)))
+        eps = 1e-10 * max(scale, 1e-300)
+    simplex = _InitialSimplex(pts, eps)
+    if simplex is None: return
+
+    faces = {}
+    edges = {} #directed edge (a,b) -> id of the face containing it
+    counter = [0]
+    def AddFace(a, b, c):
+        face = _HullFace(pts, a, b, c)
+        fid = counter[0]
+        counter[0] += 1
+        faces[fid] = face
+        edges[(a, b)] = fid
+        edges[(b, c)] = fid
+        edges[(c, a)] = fid
+        return fid
+
+    #initial tetrahedron, faces oriented away from the opposite vertex
+    new_ids = []
+    for k in range(4):
+        a, b, c = [simplex[j] for j in range(4) if j != k]
+        if _FaceDist(_HullFace(pts, a, b, c), pts[simplex[k]]) > 0: a, b = b, a
+        new_ids.append(AddFace(a, b, c))
+    in_simplex = set(simplex)
+    candidates = [i for i in range(len(pts)) if i not in in_simplex]
+
+    pending = []
+    while True:
+        #assign candidate points to the outside set of the first new face
+        #they are in front of; points behind all new faces are inside
+        new_faces = [faces[fid] for fid in new_ids]
+        for i in candidates:
+            p = pts[i]
+            for face in new_faces:
+                n = face[3]
+                if n[0] * p[0] + n[1] * p[1] + n[2] * p[2] - face[4] > eps:
+                    face[5].append(i)
+                    break
+        pending.extend(fid for fid in new_ids if faces[fid][5])
+
+        #next face with a non-empty outside set
+        fid = None
+        while pending:
+            fid = pending.pop()
+            if fid in faces: break
+            fid = None
+        if fid is None: break
+        face = faces[fid]
+        eye = max(face[5], key=lambda i: _FaceDist(face, pts[i]))
+        p_eye = pts[eye]
+
+        #visible faces (breadth first from face) and horizon edges
+        visible = set([fid])
+        queue = [fid]
+        horizon = []
+        while queue:
+            vface = faces[queue.pop()]
+            a, b, c = vface[0], vface[1], vface[2]
+            for e in ((a, b), (b, c), (c, a)):
+                nid = edges.get((e[1], e[0]))
+                if nid in visible: continue
+                if nid is not None and _FaceDist(faces[nid], p_eye) > eps:
+                    visible.add(nid)
+                    queue.append(nid)
+                else:
+                    horizon.append(e)
+
+        #remove visible faces, keep their outside points as candidates
+        candidates = []
+        for vid in visible:
+            vface = faces.pop(vid)
+            a, b, c = vface[0], vface[1], vface[2]
+            for e in ((a, b), (b, c), (c, a)):
+                if edges.get(e) == vid: del edges[e]
+            candidates.extend(i for i in vface[5] if i != eye)
+        #cone of new faces from the horizon to the eye point
+        new_ids = [AddFace(a, b, eye) for a, b in horizon]
+
+    vertices = set()
+    hull_faces = []
+    for face in faces.values():
+        vertices.update(face[:3])
+        hull_faces.append((face[0], face[1], face[2]))
+    return sorted(vertices), hull_faces
+
+def HullVertexIndices(pts, eps=None):
+    """returns the indices of the points needed to compute a bounding box of
+    any orientation: 3D hull vertices, or 2D hull vertices for (x,y) points
+    all indices are returned if the 3D hull is degenerate (coplanar points)"""
+    if len(pts) and len(pts[0]) == 2: return sorted(ConvexHull2D(pts))
+    hull = ConvexHull3D(pts, eps)
+    if hull is None: return list(range(len(pts)))
+    return hull[0]
+
+def HullVolume(pts, eps=None):
+    """volume of the 3D convex hull, 0.0 for (nearly) coplanar sets
+    a lower bound of the volume of any bounding box of pts"""
+    hull = ConvexHull3D(pts, eps)
+    if hull is None: return 0.0
+    verts, faces = hull
+    #tetrahedra from a hull vertex to the faces (counter-clockwise from outside)
+    ox, oy, oz = pts[verts[0]]
+    vol = 0.0
+    for a, b, c in faces:
+        ax, ay, az = pts[a][0] - ox, pts[a][1] - oy, pts[a][2] - oz
+        bx, by, bz = pts[b][0] - ox, pts[b][1] - oy, pts[b][2] - oz
+        cx, cy, cz = pts[c][0] - ox, pts[c][1] - oy, pts[c][2] - oz
+        vol += ax * (by * cz - bz * cy) - ay * (bx * cz - bz * cx) + az * (bx * cy - by * cx)
+    return vol / 6.0
+
+def MinAreaRectangle2D(pts):
+    """minimum area bounding rectangle of 2D points by rotating calipers
+    (exact: one side is collinear with a hull edge)
+    returns (area, (ux,uy), (umin,umax,vmin,vmax)): u is the unit direction
+    of that side, v=(-uy,ux), extents are point coordinates along u and v"""
+    h = [pts[i] for i in ConvexHull2D(pts)]
+    #coincident hull vertices (duplicate input points) give zero-length edges
+    h = [h[i] for i in range(len(h)) if i == 0 or tuple(h[i]) != tuple(h[i - 1])]
+    if len(h) > 1 and tuple(h[-1]) == tuple(h[0]): h.pop()
+    m = len(h)
+    if m < 3:
+        #degenerate: empty, single point or segment
+        ux, uy = 1.0, 0.0
+        if m == 2:
+            dx, dy = h[1][0] - h[0][0], h[1][1] - h[0][1]
+            length = (dx * dx + dy * dy) ** 0.5
+            if length > 0: ux, uy = dx / length, dy / length
+        us = [p[0] * ux + p[1] * uy for p in h] or [0.0]
+        vs = [p[1] * ux - p[0] * uy for p in h] or [0.0]
+        return 0.0, (ux, uy), (min(us), max(us), min(vs), max(vs))
+    best = None
+    j = None
+    for i in range(m):
+        p, q = h[i], h[(i + 1) % m]
+        dx, dy = q[0] - p[0], q[1] - p[1]
+        length = (dx * dx + dy * dy) ** 0.5
+        if length == 0: continue
+        ux, uy = dx / length, dy / length
+        #v points inwards for a counter-clockwise hull
+        du = lambda t: h[t % m][0] * ux + h[t % m][1] * uy
+        dv = lambda t: h[t % m][1] * ux - h[t % m][0] * uy
+        if j is None:
+            j = max(range(m), key=du)
+            k = max(range(m), key=dv)
+            l = min(range(m), key=du)
+        #all calipers rotate counter-clockwise with the edge
+        for step in range(m):
+            if du(j + 1) < du(j): break
+            j = (j + 1) % m
+        for step in range(m):
+            if dv(k + 1) < dv(k): break
+            k = (k + 1) % m
+        for step in range(m):
+            if du(l + 1) > du(l): break
+            l = (l + 1) % m
+        area = (du(j) - du(l)) * (dv(k) - dv(i))
+        if best is None or area < best[0]:
+            best = (area, (ux, uy), (du(l), du(j), dv(i), dv(k)))
+    return best
+
+def MinBoxHullFaces(pts):
+    """minimum volume box with a face flush with a 3D hull face: for every
+    hull face, minimum area rectangle of the hull projected on the face
+    returns (volume, (xaxis, yaxis, zaxis)), None for (nearly) coplanar sets"""
+    hull = ConvexHull3D(pts)
+    if hull is None: return
+    verts, faces = hull
+    hpts = [pts[i] for i in verts]
+    seen = set()
+    best = None
+    for a, b, c in faces:
+        n = _HullFace(pts, a, b, c)[3]
+        key = tuple(round(x, 9) for x in n)
+        if key in seen: continue
+        seen.add(key)
+        #in-plane frame (e1, e2, n), right-handed
+        if abs(n[0]) < 0.9: t = (1.0, 0.0, 0.0)
+        else: t = (0.0, 1.0, 0.0)
+        e1 = (n[1] * t[2] - n[2] * t[1], n[2] * t[0] - n[0] * t[2], n[0] * t[1] - n[1] * t[0])
+        length = (e1[0] ** 2 + e1[1] ** 2 + e1[2] ** 2) ** 0.5
+        e1 = (e1[0] / length, e1[1] / length, e1[2] / length)
+        e2 = (n[1] * e1[2] - n[2] * e1[1], n[2] * e1[0] - n[0] * e1[2], n[0] * e1[1] - n[1] * e1[0])
+        uv = [(p[0] * e1[0] + p[1] * e1[1] + p[2] * e1[2],
+               p[0] * e2[0] + p[1] * e2[1] + p[2] * e2[2]) for p in hpts]
+        heights = [p[0] * n[0] + p[1] * n[1] + p[2] * n[2] for p in hpts]
+        area, (ux, uy), ext = MinAreaRectangle2D(uv)
+        vol = area * (max(heights) - min(heights))
+        if best is None or vol < best[0]:
+            xaxis = tuple(ux * e1[k] + uy * e2[k] for k in range(3))
+            yaxis = tuple(ux * e2[k] - uy * e1[k] for k in range(3))
+            best = (vol, (xaxis, yaxis, n))
+    return best
+
+def SymmetricEigen3(a):
+    """eigen decomposition of a symmetric 3x3 matrix (cyclic Jacobi)
+    returns (eigenvalues, eigenvectors) sorted by decreasing eigenvalue"""
+    a = [list(map(float, row)) for row in a]
+    v = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+    for sweep in range(50):
+        off = a[0][1] ** 2 + a[0][2] ** 2 + a[1][2] ** 2
+        if off <= 1e-30 * (a[0][0] ** 2 + a[1][1] ** 2 + a[2][2] ** 2) or off == 0: break
+        for p, q in ((0, 1), (0, 2), (1, 2)):
+            if a[p][q] == 0: continue
+            theta = (a[q][q] - a[p][p]) / (2.0 * a[p][q])
+            t = (1.0 if theta >= 0 else -1.0) / (abs(theta) + (theta * theta + 1.0) ** 0.5)
+            c = 1.0 / (t * t + 1.0) ** 0.5
+            s = t * c
+            for k in range(3):
+                akp, akq = a[k][p], a[k][q]
+                a[k][p], a[k][q] = c * akp - s * akq, s * akp + c * akq
+            for k in range(3):
+                apk, aqk = a[p][k], a[q][k]
+                a[p][k], a[q][k] = c * apk - s * aqk, s * apk + c * aqk
+            for k in range(3):
+                vkp, vkq = v[k][p], v[k][q]
+                v[k][p], v[k][q] = c * vkp - s * vkq, s * vkp + c * vkq
+    order = sorted(range(3), key=lambda i: -a[i][i])
+    return [a[i][i] for i in order], [tuple(v[k][i] for k in range(3)) for i in order]
+
+def PrincipalAxes(pts):
+    """covariance eigenvectors of 3D points, decreasing variance, returned as
+    a right-handed (xaxis, yaxis, zaxis) frame"""
+    n = len(pts)
+    sx = sy = sz = 0.0
+    for p in pts:
+        sx += p[0]; sy += p[1]; sz += p[2]
+    cx, cy, cz = sx / n, sy / n, sz / n
+    cov = [[0.0] * 3 for i in range(3)]
+    for p in pts:
+        dx, dy, dz = p[0] - cx, p[1] - cy, p[2] - cz
+        cov[0][0] += dx * dx; cov[0][1] += dx * dy; cov[0][2] += dx * dz
+        cov[1][1] += dy * dy; cov[1][2] += dy * dz; cov[2][2] += dz * dz
+    cov[1][0], cov[2][0], cov[2][1] = cov[0][1], cov[0][2], cov[1][2]
+    values, (x, y, z) = SymmetricEigen3(cov)
+    z = (x[1] * y[2] - x[2] * y[1], x[2] * y[0] - x[0] * y[2], x[0] * y[1] - x[1] * y[0])
+    return x, y, z
+
+def SeedFrames(pts, nb_faces=0):
+    """start orientations for the 3D minimum bounding box search: principal
+    axes, plus one frame per largest-area hull face (up to nb_faces) with
+    the face normal as Z axis and the major principal axis projected as X"""
+    x, y, z = PrincipalAxes(pts)
+    frames = [(x, y, z)]
+    if nb_faces <= 0: return frames
+    hull = ConvexHull3D(pts)
+    if hull is None: return frames
+    scored = []
+    for a, b, c in hull[1]:
+        pa, pb, pc = pts[a], pts[b], pts[c]
+        u = (pb[0] - pa[0], pb[1] - pa[1], pb[2] - pa[2])
+        v = (pc[0] - pa[0], pc[1] - pa[1], pc[2] - pa[2])
+        cr = (u[1] * v[2] - u[2] * v[1], u[2] * v[0] - u[0] * v[2], u[0] * v[1] - u[1] * v[0])
+        area = (cr[0] ** 2 + cr[1] ** 2 + cr[2] ** 2) ** 0.5
+        if area > 0: scored.append((area, tuple(k / area for k in cr)))
+    scored.sort(key=lambda f: -f[0])
+    seen = set()
+    for area, n in scored:
+        key = tuple(round(k, 6) for k in n)
+        if key in seen: continue
+        seen.add(key)
+        #major axis projected on the face plane (or second axis if parallel)
+        for t in (x, y):
+            d = t[0] * n[0] + t[1] * n[1] + t[2] * n[2]
+            fx = (t[0] - d * n[0], t[1] - d * n[1], t[2] - d * n[2])
+            length = (fx[0] ** 2 + fx[1] ** 2 + fx[2] ** 2) ** 0.5
+            if length > 1e-6: break
+        fx = (fx[0] / length, fx[1] / length, fx[2] / length)
+        fy = (n[1] * fx[2] - n[2] * fx[1], n[2] * fx[0] - n[0] * fx[2], n[0] * fx[1] - n[1] * fx[0])
+        frames.append((fx, fy, n))
+        if len(frames) > nb_faces: break
+    return frames
@@ -0,0 +1,149 @@
+"""Local geometry backend of the catalogue core: point cloud files processed
+with NumPy (open3d optional), catalogue files written with rhino3dm.
+Headless, used by CatalogueBatch.
+
+A source is a .ply/.xyz/.3dm file path, a cloud a PointCloudIO cloud dict.
+Normals missing from the input are estimated once (PointCloudNormals),
+cached in pathCache, and used by the meshing and the exports."""
+
+import math
+import os
+import uuid
+
+import numpy as np
+
+import CatalogueCache as cacheTools
+import MeshBinary as pcm
+import MeshDecimation as decimation
+import MeshProperties as meshTools
+import MinimumBoundingBoxNp as MinBBoxNp
+import PointCloudBinary as pcb
+import PointCloudIO as pcio
+import PointCloudNormals as normalsTools
+import PointCloudOctree as octree
+import PointCloudVoxel as voxel
+from CatalogueCore import SPACING_SAMPLE, GeometryBackend
+
+#optional: Poisson meshing and normal estimation
+try:
+    import open3d as o3d
+except ImportError:
+    o3d = None
+
+def PoissonMesh(cloud, params):
+    """returns (vertices, faces) arrays, None if open3d is not available
+    poisonMinDepth has no open3d equivalent and is ignored"""
+    if o3d is None: return
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(cloud["points"]))
+    if cloud["normals"] is not None:
+        pcd.normals = o3d.utility.Vector3dVector(cloud["normals"])
+    if params["downsample"] > 0 and len(cloud["points"]) > params["downsample"]:
+        pcd = pcd.uniform_down_sample(int(math.ceil(len(cloud["points"]) / float(params["downsample"]))))
+    if not pcd.has_normals():
+        pcd.estimate_normals(o3d.geometry.KDTreeSearchParamKNN(params["normalsNeighbours"]))
+        pcd.orient_normals_consistent_tangent_plane(params["normalsNeighbours"])
+    mesh, densities = o3d.geometry.TriangleMesh.create_from_point_cloud_poisson(
+        pcd, depth=params["poisonMaxDepth"], scale=params["poisonScale"],
+        linear_fit=bool(params["poissonLinear"]))
+    return np.asarray(mesh.vertices), np.asarray(mesh.triangles)
+
+class LocalBackend(GeometryBackend):
+
+    def __init__(self, pathCache=None):
+        self.pathCache = pathCache
+
+    def DataHash(self, source):
+        return cacheTools.FileHash(source)
+
+    def ObjectId(self, source, label, cloud=None):
+        """physicalObjectId user string of .3dm inputs, otherwise derived from
+        the input path so that re-running a batch keeps the same ids"""
+        if cloud is not None and cloud["physicalObjectId"]: return cloud["physicalObjectId"]
+        #.3dm files may carry their own id, only known once read
+        if cloud is None and os.path.splitext(source)[1].lower() == ".3dm": return
+        objectUuid = str(uuid.uuid5(uuid.NAMESPACE_URL, "file://" + os.path.abspath(source)))
+        if label != "": return label + "_" + objectUuid
+        return objectUuid
+
+    def LoadCloud(self, source):
+        cloud = pcio.ReadPointCloud(source)
+        cloud["source"] = source
+        return cloud
+
+    def Metadata(self, cloud):
+        return pcio.CloudMetadata(cloud)
+
+    def EstimateNormals(self, cloud, physicalObjectId, params, dataHash=None):
+        if cloud["normals"] is not None: return cloud
+        k, orientation = params["normalsNeighbours"], params["normalsOrientation"]
+        if self.pathCache is None:
+            cloud["normals"] = normalsTools.EstimateNormals(cloud["points"], k, orientation)
+        else:
+            if dataHash is None: dataHash = self.DataHash(cloud["source"])
+            cloud["normals"] = normalsTools.CachedNormals(self.pathCache, dataHash, cloud["points"], k, orientation)
+        return cloud
+
+    def PointSpacing(self, cloud, params):
+        return normalsTools.PointSpacing(cloud["points"], SPACING_SAMPLE)
+
+    def PoissonMesh(self, cloud, physicalObjectId, params):
+        return PoissonMesh(cloud, params)
+
+    def MeshProperties(self, mesh):
+        return meshTools.MeshProperties(*mesh)
+
+    def DecimateMesh(self, mesh, physicalObjectId, targetFaces, params):
+        # Coarser levels start from the previous, finer one
+        meshes = {}
+        current = mesh
+        for faces in sorted(targetFaces, reverse=True):
+            current = decimation.DecimateMesh(current[0], current[1], faces)
+            meshes[faces] = current
+        return [meshes[faces] for faces in targetFaces]
+
+    def VoxelDownsample(self, cloud, physicalObjectId, voxelSizes, params):
+        levels = voxel.VoxelPyramid(
+            cloud["points"], voxelSizes, cloud["colors"], cloud["normals"], params["voxelSelection"])
+        return [{"points": points, "colors": colors, "normals": normals, "physicalObjectId": physicalObjectId}
+                for points, colors, normals in levels]
+
+    def MinBBox(self, cloud, physicalObjectId, params):
+        box, minBBoxVol, passes = MinBBoxNp.MinBBPoints(
+            cloud["points"], hull_reduce=params["hullReduction"],
+            algorithm=params["minBBoxAlgorithm"], pca_seed=params["minBBoxPcaSeed"])
+        return box, minBBoxVol
+
+    def Export(self, pathWebRoot, physicalObjectId, layers, params):
+        artifacts = []
+        for suffix, geometry in layers:
+            if geometry is None: continue
+            # Geometries export
+            if isinstance(geometry, dict):
+                rhinoGeometry = pcio.ToRhinoPointCloud(geometry["points"], geometry["colors"])
+            elif suffix == "MinBBox":
+                rhinoGeometry = pcio.ToRhinoBoxMesh(MinBBoxNp.BoxCorners(geometry))
+            else:
+                rhinoGeometry = pcio.ToRhinoMesh(*geometry)
+            name = physicalObjectId + "_" + suffix + ".3dm"
+            pcio.Write3dm(os.path.join(pathWebRoot, "data", "3dm", name), rhinoGeometry, physicalObjectId, suffix)
+            artifacts.append("data/3dm/" + name)
+
+            # Binary meshes for the web viewer
+            if not isinstance(geometry, dict) and suffix != "MinBBox":
+                name = physicalObjectId + "_" + suffix + ".pcm"
+                pcm.WritePcm(os.path.join(pathWebRoot, "data", "pcm", name), *geometry)
+                artifacts.append("data/pcm/" + name)
+            if not isinstance(geometry, dict): continue
+
+            # Binary point clouds for the web viewer
+            name = physicalObjectId + "_" + suffix + ".pcb"
+            pcb.WritePcb(os.path.join(pathWebRoot, "data", "pcb", name),
+                geometry["points"], geometry["colors"], geometry["normals"])
+            artifacts.append("data/pcb/" + name)
+
+            # Level of detail octree of the full cloud, already in memory
+            # with its estimated normals (hierarchy.json is written last)
+            if suffix == "PointCloud" and params["octreeBudget"] > 0:
+                octree.OctreeFromCloud(geometry, octree.OctreePath(pathWebRoot, physicalObjectId), params["octreeBudget"])
+                artifacts.append("data/octree/" + physicalObjectId + "/hierarchy.json")
+        return artifacts
@@ -0,0 +1,90 @@
+"""Compact binary triangle mesh format for the web catalogue (.pcm), the
+mesh counterpart of PointCloudBinary (.pcb).
+Pure Python (runs in IronPython 2.7 for the Rhino command), with a NumPy
+fast path when the inputs are NumPy arrays.
+
+Little-endian layout, every array directly readable with a typed-array view
+in the browser (see static/pcm.js):
+
+    offset  type           content
+    0       char[4]        magic "CEPM"
+    4       uint16         version (1)
+    6       uint16         flags: 1 = uint32 indices (else uint16)
+    8       uint32         vertex count V
+    12      uint32         face count F
+    16      float64[3]     bbox min
+    40      float64[3]     bbox max
+    64      int16[3V]      positions, quantized in the bbox:
+                           p = min + (q + 32768) * (max - min) / 65535
+    ..      padding        to a multiple of 4 bytes
+    ..      uint16[3F]     faces (vertex indices), uint32 if flag 1"""
+
+import array
+import struct
+
+from PointCloudBinary import Bbox, IsArray, LittleEndian, QuantizePositions
+
+#optional: vectorized encoding/decoding of NumPy arrays
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b"CEPM"
+VERSION = 1
+FLAG_UINT32 = 1
+HEADER = struct.Struct("<4sHHII3d3d")
+
+def _Padding(size):
+    return (4 - size % 4) % 4
+
+def EncodePcm(vertices, faces):
+    """returns the .pcm bytes of a mesh; vertices is a (V,3) array or a
+    sequence of (x,y,z), faces a (F,3) array or a sequence of (a,b,c)"""
+    count = len(vertices)
+    flags = FLAG_UINT32 if count > 65535 else 0
+    if count:
+        bbMin, bbMax = Bbox(vertices)
+    else:
+        bbMin, bbMax = [0.0] * 3, [0.0] * 3
+    chunks = [HEADER.pack(MAGIC, VERSION, flags, count, len(faces), *(list(bbMin) + list(bbMax)))]
+    chunks.append(QuantizePositions(vertices, bbMin, bbMax))
+    chunks.append(b"\0" * _Padding(HEADER.size + 6 * count))
+    if IsArray(faces):
+        chunks.append(np.asarray(faces).astype("<u4" if flags & FLAG_UINT32 else "<u2").tobytes())
+    else:
+        typecode = "I" if flags & FLAG_UINT32 else "H"
+        chunks.append(LittleEndian(array.array(typecode, [int(i) for face in faces for i in face])))
+    return b"".join(chunks)
+
+def WritePcm(path, vertices, faces):
+    with open(path, "wb") as f:
+        f.write(EncodePcm(vertices, faces))
+
+def DecodePcm(data):
+    """returns a dict {"vertices", "faces", "bbox"}: NumPy arrays if NumPy
+    is available, else lists of tuples"""
+    magic, version, flags, count, faceCount = HEADER.unpack_from(data, 0)[:5]
+    values = HEADER.unpack_from(data, 0)[5:]
+    if magic != MAGIC: raise ValueError("not a .pcm mesh")
+    if version != VERSION: raise ValueError("unsupported .pcm version {}".format(version))
+    bbMin, bbMax = list(values[:3]), list(values[3:])
+    step = [(bbMax[k] - bbMin[k]) / 65535.0 for k in range(3)]
+    offset = HEADER.size
+    mesh = {"bbox": (bbMin, bbMax)}
+    indexType = "<u4" if flags & FLAG_UINT32 else "<u2"
+    facesOffset = offset + 6 * count + _Padding(offset + 6 * count)
+    if np is not None:
+        q = np.frombuffer(data, dtype="<i2", count=3 * count, offset=offset).reshape(-1, 3)
+        mesh["vertices"] = bbMin + (q + 32768.0) * step
+        mesh["faces"] = np.frombuffer(data, dtype=indexType, count=3 * faceCount, offset=facesOffset).reshape(-1, 3).astype(np.int64)
+        return mesh
+    q = struct.unpack_from("<{}h".format(3 * count), data, offset)
+    mesh["vertices"] = [tuple(bbMin[k] + (q[3 * i + k] + 32768) * step[k] for k in range(3)) for i in range(count)]
+    f = struct.unpack_from("<{}{}".format(3 * faceCount, "I" if flags & FLAG_UINT32 else "H"), data, facesOffset)
+    mesh["faces"] = [f[3 * i:3 * i + 3] for i in range(faceCount)]
+    return mesh
+
+def ReadPcm(path):
+    with open(path, "rb") as f:
+        return DecodePcm(f.read())
@@ -0,0 +1,264 @@
+"""Quadric edge collapse decimation of triangle meshes with NumPy.
+
+Every vertex carries the quadric error of the planes of its faces (area
+weighted; boundary edges add a perpendicular plane so that open borders
+are kept). Collapses are done in passes over all edges at once:
+- every edge gets its optimal position (solved quadric, or the cheapest of
+  its end points and midpoint when the quadric is singular) and cost
+- among the cheapest half of the edges, rounds of independent edges are
+  picked (priority to the cheaper cost buckets, then random): no two
+  collapses of a pass share a face
+- collapses breaking the link condition (non-manifold result) or flipping
+  a face are skipped
+until the target face count is reached. Unused vertices are dropped.
+A pass only recomputes the targets of the edges around the last collapses."""
+
+import numpy as np
+
+BOUNDARY_WEIGHT = 100.0 #boundary planes against the face planes
+FLIP_COS = 0.2 #collapses turning a face normal by more than ~78 degrees are undone
+MATCHING_ROUNDS = 4
+COST_BUCKETS = 16
+CANDIDATE_SHARE = 0.5 #of the edges, cheapest first, collapsed in a pass
+
+def FaceNormals(vertices, faces):
+    """unnormalized normals (twice the face areas)"""
+    tri = vertices[faces]
+    return np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+
+def _PlaneQuadrics(normals, points, weights):
+    #(16,n) quadrics of the planes through points with unit normals
+    planes = np.c_[normals, -(normals * points).sum(axis=1)].T
+    return (planes[:, None, :] * planes[None, :, :]).reshape(16, -1) * weights
+
+def _Accumulate(index, values, count):
+    #(16,count) sums of the (16,n) values by index
+    return np.array([np.bincount(index, weights=v, minlength=count) for v in values])
+
+def _EdgeKeys(faces, count):
+    #undirected edges of the faces, packed a * count + b with a < b
+    e = np.r_[faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]
+    return np.minimum(e[:, 0], e[:, 1]) * count + np.maximum(e[:, 0], e[:, 1]), e
+
+def VertexQuadrics(vertices, faces):
+    """(16,count) quadrics of the vertices (rows: the 4x4 matrix entries,
+    contiguous per entry for the vectorized updates)"""
+    n = FaceNormals(vertices, faces)
+    area2 = np.linalg.norm(n, axis=1)
+    unit = n / np.where(area2 > 0, area2, 1.0)[:, None]
+    faceQ = _PlaneQuadrics(unit, vertices[faces[:, 0]], area2 / 2)
+    q = _Accumulate(faces.T.ravel(), np.tile(faceQ, 3), len(vertices))
+
+    # Boundary edges: plane containing the edge, perpendicular to its face
+    keys, e = _EdgeKeys(faces, len(vertices))
+    unused, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    border = counts[inverse.ravel()] == 1
+    if border.any():
+        a, b = e[border, 0], e[border, 1]
+        direction = vertices[b] - vertices[a]
+        length = np.linalg.norm(direction, axis=1)
+        faceUnit = np.tile(unit, (3, 1))[border]
+        perp = np.cross(direction, faceUnit)
+        perpLen = np.linalg.norm(perp, axis=1)
+        perp /= np.where(perpLen > 0, perpLen, 1.0)[:, None]
+        borderQ = _PlaneQuadrics(perp, vertices[a], BOUNDARY_WEIGHT * length ** 2)
+        q += _Accumulate(np.r_[a, b], np.tile(borderQ, 2), len(vertices))
+    return q
+
+def _Cost(q, points):
+    #h^T Q h with h = (point, 1), Q the (16,n) quadrics
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+    return (q[0] * x * x + q[5] * y * y + q[10] * z * z + q[15]
+        + 2 * (q[1] * x * y + q[2] * x * z + q[6] * y * z
+        + q[3] * x + q[7] * y + q[11] * z))
+
+def _CollapseTargets(vertices, q, a, b):
+    """optimal positions and costs of the edges (a, b)"""
+    qe = q[:, a] + q[:, b]
+    # Solve A p = -c by cofactors (A symmetric 3x3), where well conditioned
+    a00, a01, a02, a11, a12, a22 = qe[0], qe[1], qe[2], qe[5], qe[6], qe[10]
+    c0, c1, c2 = -qe[3], -qe[7], -qe[11]
+    m00 = a11 * a22 - a12 * a12
+    m01 = a02 * a12 - a01 * a22
+    m02 = a01 * a12 - a02 * a11
+    m11 = a00 * a22 - a02 * a02
+    m12 = a01 * a02 - a00 * a12
+    m22 = a00 * a11 - a01 * a01
+    det = a00 * m00 + a01 * m01 + a02 * m02
+    scale = np.abs(a00) + np.abs(a11) + np.abs(a22) + 2 * (np.abs(a01) + np.abs(a02) + np.abs(a12))
+    ok = np.abs(det) > 1e-9 * scale ** 3
+    inv = np.where(ok, 1.0 / np.where(ok, det, 1.0), 0.0)
+    best = np.c_[m00 * c0 + m01 * c1 + m02 * c2, m01 * c0 + m11 * c1 + m12 * c2, m02 * c0 + m12 * c1 + m22 * c2] * inv[:, None]
+
+    # Otherwise (or too far away) the cheapest of the end points and midpoint
+    va, vb = vertices[a], vertices[b]
+    mid = (va + vb) / 2
+    fallback = ~ok | (((best - mid) ** 2).sum(axis=1) > ((vb - va) ** 2).sum(axis=1))
+    best[fallback] = mid[fallback]
+    cost = _Cost(qe, best)
+    f = np.flatnonzero(fallback)
+    for candidate in (va[f], vb[f]):
+        c = _Cost(qe[:, f], candidate)
+        better = c < cost[f]
+        best[f[better]], cost[f[better]] = candidate[better], c[better]
+    return best, cost
+
+def _CleanFaces(faces):
+    #drops degenerate faces and every copy of duplicated faces
+    f = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])]
+    unused, inverse, counts = np.unique(np.sort(f, axis=1), axis=0, return_inverse=True, return_counts=True)
+    return f[counts[inverse.ravel()] == 1]
+
+def _Ring(a, b, vertexSel, count):
+    #(selected edge, neighbour vertex) pairs of the 1-rings of its end points
+    su, sv = vertexSel[a], vertexSel[b]
+    fromA, fromB = su >= 0, sv >= 0
+    return np.r_[su[fromA], sv[fromB]], np.r_[b[fromA], a[fromB]]
+
+def _Independent(a, b, rank, candidates, count):
+    """candidate edges cheapest for their end points, and not adjacent to
+    a cheaper one (two kept edges never share a face)"""
+    big = rank.max() + 1
+    vertexRank = np.full(count, big, dtype=np.int64)
+    np.minimum.at(vertexRank, np.r_[a[candidates], b[candidates]], np.r_[rank[candidates], rank[candidates]])
+    sel = candidates[(vertexRank[a[candidates]] == rank[candidates]) & (vertexRank[b[candidates]] == rank[candidates])]
+    # An end point in the 1-ring of a cheaper edge: a shared face
+    vertexSel = np.full(count, -1, dtype=np.int64)
+    vertexSel[a[sel]] = vertexSel[b[sel]] = np.arange(len(sel))
+    ringSel, ringVertex = _Ring(a, b, vertexSel, count)
+    endRank = np.full(count, big, dtype=np.int64)
+    endRank[a[sel]] = endRank[b[sel]] = rank[sel]
+    lost = np.zeros(len(sel), dtype=bool)
+    lost[ringSel[endRank[ringVertex] < rank[sel][ringSel]]] = True
+    return sel[~lost]
+
+def _LinkCondition(keys, a, b, sel, count):
+    """number of common neighbours of the end points of the selected edges;
+    the collapse keeps the mesh manifold when it equals the faces of the edge"""
+    vertexSel = np.full(count, -1, dtype=np.int64)
+    vertexSel[a[sel]] = np.arange(len(sel))
+    su, sv = vertexSel[a], vertexSel[b]
+    #neighbours w of a[s], w != b[s]
+    s = np.r_[su[su >= 0], sv[sv >= 0]]
+    w = np.r_[b[su >= 0], a[sv >= 0]]
+    keep = w != b[sel][s]
+    s, w = s[keep], w[keep]
+    other = b[sel][s]
+    query = np.minimum(other, w) * count + np.maximum(other, w)
+    pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    return np.bincount(s[keys[pos] == query], minlength=len(sel))
+
+def _Pass(vertices, faces, q, needed, previous=None):
+    """one pass of independent collapses, at most needed of them
+    previous: edge targets of the last pass, reused for the edges whose
+    vertices did not move
+    returns the vertices, faces and quadrics after the pass, the number of
+    collapses and the edge targets"""
+    count = len(vertices)
+    faceKeys, unused = _EdgeKeys(faces, count)
+    keys, edgeFaces = np.unique(faceKeys, return_counts=True)
+    a, b = keys // count, keys % count
+    if previous is None:
+        best, cost = _CollapseTargets(vertices, q, a, b)
+    else:
+        oldKeys, oldBest, oldCost, oldMoved = previous
+        pos = np.minimum(np.searchsorted(oldKeys, keys), len(oldKeys) - 1)
+        best, cost = oldBest[pos], oldCost[pos]
+        dirty = np.flatnonzero(oldMoved[a] | oldMoved[b] | (oldKeys[pos] != keys))
+        best[dirty], cost[dirty] = _CollapseTargets(vertices, q, a[dirty], b[dirty])
+    # Priority: cost bucket, then random (cost varies smoothly on a
+    # surface, strict cost order leaves few local minima)
+    E = len(keys)
+    bounds = np.quantile(cost, np.arange(1, COST_BUCKETS) / float(COST_BUCKETS))
+    bucket = np.searchsorted(bounds, cost, side="right")
+    rank = bucket * E + np.random.default_rng(len(faces)).permutation(E)
+
+    # Rounds of independent edges among the cheap edges not blocked yet
+    blocked = np.zeros(count, dtype=bool)
+    cheap = bucket < max(1, COST_BUCKETS * CANDIDATE_SHARE)
+    selected = []
+    for i in range(MATCHING_ROUNDS):
+        candidates = np.flatnonzero(cheap & ~blocked[a] & ~blocked[b])
+        if not len(candidates): break
+        sel = _Independent(a, b, rank, candidates, count)
+        if not len(sel): break
+        selected.append(sel)
+        vertexSel = np.full(count, -1, dtype=np.int64)
+        vertexSel[a[sel]] = vertexSel[b[sel]] = np.arange(len(sel))
+        blocked[_Ring(a, b, vertexSel, count)[1]] = True
+        blocked[a[sel]] = blocked[b[sel]] = True
+    if not selected: return vertices, faces, q, 0, None
+    selected = np.concatenate(selected)
+    selected = selected[np.argsort(rank[selected])]
+    selected = selected[_LinkCondition(keys, a, b, selected, count) == edgeFaces[selected]][:needed]
+
+    # Undo the collapses flipping a face
+    remap = np.arange(count)
+    remap[b[selected]] = a[selected]
+    newVertices = vertices.copy()
+    newVertices[a[selected]] = best[selected]
+    newFaces = remap[faces]
+    moved = np.zeros(count, dtype=bool)
+    moved[a[selected]] = True
+    kept = (newFaces[:, 0] != newFaces[:, 1]) & (newFaces[:, 1] != newFaces[:, 2]) & (newFaces[:, 2] != newFaces[:, 0])
+    touched = np.flatnonzero(moved[newFaces].any(axis=1) & kept)
+    before = FaceNormals(vertices, faces[touched])
+    after = FaceNormals(newVertices, newFaces[touched])
+    dot = (before * after).sum(axis=1)
+    flipped = dot <= FLIP_COS * np.linalg.norm(before, axis=1) * np.linalg.norm(after, axis=1)
+    if flipped.any():
+        bad = np.zeros(count, dtype=bool)
+        bad[newFaces[touched[flipped]].ravel()] = True
+        undo = bad[a[selected]]
+        newVertices[a[selected[undo]]] = vertices[a[selected[undo]]]
+        selected = selected[~undo]
+        remap = np.arange(count)
+        remap[b[selected]] = a[selected]
+        newFaces = remap[faces]
+        kept = (newFaces[:, 0] != newFaces[:, 1]) & (newFaces[:, 1] != newFaces[:, 2]) & (newFaces[:, 2] != newFaces[:, 0])
+
+    q[:, a[selected]] += q[:, b[selected]]
+    moved = np.zeros(count, dtype=bool)
+    moved[a[selected]] = True
+    return newVertices, newFaces[kept], q, len(selected), (keys, best, cost, moved)
+
+def Compact(vertices, faces):
+    """drops the vertices no face uses"""
+    used = np.zeros(len(vertices), dtype=bool)
+    used[faces.ravel()] = True
+    remap = np.cumsum(used) - 1
+    return vertices[used], remap[faces]
+
+def DecimateMesh(vertices, faces, targetFaces, maxPasses=100):
+    """(vertices, faces) with at most about targetFaces faces"""
+    vertices = np.asarray(vertices, dtype=float)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    if len(faces) <= targetFaces: return vertices, faces
+    q = VertexQuadrics(vertices, faces)
+    faces = _CleanFaces(faces)
+    previous = None
+    for i in range(maxPasses):
+        if len(faces) <= targetFaces: break
+        #an interior collapse removes two faces
+        needed = max(1, (len(faces) - targetFaces + 1) // 2)
+        vertices, faces, q, collapsed, previous = _Pass(vertices, faces, q, needed, previous)
+        if collapsed == 0: break
+    return Compact(vertices, faces)
+
+def Icosphere(subdivisions):
+    """unit sphere mesh, 20 * 4^subdivisions faces"""
+    t = (1 + 5 ** 0.5) / 2
+    vertices = np.array([[-1, t, 0], [1, t, 0], [-1, -t, 0], [1, -t, 0], [0, -1, t], [0, 1, t],
+        [0, -1, -t], [0, 1, -t], [t, 0, -1], [t, 0, 1], [-t, 0, -1], [-t, 0, 1]], dtype=float)
+    faces = np.array([[0, 11, 5], [0, 5, 1], [0, 1, 7], [0, 7, 10], [0, 10, 11], [1, 5, 9], [5, 11, 4],
+        [11, 10, 2], [10, 7, 6], [7, 1, 8], [3, 9, 4], [3, 4, 2], [3, 2, 6], [3, 6, 8], [3, 8, 9],
+        [4, 9, 5], [2, 4, 11], [6, 2, 10], [8, 6, 7], [9, 8, 1]])
+    for i in range(subdivisions):
+        keys, e = _EdgeKeys(faces, len(vertices))
+        unique, inverse = np.unique(keys, return_inverse=True)
+        ends = np.c_[unique // len(vertices), unique % len(vertices)]
+        vertices = np.r_[vertices, vertices[ends].mean(axis=1)]
+        m = len(vertices) - len(unique) + inverse.ravel().reshape(3, -1).T #midpoints of edges 01, 12, 20
+        faces = np.r_[np.c_[faces[:, 0], m[:, 0], m[:, 2]], np.c_[faces[:, 1], m[:, 1], m[:, 0]],
+            np.c_[faces[:, 2], m[:, 2], m[:, 1]], m]
+    return vertices / np.linalg.norm(vertices, axis=1)[:, None], faces
@@ -0,0 +1,56 @@
+"""Mass properties of triangle meshes with NumPy, headless counterpart of
+Rhino's VolumeMassProperties/AreaMassProperties.
+
+One pass over the faces: every face and the origin form a tetrahedron, the
+signed sums of the tetrahedra give the volume, the centroid and the second
+moments of the enclosed solid (exact for closed, consistently oriented
+meshes; inward-facing meshes are handled by the sign of the volume).
+Vertices are first moved to their mean to keep the sums well conditioned."""
+
+import numpy as np
+
+def EdgeCounts(faces):
+    """(undirected edge uses, directed edge uses) per undirected edge"""
+    faces = np.asarray(faces, dtype=np.int64)
+    count = int(faces.max()) + 1 if len(faces) else 0
+    e = np.r_[faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]
+    lo, hi = np.minimum(e[:, 0], e[:, 1]), np.maximum(e[:, 0], e[:, 1])
+    keys, inverse, uses = np.unique(lo * count + hi, return_inverse=True, return_counts=True)
+    forward = np.bincount(inverse.ravel(), weights=e[:, 0] < e[:, 1], minlength=len(keys))
+    return uses, forward
+
+def IsWatertight(faces):
+    """every edge shared by exactly two faces, in opposite directions
+    (closed, manifold and consistently oriented)"""
+    if len(faces) == 0: return False
+    uses, forward = EdgeCounts(faces)
+    return bool(((uses == 2) & (forward == 1)).all())
+
+def MeshProperties(vertices, faces):
+    """{"volume", "area", "centroid", "inertia" (3x3, about the centroid,
+    unit density), "watertight"}"""
+    vertices = np.asarray(vertices, dtype=float)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    origin = vertices.mean(axis=0) if len(vertices) else np.zeros(3)
+    a, b, c = (vertices[faces[:, k]] - origin for k in range(3))
+    cross = np.cross(b - a, c - a)
+    area = float(np.linalg.norm(cross, axis=1).sum() / 2)
+
+    # Tetrahedra (origin, a, b, c): 6 * signed volumes
+    det = np.einsum("ij,ij->i", a, np.cross(b, c))
+    volume = det.sum() / 6
+    s = a + b + c
+    if volume != 0: centroid = (det[:, None] * s).sum(axis=0) / (24 * volume)
+    else: centroid = np.zeros(3)
+    #second moments: integral of x x^T = det / 120 * (s s^T + a a^T + b b^T + c c^T)
+    second = sum(np.dot((p * det[:, None]).T, p) for p in (s, a, b, c))
+    second = second / 120 - volume * np.outer(centroid, centroid)
+    if volume < 0: volume, second = -volume, -second
+    inertia = np.trace(second) * np.eye(3) - second
+    return {
+        "volume": float(volume),
+        "area": area,
+        "centroid": [float(v) for v in centroid + origin],
+        "inertia": [[float(v) for v in row] for row in inertia],
+        "watertight": IsWatertight(faces),
+    }
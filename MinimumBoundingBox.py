@@ -16,12 +16,24 @@ If non planar/coplanar:
 - uses plane from previous check as start point for smaller refinements
 - continues refnement stages until bounding box area no longer decreases. (tol)
 
+Hull face mode (algorithm="hullface"):
+- planar: rotating calipers on the convex hull, no angular sweep (exact)
+- 3D: starts from the best box flush with a convex hull face instead of
+  the octant grid, then runs the same refinement passes (not exact: the
+  minimum box may have no face flush with the hull, e.g. edge-edge contacts)
+
 Script by Mitch Heynick 23.06.18  Release version 1"""
 
 import rhinoscriptsyntax as rs
 import scriptcontext as sc
 import Rhino, math, time
 import Rhino.DocObjects.ObjectType as OT
+import GeometryTools as gt
+
+#octant grids by sample count, shared by all the 3D searches
+_OCTANT_PLANES={}
+#max. relative gap between a seed box and the hull volume to skip the octant grid
+SEED_GAP=0.0001
 
 #get input objects plus settings
 def GetObjectsPlus3Boolean(prompt,b_prompts,b_opts,g_filt=None):
@@ -54,6 +66,14 @@ def GetObjectsPlus3Boolean(prompt,b_prompts,b_opts,g_filt=None):
 def CheckObjCoPlanarity(objs,tol=sc.doc.ModelAbsoluteTolerance):
     #accepts points, pointclouds, curves, surfaces, breps and meshes
     #try to "short-circuit" out if any curve or brep element is not planar
+    #single pointcloud: test its point array directly, no Python list
+    if len(objs)==1 and isinstance(objs[0],Rhino.Geometry.PointCloud):
+        pt_list=objs[0].GetPoints()
+        if pt_list.Length<3: return
+        if Rhino.Geometry.Point3d.ArePointsCoplanar(pt_list,tol):
+            rc, plane = Rhino.Geometry.Plane.FitPlaneToPoints(pt_list)
+            if rc==Rhino.Geometry.PlaneFitResult.Success: return plane
+        return
     pt_list=[]
     for obj in objs:
         if isinstance(obj,Rhino.Geometry.Point3d):
@@ -97,6 +117,37 @@ def CheckObjCoPlanarity(objs,tol=sc.doc.ModelAbsoluteTolerance):
         rc, plane = Rhino.Geometry.Plane.FitPlaneToPoints(pt_list)
         if rc==Rhino.Geometry.PlaneFitResult.Success: return plane
 
+#convex hull pre-reduction (the minimum bounding box only depends on the hull)
+def ReduceToHull(objs,plane=None):
+    """replaces point based objects (points, pointclouds, meshes) by a single
+    pointcloud of their convex hull vertices, other objects pass through
+    if plane is given (planar/coplanar case) the 2D hull in that plane is used
+    returns reduced objects, number of input points, number of kept points"""
+    pt_list=[]
+    out_objs=[]
+    for obj in objs:
+        if isinstance(obj,Rhino.Geometry.Point3d):
+            pt_list.append(obj)
+        elif isinstance(obj,Rhino.Geometry.Point):
+            pt_list.append(obj.Location)
+        elif isinstance(obj,Rhino.Geometry.PointCloud):
+            pt_list.extend(obj.GetPoints())
+        elif isinstance(obj,Rhino.Geometry.Mesh):
+            for vert in obj.Vertices: pt_list.append(Rhino.Geometry.Point3d(vert))
+        else:
+            out_objs.append(obj)
+    if not pt_list: return objs,0,0
+    if plane:
+        uv_list=[]
+        for pt in pt_list:
+            rc,u,v=plane.ClosestParameter(pt)
+            uv_list.append((u,v))
+        indices=gt.HullVertexIndices(uv_list)
+    else:
+        indices=gt.HullVertexIndices([(pt.X,pt.Y,pt.Z) for pt in pt_list])
+    out_objs.append(Rhino.Geometry.PointCloud([pt_list[i] for i in indices]))
+    return out_objs,len(pt_list),len(indices)
+
 #gets a plane-aligned bounding box
 def BoundingBoxPlane(objs,plane,ret_pts=False,accurate=True):
     """returns a plane-aligned bounding box in world coordinates
@@ -161,6 +212,12 @@ def GenerateOctantPlanes(count):
     xyz_planes=RotateCopyPlanes(tot_ang,count,xy_planes,dir_vec)
     return xyz_planes
 
+def OctantPlanes(count):
+    """GenerateOctantPlanes(count), computed once; returns copies (planes
+    are rotated in place by the refinement)"""
+    if count not in _OCTANT_PLANES: _OCTANT_PLANES[count]=GenerateOctantPlanes(count)
+    return [Rhino.Geometry.Plane(plane) for plane in _OCTANT_PLANES[count]]
+
 #used in 3D refinement calculation
 def RotatedPlaneArray(plane,tot_ang,divs,axis):
     """creates an array of planes rotated in increments around an axis
@@ -205,25 +262,15 @@ def MinBBPlane(objs,best_plane,planes,curr_box,curr_vol):
             curr_box=bb
     return best_plane,curr_box,curr_vol
 
-#3D (non-planar) bounding box routine
-def Min3DBoundingBox(objs,init_plane,count,rel_stop,im_rep):
-    #for non-planar or non-coplanar object(s)
-    #get initial fast bb in init plane (World XY), plus volume to compare
-    curr_bb=BoundingBoxPlane(objs,init_plane,False)
-    curr_vol=curr_bb.Volume
-    
-    tot_ang=math.pi*0.5 #90 degrees for intial octant
+#3D refinement passes around a start plane
+def RefineMin3DBoundingBox(objs,best_plane,curr_bb,curr_vol,tot_ang,count,rel_stop,im_rep):
+    """refines with smaller angles (reduced by factor at each pass) around
+    best_plane until the volume no longer decreases significantly
+    returns best plane, bbox, volume and number of passes"""
     factor=0.1 #angle reduction factor for each successive refinement pass
     max_passes=20 #safety factor
     prec=sc.doc.ModelDistanceDisplayPrecision
     us=rs.UnitSystemName(abbreviate=True)
-    
-    #run intitial bb calculation
-    xyz_planes=GenerateOctantPlanes(count)
-    best_plane,curr_bb,curr_vol=MinBBPlane(objs,init_plane,xyz_planes,curr_bb,curr_vol)
-    #report results of intial rough calculation
-#    if im_rep:
-#        print "Initial pass 0, volume: {} {}3".format(round(curr_vol,prec),us)
     #refine with smaller angles around best fit plane, loop until...
     for i in range(max_passes):
         prev_vol=curr_vol
@@ -247,7 +294,125 @@ def Min3DBoundingBox(objs,init_plane,count,rel_stop,im_rep):
 #            print "Refinement aborted after {} passes.".format(i+1)
             break
             
-    return curr_bb,curr_vol,i+1
+    return best_plane,curr_bb,curr_vol,i+1
+
+#start planes for the 3D search (principal axes, largest hull faces)
+def SeedPlanes(objs,nb_faces=0):
+    pt_list=[(pt.X,pt.Y,pt.Z) for pt in ObjectHullPoints(objs)]
+    planes=[]
+    if len(pt_list)<4: return planes
+    for xaxis,yaxis,zaxis in gt.SeedFrames(pt_list,nb_faces):
+        planes.append(Rhino.Geometry.Plane(
+            Rhino.Geometry.Point3d.Origin,
+            Rhino.Geometry.Vector3d(*xaxis),
+            Rhino.Geometry.Vector3d(*yaxis)))
+    return planes
+
+#3D (non-planar) bounding box routine
+def Min3DBoundingBox(objs,init_plane,count,rel_stop,im_rep,seed_planes=None):
+    """seed_planes: optional start planes (see SeedPlanes); the count^3
+    octant pass is skipped only if the best seed box is within SEED_GAP
+    (relative) of the hull volume (lower bound, point based objects), otherwise
+    the seed is refined as well if it beats the refined octant result and
+    the best result is kept (never worse than without seed)"""
+    #for non-planar or non-coplanar object(s)
+    #get initial fast bb in init plane (World XY), plus volume to compare
+    curr_bb=BoundingBoxPlane(objs,init_plane,False)
+    curr_vol=curr_bb.Volume
+    
+    tot_ang=math.pi*0.5 #90 degrees for intial octant
+    prec=sc.doc.ModelDistanceDisplayPrecision
+    us=rs.UnitSystemName(abbreviate=True)
+    
+    best_plane=init_plane
+    seed=None
+    if seed_planes:
+        seed_plane,seed_bb,seed_vol=MinBBPlane(objs,best_plane,seed_planes,curr_bb,curr_vol)
+        #copy, the refinement rotates its start plane in place
+        seed=(Rhino.Geometry.Plane(seed_plane),seed_bb,seed_vol)
+        hull_vol=ObjectHullVolume(objs)
+        if hull_vol>0 and seed_vol-hull_vol<=SEED_GAP*hull_vol:
+            #first refinement pass +/-9 degrees
+            best_plane,curr_bb,curr_vol,passes=RefineMin3DBoundingBox(objs,seed[0],seed_bb,seed_vol,math.pi,count,rel_stop,im_rep)
+            return curr_bb,curr_vol,passes
+    
+    #run intitial bb calculation
+    xyz_planes=OctantPlanes(count)
+    best_plane,curr_bb,curr_vol=MinBBPlane(objs,best_plane,xyz_planes,curr_bb,curr_vol)
+    #report results of intial rough calculation
+#    if im_rep:
+#        print "Initial pass 0, volume: {} {}3".format(round(curr_vol,prec),us)
+    best_plane,curr_bb,curr_vol,passes=RefineMin3DBoundingBox(objs,best_plane,curr_bb,curr_vol,tot_ang,count,rel_stop,im_rep)
+    #seed better than the refined octant result: refined as well, best kept
+    if seed and seed[2]<curr_vol:
+        res=RefineMin3DBoundingBox(objs,seed[0],seed[1],seed[2],math.pi,count,rel_stop,im_rep)
+        if res[2]<curr_vol: best_plane,curr_bb,curr_vol,passes=res
+    return curr_bb,curr_vol,passes
+
+#convex hull volume, lower bound of the bounding box volume (0.0 if unknown)
+def ObjectHullVolume(objs):
+    """only for point based objects: the hull of curve and surface
+    control points may be larger than the object"""
+    for obj in objs:
+        if not isinstance(obj,(Rhino.Geometry.Point3d,Rhino.Geometry.Point,Rhino.Geometry.PointCloud,Rhino.Geometry.Mesh)):
+            return 0.0
+    pt_list=ObjectHullPoints(objs)
+    return gt.HullVolume([(pt.X,pt.Y,pt.Z) for pt in pt_list])
+
+#gathers points whose convex hull contains the objects
+def ObjectHullPoints(objs):
+    """points, pointcloud points and mesh vertices; NURBS control points
+    for curves, surfaces, breps and extrusions (their hull contains the
+    object, used to find candidate orientations only)"""
+    pt_list=[]
+    for obj in objs:
+        if isinstance(obj,Rhino.Geometry.Point3d):
+            pt_list.append(obj)
+        elif isinstance(obj,Rhino.Geometry.Point):
+            pt_list.append(obj.Location)
+        elif isinstance(obj,Rhino.Geometry.PointCloud):
+            pt_list.extend(obj.GetPoints())
+        elif isinstance(obj,Rhino.Geometry.Mesh):
+            for vert in obj.Vertices: pt_list.append(Rhino.Geometry.Point3d(vert))
+        elif isinstance(obj,Rhino.Geometry.Curve):
+            nc=obj.ToNurbsCurve()
+            if nc: pt_list.extend([nc.Points[i].Location for i in xrange(nc.Points.Count)])
+        elif isinstance(obj,Rhino.Geometry.Extrusion):
+            obj=obj.ToBrep()
+            for face in obj.Faces:
+                srf=face.ToNurbsSurface()
+                if srf:
+                    for cp in srf.Points: pt_list.append(cp.Location)
+        elif isinstance(obj,Rhino.Geometry.Brep):
+            for face in obj.Faces:
+                srf=face.ToNurbsSurface()
+                if srf:
+                    for cp in srf.Points: pt_list.append(cp.Location)
+        elif isinstance(obj,Rhino.Geometry.Surface):
+            srf=obj.ToNurbsSurface()
+            if srf:
+                for cp in srf.Points: pt_list.append(cp.Location)
+    return pt_list
+
+#3D (non-planar) bounding box routine, "hullface" mode
+def Min3DBoundingBoxHull(objs,count,rel_stop,im_rep):
+    """starts from the best box with a face flush with a convex hull face
+    (instead of the octant grid), then refines around it"""
+    pt_list=ObjectHullPoints(objs)
+    res=gt.MinBoxHullFaces([(pt.X,pt.Y,pt.Z) for pt in pt_list])
+    wxy_plane=Rhino.Geometry.Plane.WorldXY
+    if res is None: return Min3DBoundingBox(objs,wxy_plane,count,rel_stop,im_rep)
+    vol,axes=res
+    best_plane=Rhino.Geometry.Plane(
+        Rhino.Geometry.Point3d.Origin,
+        Rhino.Geometry.Vector3d(*axes[0]),
+        Rhino.Geometry.Vector3d(*axes[1]))
+    curr_bb=BoundingBoxPlane(objs,best_plane,False)
+    curr_vol=curr_bb.Volume
+    #first refinement pass covers +/-4.5 degrees, same as after the octant grid
+    tot_ang=math.pi*0.5
+    best_plane,curr_bb,curr_vol,passes=RefineMin3DBoundingBox(objs,best_plane,curr_bb,curr_vol,tot_ang,count,rel_stop,im_rep)
+    return curr_bb,curr_vol,passes
 
 #this is the main 2D bb calculation search function
 def PlanarMinBB(objs,plane,tot_ang,divs):
@@ -307,11 +472,91 @@ def MinBoundingRectanglePlane(objs,curr_plane,im_rep=False):
     f_bb=BoundingBoxPlane(objs,curr_plane,ret_pts=True)
     return f_bb,curr_area,i
 
+#2D planar bounding rectangle routine, "hullface" mode
+def MinBoundingRectangleCalipers(objs,plane):
+    """rotating calipers on the hull of the object points projected on plane
+    exact for point based objects, final rectangle always measured on objs"""
+    uv_list=[]
+    for pt in ObjectHullPoints(objs):
+        rc,u,v=plane.ClosestParameter(pt)
+        uv_list.append((u,v))
+    area,(ux,uy),ext=gt.MinAreaRectangle2D(uv_list)
+    xaxis=plane.XAxis*ux+plane.YAxis*uy
+    yaxis=Rhino.Geometry.Vector3d.CrossProduct(plane.ZAxis,xaxis)
+    rect_plane=Rhino.Geometry.Plane(plane.Origin,xaxis,yaxis)
+    curr_area=BoxArea(BoundingBoxPlane(objs,rect_plane))
+    f_bb=BoundingBoxPlane(objs,rect_plane,ret_pts=True)
+    return f_bb,curr_area,1
+
 #used for planar bounding rectangle calculation
 def BoxArea(box):
     return (box.X[1]-box.X[0])*(box.Y[1]-box.Y[0])
 
-def CombinedMinBB(objIDs, fine_sample = False, rel_stop = False, im_rep = False):
+def MinBBObjects(objs, fine_sample = False, rel_stop = False, im_rep = False, hull_reduce = False, algorithm = "sampling", pca_seed = False, seed_faces = 3):
+    """minimum bounding box of RhinoCommon geometries, nothing added to the doc
+    returns (box, volume, passes, planar): for planar/coplanar objects box is
+    the closed list of rectangle corners and volume the rectangle area"""
+    plane=CheckObjCoPlanarity(objs,tol=sc.doc.ModelAbsoluteTolerance)
+    
+    if hull_reduce:
+        objs,nb_in,nb_kept=ReduceToHull(objs,plane)
+        if nb_in:
+            msg="Convex hull reduction: {} of {} points kept".format(nb_kept,nb_in)
+            msg+=" (ratio {:.2%})".format(float(nb_kept)/nb_in)
+            Rhino.RhinoApp.WriteLine(msg)
+    
+    if plane:
+        #launch planar bounding box routine
+        if algorithm=="hullface":
+            f_bb,curr_area,passes=MinBoundingRectangleCalipers(objs,plane)
+        else:
+            f_bb,curr_area,passes=MinBoundingRectanglePlane(objs,plane,im_rep)
+        return [f_bb[0],f_bb[1],f_bb[2],f_bb[3],f_bb[0]],curr_area,passes,True
+    
+    #standard sample count=10 --> 1000 boxes per pass
+    #fine sample count=18 --> 5832 boxes per pass
+    if fine_sample: count=18
+    else: count=10
+    wxy_plane=Rhino.Geometry.Plane.WorldXY
+    #launch 3D bounding box routine
+    if algorithm=="hullface":
+        curr_bb,curr_vol,passes=Min3DBoundingBoxHull(objs,count,rel_stop,im_rep)
+    else:
+        seed_planes=None
+        if pca_seed: seed_planes=SeedPlanes(objs,seed_faces)
+        curr_bb,curr_vol,passes=Min3DBoundingBox(objs,wxy_plane,count,rel_stop,im_rep,seed_planes)
+    return curr_bb,curr_vol,passes,False
+
+def AddMinBB(box, planar):
+    #adds a MinBBObjects result to the doc, returns its id
+    if planar: return rs.AddPolyline(box)
+    if Rhino.RhinoApp.ExeVersion<6:
+        return sc.doc.Objects.AddBrep(box.ToBrep()) #legacy
+    return sc.doc.Objects.AddBox(box)
+
+def BatchMinBB(objIDLists, fine_sample = False, rel_stop = False, hull_reduce = False, algorithm = "sampling", pca_seed = False, seed_faces = 3, add_to_doc = False):
+    """minimum bounding boxes of many objects (or groups of objects) in one
+    call; every item of objIDLists is a list of ids or geometries boxed
+    together, the candidate octant grids are shared by all the searches
+    returns a list of (box, volume, planar, box id or None)"""
+    results=[]
+    for objIDs in objIDLists:
+        objs=[rs.coercegeometry(objID) for objID in objIDs]
+        box,volume,passes,planar=MinBBObjects(objs,fine_sample,rel_stop,False,hull_reduce,algorithm,pca_seed,seed_faces)
+        boxID=None
+        if add_to_doc: boxID=AddMinBB(box,planar)
+        results.append((box,volume,planar,boxID))
+        if sc.escape_test(False): break
+    if add_to_doc: sc.doc.Views.Redraw()
+    return results
+
+def CombinedMinBB(objIDs, fine_sample = False, rel_stop = False, im_rep = False, hull_reduce = False, algorithm = "sampling", pca_seed = False, seed_faces = 3, add_to_doc = True):
+    """algorithm: "sampling" (angular sweeps) or "hullface" (rotating calipers
+    for the planar case, hull face aligned start + refinement for 3D)
+    pca_seed: 3D sampling starts from the principal axes (plus the
+    seed_faces largest hull faces) instead of World XY and the octant grid
+    add_to_doc: adds the box (or rectangle) to the doc
+    returns the volume (area for planar objects)"""
     #user input
     #get prev settings
     if "MinBBSample" in sc.sticky: u_samp = sc.sticky["MinBBSample"]
@@ -339,44 +584,18 @@ def CombinedMinBB(objIDs, fine_sample = False, rel_stop = False, im_rep = False)
     objs=[rs.coercegeometry(objID) for objID in objIDs]
 #    print "Checking object planarity/coplanarity..."
     st=time.time()
-    plane=CheckObjCoPlanarity(objs,tol=sc.doc.ModelAbsoluteTolerance)
+    rs.Prompt("Calculating... please wait.")
+    curr_bb,curr_vol,passes,planar=MinBBObjects(objs,fine_sample,rel_stop,im_rep,hull_reduce,algorithm,pca_seed,seed_faces)
     
-    if plane:
-        if len(objs)==1: msg="Selected object is planar - "
-        else: msg="All selected objects are coplanar - "
-        msg+="launching 2D planar bounding rectangle calculation."
-#        print msg
-        #launch planar bounding box routine
-        f_bb,curr_area,passes=MinBoundingRectanglePlane(objs,plane,im_rep)
-        #add polyline, report message
-        bbID=rs.AddPolyline([f_bb[0],f_bb[1],f_bb[2],f_bb[3],f_bb[0]])
-        fa=round(curr_area,prec)
+    #add box or rectangle, report message
+    if add_to_doc: AddMinBB(curr_bb,planar)
+    fv=round(curr_vol,prec)
+    if planar:
         msg="{} refinement stages. ".format(passes)
-        msg+="Minimum bounding box area = {} sq. {}".format(fa,us)
-        msg+=" Elapsed time: {:.2f} sec.".format(time.time()-st)
-        
+        msg+="Minimum bounding box area = {} sq. {}".format(fv,us)
     else:
-        #standard sample count=10 --> 1000 boxes per pass
-        #fine sample count=18 --> 5832 boxes per pass
-        if fine_sample: count=18
-        else: count=10
-        wxy_plane=Rhino.Geometry.Plane.WorldXY
-        if len(objs)==1: cp_msg="Selected object is not planar - "
-        else: cp_msg="Selected objects are not coplanar - "
-        cp_msg+="launching 3D bounding box calculation."
-#        print cp_msg
-        rs.Prompt("Calculating... please wait.")
-        #launch 3D bounding box routine
-        curr_bb,curr_vol,passes=Min3DBoundingBox(objs,wxy_plane,count,rel_stop,im_rep)
-        
-        #add box, report message
-        if Rhino.RhinoApp.ExeVersion<6:
-            sc.doc.Objects.AddBrep(curr_bb.ToBrep()) #legacy
-        else:
-            sc.doc.Objects.AddBox(curr_bb)
-        fv=round(curr_vol,prec)
         msg="Final volume after {} passes is {} {}3".format(passes,fv,us)
-        msg+=" | Elapsed time: {:.2f} sec.".format(time.time()-st)
+    msg+=" | Elapsed time: {:.2f} sec.".format(time.time()-st)
         
     #final result reporting
 #    print msg
@@ -385,4 +604,5 @@ def CombinedMinBB(objIDs, fine_sample = False, rel_stop = False, im_rep = False)
     sc.sticky["MinBBSample"] = fine_sample
     sc.sticky["MinBBReports"] = im_rep
     sc.sticky["MinBBStop"] = rel_stop
-    return curr_vol
\ No newline at end of file
+    sc.sticky["MinBBAlgorithm"] = algorithm
+    return curr_vol
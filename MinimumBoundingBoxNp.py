@@ -0,0 +1,422 @@
+"""NumPy engine for the 3D minimum bounding box search.
+Headless counterpart of MinimumBoundingBox.Min3DBoundingBox: works on an
+(N,3) point array instead of RhinoCommon geometry, so it runs without Rhino
+(e.g. on Linux compute nodes) and can be checked against the Rhino results.
+
+- a plane is a 3x3 matrix whose rows are its X, Y and Z axes (origin is
+  irrelevant for bounding boxes); a stack of K planes is a (K,3,3) array
+- every candidate plane of a pass is evaluated at once: the points are
+  multiplied by all plane axes in one matrix product, then reduced with
+  min/max to get the oriented extents
+- a box is returned as (plane, bbMin, bbMax), extents expressed in the plane
+
+Same search strategy as the Rhino routine: initial count^3 octant grid, then
+refinement passes around the best plane with angles reduced by 0.1.
+The octant grids and the local refinement rotations only depend on the
+sample count and the pass, they are computed once per process and shared by
+all the searches (BatchMinBB runs many point sets over a process pool)."""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import GeometryTools as gt
+
+#optional: Qhull based convex hull, pure Python quickhull otherwise
+try:
+    from scipy.spatial import ConvexHull, QhullError
+except ImportError:
+    ConvexHull = None
+
+WORLD_XY = np.eye(3)
+WORLD_YZ = np.array([[0.0, 1.0, 0.0], [0.0, 0.0, 1.0], [1.0, 0.0, 0.0]])
+
+#max. size in bytes of the (3*K, N) intermediate array of OrientedExtents
+CHUNK_BYTES = 64 * 1024 * 1024
+
+#max. relative gap between a seed box and the hull volume to skip the octant grid
+SEED_GAP = 0.0001
+
+#number of plane evaluations (bounding boxes computed), for benchmarks
+STATS = {"evaluations": 0}
+
+#shared candidate grids: {("octant", count): planes, ("local", tot_ang, divs): rotations}
+_GRIDS = {}
+
+def RotationMatrices(angles, axis):
+    """returns a (K,3,3) stack of rotation matrices around a single axis
+    (Rodrigues formula), one per angle"""
+    angles = np.atleast_1d(np.asarray(angles, dtype=float))
+    x, y, z = np.asarray(axis, dtype=float) / np.linalg.norm(axis)
+    c = np.cos(angles)
+    s = np.sin(angles)
+    t = 1.0 - c
+    rots = np.empty((len(angles), 3, 3))
+    rots[:, 0, 0] = t * x * x + c
+    rots[:, 0, 1] = t * x * y - s * z
+    rots[:, 0, 2] = t * x * z + s * y
+    rots[:, 1, 0] = t * x * y + s * z
+    rots[:, 1, 1] = t * y * y + c
+    rots[:, 1, 2] = t * y * z - s * x
+    rots[:, 2, 0] = t * x * z - s * y
+    rots[:, 2, 1] = t * y * z + s * x
+    rots[:, 2, 2] = t * z * z + c
+    return rots
+
+#used in initial 3D bb calculation
+def RotateCopyPlanes(tot_ang, count, init_planes, dir_vec):
+    """rotates/copies a (K,3,3) plane stack through angle tot_ang around a
+    world axis; number of planes=count*K, number of angle divisions=count-1
+    (same ordering as MinimumBoundingBox.RotateCopyPlanes)"""
+    init_planes = np.asarray(init_planes).reshape(-1, 3, 3)
+    inc = tot_ang / (count - 1)
+    rots = RotationMatrices(inc * np.arange(count), dir_vec)
+    #plane axes are rows: rotated axes = axes . R^T
+    planes = np.einsum("pij,ckj->cpik", init_planes, rots)
+    return planes.reshape(-1, 3, 3)
+
+#used in initial 3D bb calculation
+def GenerateOctantPlanes(count):
+    #generates an array of count^3 planes in 3 axes covering xyz positive octant
+    tot_ang = math.pi * 0.5 #90 degrees
+    x_planes = RotateCopyPlanes(tot_ang, count, WORLD_YZ, (1, 0, 0)) #X axis
+    xy_planes = RotateCopyPlanes(tot_ang, count, x_planes, (0, -1, 0)) #-Y axis
+    xyz_planes = RotateCopyPlanes(tot_ang, count, xy_planes, (0, 0, 1)) #Z axis
+    return xyz_planes
+
+def OctantPlanes(count):
+    """GenerateOctantPlanes(count), computed once per process (read only)"""
+    key = ("octant", count)
+    if key not in _GRIDS:
+        _GRIDS[key] = GenerateOctantPlanes(count)
+        _GRIDS[key].flags.writeable = False
+    return _GRIDS[key]
+
+#used in 3D refinement calculation
+def LocalRotationArray3D(tot_ang, divs):
+    """returns the divs^3 yaw/roll/pitch rotations of a refinement pass,
+    expressed in the frame of the plane being refined
+    included angle is interval from -tot_ang/2 to +tot_ang/2 on every axis"""
+    angles = np.linspace(-tot_ang * 0.5, tot_ang * 0.5, divs)
+    yaw = RotationMatrices(angles, (0, 0, 1))
+    roll = RotationMatrices(angles, (0, 1, 0))
+    pitch = RotationMatrices(angles, (1, 0, 0))
+    #rotating a plane around its own axis k by R_k gives R_k^T . axes,
+    #successive yaw, roll and pitch give (yaw . roll . pitch)^T . axes
+    rots = np.einsum("yij,rjk,pkl->yrpli", yaw, roll, pitch)
+    return rots.reshape(-1, 3, 3)
+
+#used in 3D refinement calculation
+def RotatePlaneArray3D(view_plane, tot_ang, divs):
+    #generate a 3D array of refinement planes (works with narrow angles)
+    key = ("local", tot_ang, divs)
+    if key not in _GRIDS:
+        #same angle sequence for every search: the rotations are shared
+        _GRIDS[key] = LocalRotationArray3D(tot_ang, divs)
+    return np.einsum("kij,jl->kil", _GRIDS[key], view_plane)
+
+def OrientedExtents(points, planes):
+    """returns (K,3) arrays of min and max coordinates of the points
+    expressed in each of the K planes"""
+    #(3,N) layout so that the reductions run along contiguous rows
+    points_t = np.ascontiguousarray(np.asarray(points, dtype=float).T)
+    planes = np.asarray(planes, dtype=float).reshape(-1, 3, 3)
+    nb_planes = len(planes)
+    STATS["evaluations"] += nb_planes
+    chunk = max(1, CHUNK_BYTES // max(1, 24 * points_t.shape[1]))
+    mins = np.empty((nb_planes, 3))
+    maxs = np.empty((nb_planes, 3))
+    for start in range(0, nb_planes, chunk):
+        stop = min(start + chunk, nb_planes)
+        #one matrix product for all axes of all planes of the chunk
+        local = planes[start:stop].reshape(-1, 3).dot(points_t)
+        mins[start:stop] = local.min(axis=1).reshape(-1, 3)
+        maxs[start:stop] = local.max(axis=1).reshape(-1, 3)
+    return mins, maxs
+
+#gets a plane-aligned bounding box
+def BoundingBoxPlane(points, plane):
+    """returns a plane-aligned bounding box (plane, bbMin, bbMax)"""
+    mins, maxs = OrientedExtents(points, plane)
+    return (np.array(plane, dtype=float), mins[0], maxs[0])
+
+def BoxVolume(box):
+    plane, bbMin, bbMax = box
+    return float(np.prod(bbMax - bbMin))
+
+def BoxCorners(box):
+    """returns the 8 box corners in world coordinates, in the
+    Rhino.Geometry.BoundingBox.GetCorners() order"""
+    plane, bbMin, bbMax = box
+    x = [bbMin[0], bbMax[0], bbMax[0], bbMin[0]] * 2
+    y = [bbMin[1], bbMin[1], bbMax[1], bbMax[1]] * 2
+    z = [bbMin[2]] * 4 + [bbMax[2]] * 4
+    return np.column_stack((x, y, z)).dot(plane)
+
+#this is the main 3D bb calculation search function
+def MinBBPlane(points, best_plane, planes, curr_box, curr_vol):
+    """returns plane with smallest aligned bounding box volume
+    from point array, planes to test and initial compare volume
+    best plane, volume, and bbox pass through if no better solution found"""
+    mins, maxs = OrientedExtents(points, planes)
+    vols = np.prod(maxs - mins, axis=1)
+    i = int(np.argmin(vols))
+    if vols[i] < curr_vol:
+        curr_vol = float(vols[i])
+        best_plane = np.array(planes[i]) #copy, grids are shared
+        curr_box = (best_plane, mins[i], maxs[i])
+    return best_plane, curr_box, curr_vol
+
+#3D refinement passes around a start plane
+def RefineMin3DBoundingBox(points, best_plane, curr_bb, curr_vol, tot_ang, count, rel_stop, tol):
+    """refines with smaller angles (reduced by factor at each pass) around
+    best_plane until the volume no longer decreases significantly
+    returns best plane, bbox, volume and number of passes"""
+    factor = 0.1 #angle reduction factor for each successive refinement pass
+    max_passes = 20 #safety factor
+    #refine with smaller angles around best fit plane, loop until...
+    for i in range(max_passes):
+        prev_vol = curr_vol
+        #reduce angle by factor, use refinement planes to generate array
+        tot_ang *= factor
+        ref_planes = RotatePlaneArray3D(best_plane, tot_ang, count)
+        best_plane, curr_bb, curr_vol = MinBBPlane(points, best_plane, ref_planes, curr_bb, curr_vol)
+        vol_diff = prev_vol - curr_vol #vol. diff. over last pass, should be positive or 0
+        #rel_stop==True: relative stop value <.01% difference from previous
+        if rel_stop:
+            if vol_diff < 0.0001 * prev_vol: break
+        else:
+            if vol_diff < tol: break
+
+    return best_plane, curr_bb, curr_vol, i + 1
+
+#start planes for the 3D search
+def SeedPlanes(points, nb_faces=0):
+    """principal axes plane (covariance eigenvectors, decreasing variance),
+    plus one plane per largest-area hull face (up to nb_faces) with the face
+    normal as Z axis and the major principal axis projected as X axis"""
+    points = np.asarray(points, dtype=float)
+    values, vectors = np.linalg.eigh(np.cov(points.T))
+    x, y = vectors[:, 2], vectors[:, 1]
+    planes = [np.array([x, y, np.cross(x, y)])]
+    if nb_faces <= 0 or ConvexHull is None:
+        if nb_faces > 0:
+            return np.array([np.array(f) for f in gt.SeedFrames(points.tolist(), nb_faces)])
+        return np.array(planes)
+    try:
+        hull = ConvexHull(points)
+    except QhullError:
+        return np.array(planes)
+    tri = points[hull.simplices]
+    areas = np.linalg.norm(np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0]), axis=1)
+    seen = set()
+    for i in np.argsort(-areas, kind="stable"):
+        n = hull.equations[i, :3]
+        key = tuple(np.round(n, 6))
+        if key in seen: continue
+        seen.add(key)
+        #major axis projected on the face plane (or second axis if parallel)
+        for t in (x, y):
+            fx = t - t.dot(n) * n
+            if np.linalg.norm(fx) > 1e-6: break
+        fx /= np.linalg.norm(fx)
+        planes.append(np.array([fx, np.cross(n, fx), n]))
+        if len(planes) > nb_faces: break
+    return np.array(planes)
+
+#3D (non-planar) bounding box routine
+def Min3DBoundingBox(points, init_plane=WORLD_XY, count=10, rel_stop=False, tol=0.001, seed_planes=None):
+    """returns (box, volume, passes) like MinimumBoundingBox.Min3DBoundingBox
+    tol replaces the document absolute tolerance for the absolute stop value
+    seed_planes: optional start planes (see SeedPlanes); the count^3 octant
+    pass is skipped only if the best seed box is within SEED_GAP (relative)
+    of the hull volume (a lower bound), refinement then starts with a wider
+    first pass (+/-9 degrees). Otherwise the octant search runs as without
+    seed and the seed is refined too if it beats the refined result: the
+    result is never worse than the unseeded one."""
+    points = np.asarray(points, dtype=float)
+    #get initial fast bb in init plane (World XY), plus volume to compare
+    curr_bb = BoundingBoxPlane(points, init_plane)
+    curr_vol = BoxVolume(curr_bb)
+
+    tot_ang = math.pi * 0.5 #90 degrees for intial octant
+
+    best_plane = init_plane
+    seed = None
+    if seed_planes is not None and len(seed_planes):
+        seed = MinBBPlane(points, best_plane, seed_planes, curr_bb, curr_vol)
+        hull_vol = HullVolume(points)
+        if hull_vol > 0 and seed[2] - hull_vol <= SEED_GAP * hull_vol:
+            #first refinement pass +/-9 degrees
+            best_plane, curr_bb, curr_vol, passes = RefineMin3DBoundingBox(
+                points, seed[0], seed[1], seed[2], math.pi, count, rel_stop, tol)
+            return curr_bb, curr_vol, passes
+
+    #run intitial bb calculation
+    xyz_planes = OctantPlanes(count)
+    best_plane, curr_bb, curr_vol = MinBBPlane(points, best_plane, xyz_planes, curr_bb, curr_vol)
+    best_plane, curr_bb, curr_vol, passes = RefineMin3DBoundingBox(
+        points, best_plane, curr_bb, curr_vol, tot_ang, count, rel_stop, tol)
+    #seed better than the refined octant result: refined as well, best kept
+    if seed is not None and seed[2] < curr_vol:
+        res = RefineMin3DBoundingBox(points, seed[0], seed[1], seed[2], math.pi, count, rel_stop, tol)
+        if res[2] < curr_vol: best_plane, curr_bb, curr_vol, passes = res
+    return curr_bb, curr_vol, passes
+
+#convex hull of an (N,3) array: (vertex indices, unit face normals)
+def _Hull(points):
+    if ConvexHull is not None:
+        try:
+            hull = ConvexHull(points)
+        except QhullError:
+            return
+        return hull.vertices, hull.equations[:, :3]
+    hull = gt.ConvexHull3D(points.tolist())
+    if hull is None: return
+    verts, faces = hull
+    faces = np.asarray(faces)
+    normals = np.cross(points[faces[:, 1]] - points[faces[:, 0]],
+                       points[faces[:, 2]] - points[faces[:, 0]])
+    return np.asarray(verts), normals / np.linalg.norm(normals, axis=1)[:, None]
+
+#convex hull volume of an (N,3) array, lower bound of any bounding box volume
+def HullVolume(points):
+    if ConvexHull is not None:
+        try:
+            return float(ConvexHull(points).volume)
+        except QhullError:
+            return 0.0
+    return gt.HullVolume(points.tolist())
+
+#2D hull vertices of an (N,2) array, counter-clockwise
+def _Hull2D(uv):
+    if ConvexHull is not None:
+        try:
+            return uv[ConvexHull(uv).vertices]
+        except QhullError:
+            pass
+    return uv[gt.ConvexHull2D(uv.tolist())]
+
+def MinBoxHullFaces(points):
+    """best plane of the boxes with a face flush with a convex hull face:
+    rotating calipers on the hull projected on every (distinct) face plane
+    returns (plane, volume), None for (nearly) coplanar point sets"""
+    points = np.asarray(points, dtype=float)
+    hull = _Hull(points)
+    if hull is None: return
+    verts, normals = hull
+    hpts = points[verts]
+    normals = np.unique(np.round(normals, 9), axis=0)
+    normals /= np.linalg.norm(normals, axis=1)[:, None]
+    best = None
+    for n in normals:
+        #in-plane frame (e1, e2, n), right-handed
+        t = WORLD_XY[0] if abs(n[0]) < 0.9 else WORLD_XY[1]
+        e1 = np.cross(n, t)
+        e1 /= np.linalg.norm(e1)
+        e2 = np.cross(n, e1)
+        poly = _Hull2D(hpts.dot(np.column_stack((e1, e2))))
+        if len(poly) < 3: continue
+        #calipers as all edge directions at once (hull polygons are small)
+        u = np.roll(poly, -1, axis=0) - poly
+        u /= np.linalg.norm(u, axis=1)[:, None]
+        v = np.column_stack((-u[:, 1], u[:, 0]))
+        areas = np.ptp(u.dot(poly.T), axis=1) * np.ptp(v.dot(poly.T), axis=1)
+        i = int(np.argmin(areas))
+        height = np.ptp(hpts.dot(n))
+        if best is None or areas[i] * height < best[1]:
+            xaxis = u[i, 0] * e1 + u[i, 1] * e2
+            best = (np.array([xaxis, np.cross(n, xaxis), n]), areas[i] * height)
+    return best
+
+#3D (non-planar) bounding box routine, "hullface" mode
+def Min3DBoundingBoxHull(points, count=10, rel_stop=False, tol=0.001):
+    """like Min3DBoundingBox, but starts from the best box flush with a
+    convex hull face instead of the octant grid; returns (box, volume, passes)"""
+    points = np.asarray(points, dtype=float)
+    res = MinBoxHullFaces(points)
+    if res is None: return Min3DBoundingBox(points, WORLD_XY, count, rel_stop, tol)
+    best_plane = res[0]
+    curr_bb = BoundingBoxPlane(points, best_plane)
+    curr_vol = BoxVolume(curr_bb)
+    #first refinement pass covers +/-4.5 degrees, same as after the octant grid
+    tot_ang = math.pi * 0.5
+    best_plane, curr_bb, curr_vol, passes = RefineMin3DBoundingBox(
+        points, best_plane, curr_bb, curr_vol, tot_ang, count, rel_stop, tol)
+    return curr_bb, curr_vol, passes
+
+#convex hull pre-reduction (the minimum bounding box only depends on the hull)
+def HullReduce(points):
+    """returns the convex hull vertices of an (N,3) point array
+    (all points if the hull is degenerate)"""
+    points = np.asarray(points, dtype=float)
+    if len(points) < 5: return points
+    if ConvexHull is not None:
+        try:
+            return points[ConvexHull(points).vertices]
+        except QhullError:
+            return points
+    return points[gt.HullVertexIndices(points.tolist())]
+
+def MinBBPoints(points, fine_sample=False, rel_stop=False, tol=0.001, hull_reduce=False, algorithm="sampling", pca_seed=False, seed_faces=3):
+    """headless counterpart of MinimumBoundingBox.CombinedMinBB (3D case)
+    for an (N,3) point array; returns (box, volume, passes)
+    algorithm: "sampling" (octant grid) or "hullface" (hull face aligned start)
+    pca_seed: sampling starts from SeedPlanes(points, seed_faces)"""
+    if hull_reduce: points = HullReduce(points)
+    #standard sample count=10 --> 1000 boxes per pass
+    #fine sample count=18 --> 5832 boxes per pass
+    if fine_sample: count = 18
+    else: count = 10
+    if algorithm == "hullface":
+        return Min3DBoundingBoxHull(points, count, rel_stop, tol)
+    seed_planes = None
+    if pca_seed: seed_planes = SeedPlanes(points, seed_faces)
+    return Min3DBoundingBox(points, WORLD_XY, count, rel_stop, tol, seed_planes)
+
+def _BatchItem(args):
+    points, options = args
+    return MinBBPoints(points, **options)
+
+def _WarmGrids(count):
+    #octant grids of a worker process, before the first search
+    OctantPlanes(count)
+
+def BatchMinBB(clouds, workers=None, fine_sample=False, rel_stop=False, tol=0.001, hull_reduce=False, algorithm="sampling", pca_seed=False, seed_faces=3):
+    """minimum bounding boxes of many (N,3) point arrays in one call, spread
+    over a process pool (workers=1: in the current process, None: all cores)
+    returns a dict of arrays: "planes" (K,3,3), "bbMin" and "bbMax" (K,3),
+    extents in the planes, "volumes" (K,) and "passes" (K,)"""
+    options = dict(fine_sample=fine_sample, rel_stop=rel_stop, tol=tol, hull_reduce=hull_reduce,
+        algorithm=algorithm, pca_seed=pca_seed, seed_faces=seed_faces)
+    items = [(np.asarray(points, dtype=float), options) for points in clouds]
+    count = 18 if fine_sample else 10
+    if workers is None: workers = os.cpu_count() or 1
+    workers = min(workers, len(items))
+    if workers <= 1:
+        _WarmGrids(count)
+        results = [_BatchItem(item) for item in items]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_WarmGrids, initargs=(count,)) as executor:
+            #a few chunks per worker: the search time varies between objects
+            chunk = max(1, len(items) // (4 * workers))
+            results = list(executor.map(_BatchItem, items, chunksize=chunk))
+    boxes = {"planes": np.empty((len(results), 3, 3)), "bbMin": np.empty((len(results), 3)),
+        "bbMax": np.empty((len(results), 3)), "volumes": np.empty(len(results)),
+        "passes": np.empty(len(results), dtype=int)}
+    for i, ((plane, bbMin, bbMax), volume, passes) in enumerate(results):
+        boxes["planes"][i] = plane
+        boxes["bbMin"][i] = bbMin
+        boxes["bbMax"][i] = bbMax
+        boxes["volumes"][i] = volume
+        boxes["passes"][i] = passes
+    return boxes
+
+def BatchCorners(boxes):
+    """(K,8,3) world corners of BatchMinBB boxes, BoxCorners order"""
+    bbMin, bbMax = boxes["bbMin"], boxes["bbMax"]
+    local = np.empty((len(bbMin), 8, 3))
+    for k, (ix, iy, iz) in enumerate([(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0), (0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)]):
+        local[:, k] = np.where([ix, iy, iz], bbMax, bbMin)
+    return np.einsum("kci,kij->kcj", local, boxes["planes"])
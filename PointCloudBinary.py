@@ -0,0 +1,129 @@
+"""Compact binary point cloud format for the web catalogue (.pcb).
+Pure Python (runs in IronPython 2.7 for the Rhino command), with a NumPy
+fast path when the inputs are NumPy arrays.
+
+Little-endian layout, every array directly readable with a typed-array view
+in the browser (see static/pcb.js):
+
+    offset  type           content
+    0       char[4]        magic "CEPC"
+    4       uint16         version (1)
+    6       uint16         flags: 1 = colours, 2 = normals
+    8       uint32         point count N
+    12      uint32         reserved (0)
+    16      float64[3]     bbox min
+    40      float64[3]     bbox max
+    64      int16[3N]      positions, quantized in the bbox:
+                           p = min + (q + 32768) * (max - min) / 65535
+    ..      uint8[3N]      colours (r, g, b), if flag 1
+    ..      int8[3N]       normals, n = q / 127, if flag 2"""
+
+import array
+import struct
+import sys
+
+#optional: vectorized encoding/decoding of NumPy arrays
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b"CEPC"
+VERSION = 1
+FLAG_COLORS = 1
+FLAG_NORMALS = 2
+HEADER = struct.Struct("<4sHHII3d3d")
+
+#encoding helpers, shared with MeshBinary
+def IsArray(values):
+    return np is not None and isinstance(values, np.ndarray)
+
+def Bbox(points):
+    if IsArray(points):
+        return [float(v) for v in points.min(axis=0)], [float(v) for v in points.max(axis=0)]
+    bbMin = [min(p[k] for p in points) for k in range(3)]
+    bbMax = [max(p[k] for p in points) for k in range(3)]
+    return bbMin, bbMax
+
+def LittleEndian(values):
+    #array.array uses the native byte order
+    if sys.byteorder == "big": values.byteswap()
+    return values.tostring() if sys.version_info[0] < 3 else values.tobytes()
+
+def QuantizePositions(points, bbMin, bbMax):
+    scale = [65535.0 / (bbMax[k] - bbMin[k]) if bbMax[k] > bbMin[k] else 0.0 for k in range(3)]
+    if IsArray(points):
+        q = np.rint((points - bbMin) * scale) - 32768
+        return np.clip(q, -32768, 32767).astype("<i2").tobytes()
+    q = array.array("h", [
+        int(round((p[k] - bbMin[k]) * scale[k])) - 32768 for p in points for k in range(3)])
+    return LittleEndian(q)
+
+def _QuantizeNormals(normals):
+    if IsArray(normals):
+        return np.clip(np.rint(np.asarray(normals) * 127), -127, 127).astype("i1").tobytes()
+    q = array.array("b", [max(-127, min(127, int(round(n[k] * 127)))) for n in normals for k in range(3)])
+    return LittleEndian(q)
+
+def _Colors(colors):
+    if IsArray(colors):
+        return np.asarray(colors, dtype=np.uint8).reshape(-1, 3).tobytes()
+    return LittleEndian(array.array("B", [int(c[k]) for c in colors for k in range(3)]))
+
+def EncodePcb(points, colors=None, normals=None):
+    """returns the .pcb bytes of a point cloud; points is an (N,3) array or a
+    sequence of (x,y,z), colors (r,g,b) in 0-255, normals unit (x,y,z)"""
+    count = len(points)
+    flags = 0
+    if colors is not None: flags |= FLAG_COLORS
+    if normals is not None: flags |= FLAG_NORMALS
+    if count:
+        bbMin, bbMax = Bbox(points)
+    else:
+        bbMin, bbMax = [0.0] * 3, [0.0] * 3
+    chunks = [HEADER.pack(MAGIC, VERSION, flags, count, 0, *(list(bbMin) + list(bbMax)))]
+    chunks.append(QuantizePositions(points, bbMin, bbMax))
+    if colors is not None: chunks.append(_Colors(colors))
+    if normals is not None: chunks.append(_QuantizeNormals(normals))
+    return b"".join(chunks)
+
+def WritePcb(path, points, colors=None, normals=None):
+    with open(path, "wb") as f:
+        f.write(EncodePcb(points, colors, normals))
+
+def DecodePcb(data):
+    """returns a dict {"points", "colors", "normals", "bbox"}: NumPy arrays
+    if NumPy is available, else lists of tuples"""
+    magic, version, flags, count, reserved = HEADER.unpack_from(data, 0)[:5]
+    values = HEADER.unpack_from(data, 0)[5:]
+    if magic != MAGIC: raise ValueError("not a .pcb point cloud")
+    if version != VERSION: raise ValueError("unsupported .pcb version {}".format(version))
+    bbMin, bbMax = list(values[:3]), list(values[3:])
+    step = [(bbMax[k] - bbMin[k]) / 65535.0 for k in range(3)]
+    offset = HEADER.size
+    cloud = {"bbox": (bbMin, bbMax), "colors": None, "normals": None}
+    if np is not None:
+        q = np.frombuffer(data, dtype="<i2", count=3 * count, offset=offset).reshape(-1, 3)
+        cloud["points"] = bbMin + (q + 32768.0) * step
+        offset += 6 * count
+        if flags & FLAG_COLORS:
+            cloud["colors"] = np.frombuffer(data, dtype=np.uint8, count=3 * count, offset=offset).reshape(-1, 3)
+            offset += 3 * count
+        if flags & FLAG_NORMALS:
+            cloud["normals"] = np.frombuffer(data, dtype="i1", count=3 * count, offset=offset).reshape(-1, 3) / 127.0
+        return cloud
+    q = struct.unpack_from("<{}h".format(3 * count), data, offset)
+    cloud["points"] = [tuple(bbMin[k] + (q[3 * i + k] + 32768) * step[k] for k in range(3)) for i in range(count)]
+    offset += 6 * count
+    if flags & FLAG_COLORS:
+        c = struct.unpack_from("<{}B".format(3 * count), data, offset)
+        cloud["colors"] = [c[3 * i:3 * i + 3] for i in range(count)]
+        offset += 3 * count
+    if flags & FLAG_NORMALS:
+        n = struct.unpack_from("<{}b".format(3 * count), data, offset)
+        cloud["normals"] = [tuple(v / 127.0 for v in n[3 * i:3 * i + 3]) for i in range(count)]
+    return cloud
+
+def ReadPcb(path):
+    with open(path, "rb") as f:
+        return DecodePcb(f.read())
@@ -0,0 +1,306 @@
+"""Point cloud and mesh file input/output for the headless pipeline.
+Reads .ply (ascii/binary), .xyz/.txt/.csv (columns) and .3dm (through
+rhino3dm) into NumPy arrays, and writes catalogue .3dm files with rhino3dm.
+
+A cloud is a dict: {"points": (N,3) float64, "colors": (N,3) uint8 or None,
+"normals": (N,3) float64 or None, "physicalObjectId": str or None}.
+IterPointCloud yields a file as a sequence of such clouds of bounded size,
+for the stages that run out-of-core."""
+
+import itertools
+import os
+import numpy as np
+
+#optional: only needed to read/write .3dm files
+try:
+    import rhino3dm
+except ImportError:
+    rhino3dm = None
+
+PLY_TYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+
+def _Cloud(points, colors=None, normals=None, physicalObjectId=None):
+    return {
+        "points": np.asarray(points, dtype=float).reshape(-1, 3),
+        "colors": None if colors is None else np.asarray(colors, dtype=np.uint8).reshape(-1, 3),
+        "normals": None if normals is None else np.asarray(normals, dtype=float).reshape(-1, 3),
+        "physicalObjectId": physicalObjectId,
+    }
+
+def _CloudFromColumns(fields):
+    #fields: dict property name -> column array
+    points = np.column_stack([fields[k] for k in ("x", "y", "z")])
+    colors = None
+    if all(k in fields for k in ("red", "green", "blue")):
+        colors = np.column_stack([fields[k] for k in ("red", "green", "blue")])
+    normals = None
+    if all(k in fields for k in ("nx", "ny", "nz")):
+        normals = np.column_stack([fields[k] for k in ("nx", "ny", "nz")])
+    return _Cloud(points, colors, normals)
+
+def CloudMetadata(cloud):
+    """point count, bounding box, attributes and memory size of a cloud"""
+    points = cloud["points"]
+    arrays = [cloud[k] for k in ("points", "colors", "normals") if cloud[k] is not None]
+    bbox = None
+    if len(points): bbox = [points.min(axis=0).tolist(), points.max(axis=0).tolist()]
+    return {
+        "pointCount": len(points),
+        "boundingBox": bbox,
+        "hasColors": cloud["colors"] is not None,
+        "hasNormals": cloud["normals"] is not None,
+        "memoryBytes": sum(a.nbytes for a in arrays),
+    }
+
+def ReadPlyHeader(f):
+    """parses a PLY header from a binary file object positioned at its start
+    returns (format, elements) with elements a list of
+    (name, count, [(property name, dtype or None for list properties)])"""
+    if f.readline().strip() != b"ply": raise ValueError("not a PLY file")
+    fmt = None
+    elements = []
+    while True:
+        line = f.readline()
+        if not line: raise ValueError("unexpected end of PLY header")
+        words = line.decode("ascii", "replace").split()
+        if not words or words[0] in ("comment", "obj_info"): continue
+        if words[0] == "end_header": break
+        if words[0] == "format": fmt = words[1]
+        elif words[0] == "element": elements.append((words[1], int(words[2]), []))
+        elif words[0] == "property":
+            if words[1] == "list": elements[-1][2].append((words[-1], None))
+            else: elements[-1][2].append((words[-1], PLY_TYPES[words[1]]))
+    return fmt, elements
+
+def _PlyVertices(f):
+    """reads the header and moves f to the first vertex
+    returns (format, vertex count, property names, record dtype or None if ascii)"""
+    fmt, elements = ReadPlyHeader(f)
+    #vertices must come before any element with list properties
+    for name, count, props in elements:
+        if name == "vertex": break
+        if any(t is None for p, t in props):
+            raise ValueError("PLY elements with lists before vertices are not supported")
+    else:
+        raise ValueError("PLY file without vertex element")
+    if any(t is None for p, t in props):
+        raise ValueError("PLY vertex lists are not supported")
+    names = [p for p, t in props]
+    if fmt == "ascii":
+        #skip the rows of preceding elements
+        for prev_name, prev_count, prev_props in elements:
+            if prev_name == "vertex": break
+            for i in range(prev_count): f.readline()
+        return fmt, count, names, None
+    order = "<" if fmt == "binary_little_endian" else ">"
+    for prev_name, prev_count, prev_props in elements:
+        if prev_name == "vertex": break
+        f.seek(prev_count * np.dtype([(p, order + t) for p, t in prev_props]).itemsize, 1)
+    return fmt, count, names, np.dtype([(p, order + t) for p, t in props])
+
+def ReadPly(path):
+    with open(path, "rb") as f:
+        fmt, count, names, dtype = _PlyVertices(f)
+        if dtype is None:
+            data = np.loadtxt(f, max_rows=count, ndmin=2)
+            fields = dict((p, data[:, i]) for i, p in enumerate(names))
+        else:
+            data = np.fromfile(f, dtype=dtype, count=count)
+            fields = dict((p, data[p]) for p in names)
+    return _CloudFromColumns(fields)
+
+def WritePly(path, cloud):
+    """binary little endian PLY of a cloud (double coordinates, uchar
+    colours, float normals)"""
+    fields = [("x", "<f8"), ("y", "<f8"), ("z", "<f8")]
+    if cloud["colors"] is not None: fields += [("red", "u1"), ("green", "u1"), ("blue", "u1")]
+    if cloud["normals"] is not None: fields += [("nx", "<f4"), ("ny", "<f4"), ("nz", "<f4")]
+    data = np.empty(len(cloud["points"]), dtype=fields)
+    for i, k in enumerate("xyz"): data[k] = cloud["points"][:, i]
+    if cloud["colors"] is not None:
+        for i, k in enumerate(("red", "green", "blue")): data[k] = cloud["colors"][:, i]
+    if cloud["normals"] is not None:
+        for i, k in enumerate(("nx", "ny", "nz")): data[k] = cloud["normals"][:, i]
+    header = ["ply", "format binary_little_endian 1.0", "element vertex {}".format(len(data))]
+    types = {"<f8": "double", "u1": "uchar", "<f4": "float"}
+    header += ["property {} {}".format(types[t], name) for name, t in fields]
+    header.append("end_header")
+    with open(path, "wb") as f:
+        f.write(("\n".join(header) + "\n").encode("ascii"))
+        data.tofile(f)
+
+def WritePlyMesh(path, vertices, faces):
+    """binary little endian PLY of a triangle mesh"""
+    faceData = np.empty(len(faces), dtype=[("n", "u1"), ("v", "<i4", 3)])
+    faceData["n"] = 3
+    faceData["v"] = faces
+    header = ["ply", "format binary_little_endian 1.0",
+        "element vertex {}".format(len(vertices)),
+        "property double x", "property double y", "property double z",
+        "element face {}".format(len(faces)),
+        "property list uchar int vertex_indices", "end_header"]
+    with open(path, "wb") as f:
+        f.write(("\n".join(header) + "\n").encode("ascii"))
+        np.asarray(vertices, dtype="<f8").tofile(f)
+        faceData.tofile(f)
+
+def _XyzCloud(data, extraColors=None):
+    """cloud of x y z [r g b] [nx ny nz] rows; extraColors tells if 3 extra
+    columns are colours (guessed from the values if None)
+    returns the cloud and extraColors"""
+    fields = {"x": data[:, 0], "y": data[:, 1], "z": data[:, 2]}
+    extra = data[:, 3:]
+    if extra.shape[1] >= 6:
+        fields.update(red=extra[:, 0], green=extra[:, 1], blue=extra[:, 2])
+        fields.update(nx=extra[:, 3], ny=extra[:, 4], nz=extra[:, 5])
+    elif extra.shape[1] >= 3:
+        if extraColors is None: extraColors = bool(np.abs(extra[:, :3]).max() > 1.0)
+        if extraColors:
+            fields.update(red=extra[:, 0], green=extra[:, 1], blue=extra[:, 2])
+        else:
+            fields.update(nx=extra[:, 0], ny=extra[:, 1], nz=extra[:, 2])
+    return _CloudFromColumns(fields), extraColors
+
+def ReadXyz(path):
+    """whitespace or comma separated columns: x y z [r g b] [nx ny nz]
+    (6 columns are read as colours if any value is above 1, else normals)"""
+    with open(path) as f:
+        data = np.loadtxt((line.replace(",", " ") for line in f), ndmin=2)
+    return _XyzCloud(data)[0]
+
+def Read3dm(path):
+    """reads the point clouds of a .3dm file (merged if several), keeping the
+    physicalObjectId user string of the first one"""
+    if rhino3dm is None: raise ImportError("rhino3dm is required to read .3dm files")
+    model = rhino3dm.File3dm.Read(path)
+    if model is None: raise ValueError("unable to read " + path)
+    clouds = []
+    for obj in model.Objects:
+        geom = obj.Geometry
+        if not isinstance(geom, rhino3dm.PointCloud): continue
+        items = [geom[i] for i in range(geom.Count)]
+        points = [(it.Location.X, it.Location.Y, it.Location.Z) for it in items]
+        colors = None
+        if geom.ContainsColors:
+            colors = [(it.Color[0], it.Color[1], it.Color[2]) for it in items]
+        normals = None
+        if geom.ContainsNormals:
+            normals = [(it.Normal.X, it.Normal.Y, it.Normal.Z) for it in items]
+        clouds.append(_Cloud(points, colors, normals,
+                             obj.Attributes.GetUserString("physicalObjectId")))
+    if not clouds: raise ValueError("no point cloud in " + path)
+    if len(clouds) == 1: return clouds[0]
+    merged = _Cloud(np.concatenate([c["points"] for c in clouds]),
+                    physicalObjectId=clouds[0]["physicalObjectId"])
+    if all(c["colors"] is not None for c in clouds):
+        merged["colors"] = np.concatenate([c["colors"] for c in clouds])
+    if all(c["normals"] is not None for c in clouds):
+        merged["normals"] = np.concatenate([c["normals"] for c in clouds])
+    return merged
+
+def ReadPointCloud(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".ply": return ReadPly(path)
+    if ext in (".xyz", ".txt", ".csv", ".pts"): return ReadXyz(path)
+    if ext == ".3dm": return Read3dm(path)
+    raise ValueError("unsupported point cloud format: " + path)
+
+def _TextRows(f, count, chunkPoints):
+    #arrays of at most chunkPoints rows of a text file, count rows at most
+    while count > 0:
+        lines = [line.replace(",", " ") for line in itertools.islice(f, min(chunkPoints, count))]
+        lines = [line for line in lines if line.strip()]
+        if not lines: return
+        count -= len(lines)
+        yield np.loadtxt(lines, ndmin=2)
+
+def IterPointCloud(path, chunkPoints=1 << 20):
+    """yields the cloud of a file in parts of at most chunkPoints points,
+    without loading the whole file (binary .ply are memory-mapped)
+    .3dm files are read at once by rhino3dm, then split"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".ply":
+        with open(path, "rb") as f:
+            fmt, count, names, dtype = _PlyVertices(f)
+            offset = f.tell()
+            if dtype is None:
+                lines = (line.decode("ascii") for line in f)
+                for data in _TextRows(lines, count, chunkPoints):
+                    yield _CloudFromColumns(dict((p, data[:, i]) for i, p in enumerate(names)))
+                return
+        if count == 0: return
+        data = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+        for start in range(0, count, chunkPoints):
+            part = data[start:start + chunkPoints]
+            yield _CloudFromColumns(dict((p, np.array(part[p])) for p in names))
+    elif ext in (".xyz", ".txt", ".csv", ".pts"):
+        extraColors = None
+        with open(path) as f:
+            for data in _TextRows(f, float("inf"), chunkPoints):
+                cloud, extraColors = _XyzCloud(data, extraColors)
+                yield cloud
+    else:
+        cloud = ReadPointCloud(path)
+        for start in range(0, len(cloud["points"]), chunkPoints):
+            yield _Cloud(*[None if cloud[k] is None else cloud[k][start:start + chunkPoints]
+                           for k in ("points", "colors", "normals")],
+                         physicalObjectId=cloud["physicalObjectId"])
+
+def FileMetadata(path):
+    """CloudMetadata of a file, from the header only for .ply files
+    (no bounding box, memoryBytes as loaded by ReadPointCloud)"""
+    if os.path.splitext(path)[1].lower() != ".ply": return CloudMetadata(ReadPointCloud(path))
+    with open(path, "rb") as f:
+        fmt, count, names, dtype = _PlyVertices(f)
+    hasColors = all(k in names for k in ("red", "green", "blue"))
+    hasNormals = all(k in names for k in ("nx", "ny", "nz"))
+    return {
+        "pointCount": count,
+        "boundingBox": None,
+        "hasColors": hasColors,
+        "hasNormals": hasNormals,
+        "memoryBytes": count * (24 + 3 * hasColors + 24 * hasNormals),
+    }
+
+#rhino3dm geometry builders for the catalogue .3dm files
+def ToRhinoPointCloud(points, colors=None):
+    pc = rhino3dm.PointCloud()
+    if colors is None:
+        for x, y, z in points: pc.Add(rhino3dm.Point3d(x, y, z))
+    else:
+        for (x, y, z), (r, g, b) in zip(points, colors):
+            pc.Add(rhino3dm.Point3d(x, y, z), (int(r), int(g), int(b), 255))
+    return pc
+
+def ToRhinoMesh(vertices, faces):
+    mesh = rhino3dm.Mesh()
+    for x, y, z in vertices: mesh.Vertices.Add(x, y, z)
+    for a, b, c in faces: mesh.Faces.AddFace(int(a), int(b), int(c))
+    return mesh
+
+#box corners in Rhino.Geometry.BoundingBox.GetCorners() order -> 6 quads
+BOX_FACES = ((0, 3, 2, 1), (4, 5, 6, 7), (0, 1, 5, 4), (1, 2, 6, 5), (2, 3, 7, 6), (3, 0, 4, 7))
+
+def ToRhinoBoxMesh(corners):
+    mesh = rhino3dm.Mesh()
+    for x, y, z in corners: mesh.Vertices.Add(float(x), float(y), float(z))
+    for a, b, c, d in BOX_FACES: mesh.Faces.AddFace(a, b, c, d)
+    return mesh
+
+def Write3dm(path, geometry, physicalObjectId, layerName):
+    """writes a single geometry on its layer, tagged with physicalObjectId,
+    like the -Export of a selected object in Rhino"""
+    if rhino3dm is None: raise ImportError("rhino3dm is required to write .3dm files")
+    model = rhino3dm.File3dm()
+    layer = rhino3dm.Layer()
+    layer.Name = layerName
+    attrs = rhino3dm.ObjectAttributes()
+    attrs.LayerIndex = model.Layers.Add(layer)
+    attrs.SetUserString("physicalObjectId", physicalObjectId)
+    model.Objects.Add(geometry, attrs)
+    model.Write(path, 7)
@@ -0,0 +1,190 @@
+"""Point cloud normal estimation with NumPy (scipy optional), headless
+counterpart of Cockroach_ComputePointCloudNormals.
+
+- k nearest neighbours of all points in one batched query of a k-d tree
+  (scipy cKDTree, brute force by blocks without scipy)
+- normal = eigenvector of the smallest eigenvalue of the neighbourhood
+  covariance, batched 3x3 eigen-decompositions
+- orientation, optional: "centroid" (away from the cloud centroid) or
+  "propagate" (sign propagated along a minimum spanning tree of the
+  neighbour graph weighted by normal disagreement, from the highest point
+  of every component oriented upwards; needs scipy)
+Normals are cached on disk (data/cache/normals in the catalogue), keyed on
+the point data and the estimation parameters.
+
+usage: python PointCloudNormals.py CLOUD [CLOUD ...] [options]
+writes <cloud>_normals.ply next to every input"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import PointCloudIO as pcio
+from CatalogueCache import ReplaceFile
+
+#optional: k-d tree and spanning tree (orientation propagation)
+try:
+    from scipy.spatial import cKDTree
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import breadth_first_order, connected_components, minimum_spanning_tree
+except ImportError:
+    cKDTree = None
+
+ORIENTATIONS = (None, "centroid", "propagate")
+CHUNK_POINTS = 1 << 16
+ORIENT_NEIGHBOURS = 10
+SPACING_SUBSET = 4000
+
+def KNearest(points, k, workers=1):
+    """indices (N,k) of the k nearest neighbours of every point, itself
+    included, in one batched query"""
+    n = len(points)
+    k = max(1, min(k, n))
+    if cKDTree is not None:
+        unused, idx = cKDTree(points).query(points, k, workers=workers)
+        return idx.reshape(n, k)
+    idx = np.empty((n, k), dtype=np.int64)
+    block = max(1, (1 << 24) // n)
+    for start in range(0, n, block):
+        d = ((points[start:start + block, None, :] - points[None, :, :]) ** 2).sum(axis=2)
+        idx[start:start + block] = np.argpartition(d, k - 1, axis=1)[:, :k]
+    return idx
+
+def PointSpacing(points, sample=2000, workers=1, seed=0):
+    """median nearest neighbour distance of a random sample of the points
+    without scipy, neighbours are searched in a subset of the cloud and the
+    distance is scaled down by sqrt(subset / count) (surface density)"""
+    points = np.asarray(points, dtype=float)
+    n = len(points)
+    if n < 2: return 0.0
+    rng = np.random.default_rng(seed)
+    needles = points[rng.choice(n, min(sample, n), replace=False)]
+    if cKDTree is not None:
+        distances = cKDTree(points).query(needles, 2, workers=workers)[0][:, 1]
+        return float(np.median(distances))
+    subset = points[rng.choice(n, min(SPACING_SUBSET, n), replace=False)]
+    distances = np.empty(len(needles))
+    block = max(1, (1 << 22) // len(subset))
+    for start in range(0, len(needles), block):
+        d = ((needles[start:start + block, None, :] - subset[None, :, :]) ** 2).sum(axis=2)
+        d[d == 0] = np.inf #the needle itself, duplicates
+        distances[start:start + block] = np.sqrt(d.min(axis=1))
+    return float(np.median(distances) * np.sqrt(len(subset) / float(n)))
+
+def NormalsFromNeighbours(points, neighbours):
+    """unoriented unit normals from the neighbourhood covariances"""
+    normals = np.empty_like(points)
+    for start in range(0, len(points), CHUNK_POINTS):
+        nb = points[neighbours[start:start + CHUNK_POINTS]]
+        nb = nb - nb.mean(axis=1, keepdims=True)
+        cov = np.einsum("nki,nkj->nij", nb, nb)
+        #eigenvalues in ascending order: first eigenvector
+        normals[start:start + CHUNK_POINTS] = np.linalg.eigh(cov)[1][:, :, 0]
+    return normals
+
+def OrientCentroid(points, normals):
+    flip = ((points - points.mean(axis=0)) * normals).sum(axis=1) < 0
+    normals[flip] *= -1
+    return normals
+
+def OrientPropagate(points, normals, neighbours):
+    """consistent orientation along a minimum spanning tree of the
+    neighbour graph (weight 1 - |ni.nj|); the highest point of every
+    connected component gets an upward normal"""
+    n = len(points)
+    k = neighbours.shape[1]
+    rows = np.repeat(np.arange(n), k)
+    cols = neighbours.ravel()
+    keep = rows != cols
+    rows, cols = rows[keep], cols[keep]
+    #strictly positive weights (zero means no edge)
+    weights = 1.0 - np.abs((normals[rows] * normals[cols]).sum(axis=1)) + 1e-6
+    graph = coo_matrix((weights, (rows, cols)), shape=(n + 1, n + 1)).tocsr()
+    graph = graph.maximum(graph.T)
+    tree = minimum_spanning_tree(graph)
+    # Virtual node n linked to the highest point of every component
+    unused, labels = connected_components(tree[:n, :n], directed=False)
+    order = np.lexsort((-points[:, 2], labels))
+    roots = order[np.r_[True, labels[order][1:] != labels[order][:-1]]]
+    tree = tree + coo_matrix((np.ones(len(roots)), (np.full(len(roots), n), roots)), shape=(n + 1, n + 1))
+    unused, predecessors = breadth_first_order(tree, n, directed=False, return_predecessors=True)
+    parent = predecessors[:n]
+    # Flip parity to the virtual node (upward normal), by pointer jumping
+    parentNormals = np.vstack([normals, [0.0, 0.0, 1.0]])
+    parity = np.r_[(normals * parentNormals[parent]).sum(axis=1) < 0, False]
+    ancestor = np.r_[parent, n]
+    while (ancestor != n).any():
+        parity = parity ^ parity[ancestor]
+        ancestor = ancestor[ancestor]
+    normals[parity[:n]] *= -1
+    return normals
+
+def EstimateNormals(points, k=30, orientation="propagate", workers=1):
+    """unit normals (N,3) of the points from their k nearest neighbours"""
+    if orientation not in ORIENTATIONS: raise ValueError("unknown normals orientation: " + str(orientation))
+    points = np.asarray(points, dtype=float)
+    if len(points) < 3: return np.tile([0.0, 0.0, 1.0], (len(points), 1))
+    neighbours = KNearest(points, k, workers)
+    normals = NormalsFromNeighbours(points, neighbours)
+    if orientation == "centroid" or (orientation == "propagate" and cKDTree is None):
+        return OrientCentroid(points, normals)
+    if orientation == "propagate":
+        return OrientPropagate(points, normals, neighbours[:, :ORIENT_NEIGHBOURS + 1])
+    return normals
+
+def NormalsCacheKey(dataHash, k, orientation):
+    h = hashlib.sha1()
+    h.update(dataHash.encode("ascii"))
+    h.update(json.dumps([k, orientation, cKDTree is not None]).encode("utf-8"))
+    return h.hexdigest()
+
+def CachedNormals(pathCache, dataHash, points, k=30, orientation="propagate", workers=1):
+    """EstimateNormals, reusing the normals stored in pathCache for the
+    same point data (dataHash) and parameters"""
+    path = os.path.join(pathCache, NormalsCacheKey(dataHash, k, orientation) + ".npy")
+    if os.path.exists(path):
+        normals = np.load(path)
+        if normals.shape == np.shape(points): return normals
+    normals = EstimateNormals(points, k, orientation, workers)
+    if not os.path.exists(pathCache): os.makedirs(pathCache, exist_ok=True) #concurrent workers
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, normals)
+    ReplaceFile(path + ".tmp", path)
+    return normals
+
+def NormalsPath(path):
+    return os.path.splitext(path)[0] + "_normals.ply"
+
+def ComputeNormalsFile(task):
+    """task: (path, k, orientation, workers), writes NormalsPath(path)
+    returns (path, point count, elapsed seconds)"""
+    path, k, orientation, workers = task
+    t = time.time()
+    cloud = pcio.ReadPointCloud(path)
+    cloud["normals"] = EstimateNormals(cloud["points"], k, orientation, workers)
+    pcio.WritePly(NormalsPath(path), cloud)
+    return path, len(cloud["points"]), time.time() - t
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Normals of point cloud files")
+    parser.add_argument("clouds", nargs="+", help=".ply/.xyz/.3dm point cloud files")
+    parser.add_argument("--neighbours", type=int, default=30, help="points of a neighbourhood")
+    parser.add_argument("--orientation", choices=["none", "centroid", "propagate"], default="propagate")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+    orientation = None if args.orientation == "none" else args.orientation
+    #one cloud per process, or all threads for a single cloud
+    threads = -1 if len(args.clouds) == 1 else 1
+    tasks = [(path, args.neighbours, orientation, threads) for path in args.clouds]
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for path, count, elapsed in executor.map(ComputeNormalsFile, tasks):
+            print("{} normals computed | {} points | {:.2f}s".format(path, count, elapsed))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
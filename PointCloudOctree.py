@@ -0,0 +1,280 @@
+"""Octree level of detail for the web catalogue point clouds (Potree-like).
+Headless (NumPy), used by CatalogueBatch and runnable on its own.
+
+Every node holds at most `budget` points: inner nodes a grid subsample of
+their cube, their children the remaining points, so loading the nodes from
+the root down refines the cloud without duplicates. Nodes are named from
+their octant path ("r", "r0", "r07", ..., octant = x << 2 | y << 1 | z) and
+written as .pcb files (PointCloudBinary) in
+data/octree/<physicalObjectId>/, with hierarchy.json listing the nodes
+coarse-to-fine:
+
+    {"version": 1, "pointCount": N, "budget": B, "boundingBox": [min, max],
+     "cube": [min, size],
+     "nodes": [{"name": "r", "level": 0, "count": n, "children": mask}, ...]}
+
+Out-of-core, with the input read three times as a stream of clouds of
+bounded size (PointCloudIO.IterPointCloud):
+1. bounding box
+2. point counts on a 2^COUNT_LEVEL grid, from which the cube is split into
+   chunks of at most `chunkBudget` points
+3. points appended to one temporary file per chunk
+then every chunk subtree is built in memory, and the nodes above the chunks
+are filled bottom-up with subsamples of their children. The catalogue export
+passes its in-memory cloud (OctreeFromCloud), the command line streams the
+file (OctreeFromFile)."""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import PointCloudBinary as pcb
+import PointCloudIO as pcio
+from CatalogueCache import ReplaceFile
+
+HIERARCHY_VERSION = 1
+NODE_BUDGET = 20000
+CHUNK_BUDGET = 2000000
+CHUNK_POINTS = 1 << 20
+COUNT_LEVEL = 7
+GRID_CELLS = 128
+MAX_DEPTH = 20
+
+def OctreePath(pathWebRoot, physicalObjectId):
+    return os.path.join(pathWebRoot, "data", "octree", physicalObjectId)
+
+def _RecordDtype(hasColors, hasNormals):
+    fields = [("p", "<f8", 3)]
+    if hasColors: fields.append(("c", "u1", 3))
+    if hasNormals: fields.append(("n", "<f4", 3))
+    return np.dtype(fields)
+
+def _Records(cloud, dtype):
+    records = np.empty(len(cloud["points"]), dtype=dtype)
+    records["p"] = cloud["points"]
+    if "c" in dtype.names: records["c"] = cloud["colors"]
+    if "n" in dtype.names: records["n"] = cloud["normals"]
+    return records
+
+def _Octants(points, cubeMin, size):
+    center = cubeMin + size / 2.0
+    above = (points >= center).astype(np.int64)
+    return (above[:, 0] << 2) | (above[:, 1] << 1) | above[:, 2]
+
+def _ChildCube(cubeMin, size, octant):
+    offset = np.array([(octant >> 2) & 1, (octant >> 1) & 1, octant & 1]) * (size / 2.0)
+    return cubeMin + offset, size / 2.0
+
+def GridSample(points, cubeMin, size, budget):
+    """indices of the first point of every occupied cell of a GRID_CELLS^3
+    grid over the cube, evenly thinned to at most budget points"""
+    cells = np.floor((points - cubeMin) * (GRID_CELLS / size)).astype(np.int64)
+    np.clip(cells, 0, GRID_CELLS - 1, out=cells)
+    keys = (cells[:, 0] * GRID_CELLS + cells[:, 1]) * GRID_CELLS + cells[:, 2]
+    unused, first = np.unique(keys, return_index=True)
+    first.sort()
+    if len(first) > budget:
+        first = first[np.linspace(0, len(first) - 1, budget).astype(np.int64)]
+    return first
+
+def _CountPyramid(counts):
+    #point counts of the cells at every level, finest last
+    pyramid = [counts]
+    while pyramid[0].shape[0] > 1:
+        n = pyramid[0].shape[0] // 2
+        pyramid.insert(0, pyramid[0].reshape(n, 2, n, 2, n, 2).sum(axis=(1, 3, 5)))
+    return pyramid
+
+class _OctreeBuild(object):
+
+    def __init__(self, pathOut, pathTmp, cubeMin, size, dtype, budget):
+        self.pathOut = pathOut
+        self.pathTmp = pathTmp
+        self.cubeMin = cubeMin
+        self.size = size
+        self.dtype = dtype
+        self.budget = budget
+        self.nodes = {}
+        self.pending = set() #nodes kept full precision until the top levels are built
+
+    def Cube(self, name):
+        cubeMin, size = self.cubeMin, self.size
+        for digit in name[1:]:
+            cubeMin, size = _ChildCube(cubeMin, size, int(digit))
+        return cubeMin, size
+
+    def _TmpNode(self, name):
+        return os.path.join(self.pathTmp, "node_" + name + ".bin")
+
+    def WriteNode(self, name, records, pending=False):
+        node = self.nodes.setdefault(name, {"name": name, "level": len(name) - 1, "children": 0})
+        node["count"] = len(records)
+        if len(name) > 1:
+            parent = self.nodes.setdefault(name[:-1], {"name": name[:-1], "level": len(name) - 2, "children": 0, "count": 0})
+            parent["children"] |= 1 << int(name[-1])
+        if pending:
+            self.pending.add(name)
+            records.tofile(self._TmpNode(name))
+            return
+        pcb.WritePcb(os.path.join(self.pathOut, name + ".pcb"), records["p"],
+            records["c"] if "c" in self.dtype.names else None,
+            records["n"] if "n" in self.dtype.names else None)
+
+    def ReadPending(self, name):
+        return np.fromfile(self._TmpNode(name), dtype=self.dtype)
+
+    def BuildSubtree(self, name, records, pending=False):
+        """top-down build of the subtree of a chunk, held in memory"""
+        cubeMin, size = self.Cube(name)
+        if len(records) <= self.budget or len(name) > MAX_DEPTH:
+            self.WriteNode(name, records, pending)
+            return
+        keep = np.zeros(len(records), dtype=bool)
+        keep[GridSample(records["p"], cubeMin, size, self.budget)] = True
+        self.WriteNode(name, records[keep], pending)
+        rest = records[~keep]
+        octants = _Octants(rest["p"], cubeMin, size)
+        for octant in range(8):
+            childRecords = rest[octants == octant]
+            if len(childRecords): self.BuildSubtree(name + str(octant), childRecords)
+
+    def BuildAncestor(self, name):
+        """bottom-up: subsample of the (pending) children, removed from them"""
+        cubeMin, size = self.Cube(name)
+        children = [name + str(k) for k in range(8) if (name + str(k)) in self.pending]
+        parts = [self.ReadPending(child) for child in children]
+        records = np.concatenate(parts)
+        owner = np.repeat(np.arange(len(parts)), [len(part) for part in parts])
+        keep = np.zeros(len(records), dtype=bool)
+        keep[GridSample(records["p"], cubeMin, size, self.budget)] = True
+        self.WriteNode(name, records[keep], pending=True)
+        for i in range(len(children)):
+            self.WriteNode(children[i], records[~keep & (owner == i)], pending=True)
+
+    def Flush(self):
+        #pending nodes to .pcb
+        for name in sorted(self.pending):
+            self.WriteNode(name, self.ReadPending(name))
+        self.pending = set()
+
+def BuildOctree(chunks, pathOut, budget=NODE_BUDGET, chunkBudget=CHUNK_BUDGET):
+    """chunks: function returning a new iterator over the clouds of parts of
+    the input (called three times)
+    writes the node files and hierarchy.json in pathOut (replaced), returns
+    the hierarchy"""
+    # 1. Bounding box
+    bbMin, bbMax, pointCount, dtype = None, None, 0, None
+    for cloud in chunks():
+        points = cloud["points"]
+        if not len(points): continue
+        if dtype is None: dtype = _RecordDtype(cloud["colors"] is not None, cloud["normals"] is not None)
+        pointCount += len(points)
+        low, high = points.min(axis=0), points.max(axis=0)
+        bbMin = low if bbMin is None else np.minimum(bbMin, low)
+        bbMax = high if bbMax is None else np.maximum(bbMax, high)
+    if pointCount == 0: raise ValueError("empty point cloud")
+    size = float((bbMax - bbMin).max()) or 1.0
+    cubeMin = bbMin
+
+    # 2. Counting grid and chunks
+    cells = 1 << COUNT_LEVEL
+    def CellIndex(points):
+        ijk = np.floor((points - cubeMin) * (cells / size)).astype(np.int64)
+        np.clip(ijk, 0, cells - 1, out=ijk)
+        return (ijk[:, 0] * cells + ijk[:, 1]) * cells + ijk[:, 2]
+    counts = np.zeros(cells ** 3, dtype=np.int64)
+    for cloud in chunks():
+        counts += np.bincount(CellIndex(cloud["points"]), minlength=cells ** 3)
+    pyramid = _CountPyramid(counts.reshape(cells, cells, cells))
+    chunkOf = np.full((cells, cells, cells), -1, dtype=np.int32)
+    chunkNames = []
+    ancestors = []
+    stack = [("r", 0, 0, 0)]
+    while stack:
+        name, i, j, k = stack.pop()
+        level = len(name) - 1
+        if pyramid[level][i, j, k] == 0: continue
+        if pyramid[level][i, j, k] <= chunkBudget or level == COUNT_LEVEL:
+            s = 1 << (COUNT_LEVEL - level)
+            chunkOf[i * s:(i + 1) * s, j * s:(j + 1) * s, k * s:(k + 1) * s] = len(chunkNames)
+            chunkNames.append(name)
+            continue
+        ancestors.append(name)
+        for octant in range(8):
+            stack.append((name + str(octant), 2 * i + ((octant >> 2) & 1), 2 * j + ((octant >> 1) & 1), 2 * k + (octant & 1)))
+    chunkOf = chunkOf.ravel()
+
+    if os.path.exists(pathOut): shutil.rmtree(pathOut)
+    os.makedirs(pathOut)
+    pathTmp = tempfile.mkdtemp(prefix="tmp", dir=pathOut)
+    try:
+        # 3. Distribution of the points to the chunk files, in input order
+        for cloud in chunks():
+            if not len(cloud["points"]): continue
+            records = _Records(cloud, dtype)
+            chunkIds = chunkOf[CellIndex(cloud["points"])]
+            order = np.argsort(chunkIds, kind="stable")
+            ids, starts = np.unique(chunkIds[order], return_index=True)
+            ends = list(starts[1:]) + [len(order)]
+            for chunkId, start, end in zip(ids, starts, ends):
+                with open(os.path.join(pathTmp, "chunk_{}.bin".format(chunkId)), "ab") as f:
+                    records[order[start:end]].tofile(f)
+
+        # 4. Chunk subtrees, then the nodes above them
+        build = _OctreeBuild(pathOut, pathTmp, cubeMin, size, dtype, budget)
+        for chunkId in range(len(chunkNames)):
+            pathChunk = os.path.join(pathTmp, "chunk_{}.bin".format(chunkId))
+            build.BuildSubtree(chunkNames[chunkId], np.fromfile(pathChunk, dtype=dtype), pending=True)
+            os.remove(pathChunk)
+        for name in sorted(ancestors, key=len, reverse=True):
+            build.BuildAncestor(name)
+        build.Flush()
+    finally:
+        shutil.rmtree(pathTmp)
+
+    hierarchy = {
+        "version": HIERARCHY_VERSION,
+        "pointCount": pointCount,
+        "budget": budget,
+        "boundingBox": [bbMin.tolist(), bbMax.tolist()],
+        "cube": [cubeMin.tolist(), size],
+        "nodes": sorted(build.nodes.values(), key=lambda node: (node["level"], node["name"])),
+    }
+    #written last: its presence marks a complete octree
+    pathHierarchy = os.path.join(pathOut, "hierarchy.json")
+    with open(pathHierarchy + ".tmp", "w") as f:
+        json.dump(hierarchy, f)
+    ReplaceFile(pathHierarchy + ".tmp", pathHierarchy)
+    return hierarchy
+
+def OctreeFromCloud(cloud, pathOut, budget=NODE_BUDGET, chunkBudget=CHUNK_BUDGET, chunkPoints=CHUNK_POINTS):
+    #in-memory cloud dict
+    def Chunks():
+        for start in range(0, len(cloud["points"]), chunkPoints):
+            yield dict((k, None if cloud[k] is None else cloud[k][start:start + chunkPoints])
+                       for k in ("points", "colors", "normals"))
+    return BuildOctree(Chunks, pathOut, budget, chunkBudget)
+
+def OctreeFromFile(path, pathOut, budget=NODE_BUDGET, chunkBudget=CHUNK_BUDGET, chunkPoints=CHUNK_POINTS):
+    #point cloud file streamed from disk, for clouds larger than memory
+    return BuildOctree(lambda: pcio.IterPointCloud(path, chunkPoints), pathOut, budget, chunkBudget)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Octree level of detail of a point cloud file")
+    parser.add_argument("cloud", help=".ply/.xyz/.3dm point cloud file")
+    parser.add_argument("output", help="output folder, e.g. catalogue/data/octree/<physicalObjectId>")
+    parser.add_argument("--budget", type=int, default=NODE_BUDGET, help="points per node")
+    parser.add_argument("--chunk-budget", dest="chunkBudget", type=int, default=CHUNK_BUDGET, help="points per in-memory chunk")
+    parser.add_argument("--chunk-points", dest="chunkPoints", type=int, default=CHUNK_POINTS, help="points read at once")
+    args = parser.parse_args(argv)
+    hierarchy = OctreeFromFile(args.cloud, args.output, args.budget, args.chunkBudget, args.chunkPoints)
+    print("{} points | {} nodes | depth {}".format(
+        hierarchy["pointCount"], len(hierarchy["nodes"]), max(node["level"] for node in hierarchy["nodes"])))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
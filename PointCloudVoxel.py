@@ -0,0 +1,172 @@
+"""Voxel grid downsampling of point clouds with NumPy.
+
+Voxels are aligned on multiples of voxelSize; each point gets an integer
+voxel key (at most 21 bits per axis packed in an int64) and the points are
+grouped by a stable sort of the keys. One point per occupied voxel is kept:
+- "first": the first point of the voxel in input order
+- "centroid": the mean of the voxel points (colours averaged, normals
+  averaged and normalized)
+- "nearest": the point nearest to the voxel centre (first one on ties)
+The output is ordered by the first input point of each voxel, so the
+result only depends on the input, whatever the chunking.
+
+VoxelDownsampleChunks streams the input as parts of bounded size, keeping
+one partial record per occupied voxel: memory grows with the output, not
+the input.
+
+VoxelPyramid downsamples to several voxel sizes with one sort of the
+points: a size that is an integer multiple of the previous one is reduced
+from the voxels of that level ("first" and "centroid" give the same result
+as from the points, up to the rounding of points lying on voxel faces;
+"nearest" and other sizes start from the points)."""
+
+import numpy as np
+
+KEY_BITS = 21
+KEY_RANGE = 1 << KEY_BITS
+MODES = ("first", "centroid", "nearest")
+
+def VoxelIndices(points, voxelSize):
+    return np.floor(points / voxelSize).astype(np.int64)
+
+def VoxelKeys(ijk, base, dims=(KEY_RANGE, KEY_RANGE, KEY_RANGE)):
+    """packed keys of the voxel indices, relative to base (int64 (3,)), in
+    a grid of dims voxels (at most 2^21 per axis)"""
+    rel = ijk - base
+    if max(dims) > KEY_RANGE or rel.size and (rel.min() < 0 or (rel >= np.asarray(dims)).any()):
+        raise ValueError("cloud spans more than 2^{} voxels along an axis".format(KEY_BITS))
+    return (rel[:, 0] * dims[1] + rel[:, 1]) * dims[2] + rel[:, 2]
+
+def _SortOrder(keys):
+    """rows sorted by key then row, and the sorted keys
+    (key and row packed in one int64 when they fit: a plain sort is much
+    faster than a stable argsort)"""
+    n = len(keys)
+    rowBits = max(int(n - 1).bit_length(), 1)
+    keyBits = int(keys.max()).bit_length()
+    if keyBits + rowBits <= 63:
+        packed = np.sort((keys << rowBits) | np.arange(n, dtype=np.int64))
+        return packed & ((1 << rowBits) - 1), packed >> rowBits
+    order = np.argsort(keys, kind="stable")
+    return order, keys[order]
+
+def _Partial(points, colors, normals, voxelSize, base, dims, start, mode):
+    #one record per point, in the layout of the per-voxel records
+    ijk = VoxelIndices(points, voxelSize)
+    state = {"key": VoxelKeys(ijk, base, dims), "idx": np.arange(start, start + len(points)), "ijk": ijk}
+    if mode == "centroid":
+        state["count"] = np.ones(len(points), dtype=np.int64)
+    state["p"] = points
+    if colors is not None: state["c"] = colors
+    if normals is not None: state["n"] = normals
+    if mode == "nearest":
+        center = (ijk + 0.5) * voxelSize
+        state["dist"] = ((points - center) ** 2).sum(axis=1)
+    return state
+
+def _Reduce(state, mode):
+    """one record per key; records of a key must be in input order by row
+    (true for a chunk, and for reduced records followed by the records of a
+    later chunk)"""
+    order, keys = _SortOrder(state["key"])
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    if mode == "centroid":
+        #sums per voxel, weighted by the point counts of the records
+        group = np.empty(len(keys), dtype=np.int64)
+        group[order] = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(keys)]))
+        out = {"key": keys[starts], "idx": state["idx"][order[starts]], "ijk": state["ijk"][order[starts]]}
+        out["count"] = np.bincount(group, state["count"], len(starts)).astype(np.int64)
+        for k in ("p", "c", "n"):
+            if k not in state: continue
+            values = state[k]
+            out[k] = np.column_stack([np.bincount(group, values[:, j], len(starts)) for j in range(3)])
+        return out
+    if mode == "nearest":
+        dist = state["dist"][order]
+        counts = np.diff(np.r_[starts, len(keys)])
+        candidate = dist == np.repeat(np.minimum.reduceat(dist, starts), counts)
+        #first candidate of each voxel
+        rank = np.where(candidate, np.arange(len(keys)), len(keys))
+        selected = order[np.minimum.reduceat(rank, starts)]
+    else:
+        selected = order[starts]
+    return dict((k, v[selected]) for k, v in state.items())
+
+def _Merge(state, part, mode):
+    if state is None: return _Reduce(part, mode)
+    return _Reduce(dict((k, np.concatenate([state[k], part[k]])) for k in state), mode)
+
+def _Finalize(state, mode):
+    #(points, colors, normals) in order of first input point
+    if state is None: return np.zeros((0, 3)), None, None
+    order = np.argsort(state["idx"])
+    points = state["p"][order]
+    colors = state["c"][order] if "c" in state else None
+    normals = state["n"][order] if "n" in state else None
+    if mode == "centroid":
+        count = state["count"][order][:, None]
+        points = points / count
+        if colors is not None: colors = np.clip(np.rint(colors / count), 0, 255).astype(np.uint8)
+        if normals is not None:
+            length = np.linalg.norm(normals, axis=1)[:, None]
+            normals = normals / np.where(length > 0, length, 1.0)
+    return points, colors, normals
+
+def VoxelDownsample(points, voxelSize, colors=None, normals=None, mode="first"):
+    """downsamples (N,3) points (and their colours/normals) to one point per
+    occupied voxel, returns (points, colors, normals)"""
+    if mode not in MODES: raise ValueError("unknown voxel selection: " + str(mode))
+    points = np.asarray(points, dtype=float)
+    if not len(points): return _Finalize(None, mode)
+    base = VoxelIndices(points.min(axis=0)[None, :], voxelSize)[0]
+    dims = tuple(VoxelIndices(points.max(axis=0)[None, :], voxelSize)[0] - base + 1)
+    state = _Reduce(_Partial(points, colors, normals, voxelSize, base, dims, 0, mode), mode)
+    return _Finalize(state, mode)
+
+def _Coarser(state, ratio):
+    #records of the voxels of a level, keyed on the voxels ratio times larger
+    order = np.argsort(state["idx"]) #input order of the records of a key
+    coarse = dict((k, v[order]) for k, v in state.items())
+    coarse["ijk"] = coarse["ijk"] // ratio
+    base = coarse["ijk"].min(axis=0)
+    coarse["key"] = VoxelKeys(coarse["ijk"], base, tuple(coarse["ijk"].max(axis=0) - base + 1))
+    return coarse
+
+def VoxelPyramid(points, voxelSizes, colors=None, normals=None, mode="first"):
+    """VoxelDownsample at every size of voxelSizes, in one pass over the
+    points when the sizes are integer multiples of each other
+    returns a list of (points, colors, normals), in the order of voxelSizes"""
+    if mode not in MODES: raise ValueError("unknown voxel selection: " + str(mode))
+    points = np.asarray(points, dtype=float)
+    levels = {}
+    state, previous = None, None
+    for voxelSize in sorted(set(voxelSizes)):
+        ratio = 0
+        if previous is not None: ratio = int(round(voxelSize / previous))
+        if state is not None and mode != "nearest" and ratio >= 1 and abs(voxelSize - ratio * previous) <= 1e-9 * voxelSize:
+            state = _Reduce(_Coarser(state, ratio), mode)
+        elif len(points):
+            base = VoxelIndices(points.min(axis=0)[None, :], voxelSize)[0]
+            dims = tuple(VoxelIndices(points.max(axis=0)[None, :], voxelSize)[0] - base + 1)
+            state = _Reduce(_Partial(points, colors, normals, voxelSize, base, dims, 0, mode), mode)
+        levels[voxelSize] = _Finalize(state, mode)
+        previous = voxelSize
+    return [levels[voxelSize] for voxelSize in voxelSizes]
+
+def VoxelDownsampleChunks(chunks, voxelSize, mode="first"):
+    """same as VoxelDownsample for a cloud given as an iterable of cloud
+    dicts (e.g. PointCloudIO.IterPointCloud), without holding the input"""
+    if mode not in MODES: raise ValueError("unknown voxel selection: " + str(mode))
+    state = None
+    base = None
+    start = 0
+    for cloud in chunks:
+        points = np.asarray(cloud["points"], dtype=float)
+        if not len(points): continue
+        if base is None:
+            #the grid is unknown ahead: centre the key range on the first part
+            base = VoxelIndices(points.min(axis=0)[None, :], voxelSize)[0] - KEY_RANGE // 2
+        part = _Partial(points, cloud["colors"], cloud["normals"], voxelSize, base, (KEY_RANGE,) * 3, start, mode)
+        state = _Merge(state, part, mode)
+        start += len(points)
+    return _Finalize(state, mode)
@@ -0,0 +1,205 @@
+"""Parallel Poisson meshing of point cloud files, headless counterpart of
+the Cockroach_MeshPoissonBatch command (open3d).
+
+Independent clouds are meshed concurrently in worker processes. A task is
+only started while the estimated memory of the running tasks stays within
+the budget (one task always runs). Every finished object is reported as
+an event with its elapsed time and mesh statistics, and recorded in
+<output>/poisson_batch.journal: a run that is cancelled (cancel callback,
+Ctrl-C) or interrupted resumes from there, skipping the objects already
+meshed with the same points and parameters.
+
+usage: python PoissonBatch.py OUTPUT_DIR CLOUD [CLOUD ...] [options]
+writes OUTPUT_DIR/<cloud name>_Mesh.ply"""
+
+import argparse
+import json
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import CatalogueCache as cacheTools
+import CatalogueCore as core
+import LocalBackend as local
+import MeshProperties as meshTools
+import PointCloudIO as pcio
+import PointCloudNormals as normalsTools
+
+# Rough memory model of a meshing task (cloud arrays, k-d tree, normals,
+# adaptive Poisson octree growing with the surface, i.e. 4^depth)
+BYTES_PER_POINT = 400
+BYTES_PER_OCTREE_CELL = 200
+BYTES_PER_TEXT_POINT = 40 #size of a point in text files, to guess their point count
+POLL_SECONDS = 0.2
+
+MESH_PARAMS = ["downsample", "normalsNeighbours", "normalsOrientation", "poisonMaxDepth", "poisonMinDepth", "poisonScale", "poissonLinear", "poissonAutoDepth", "poissonResolution"]
+
+def MeshPath(pathOut, path):
+    return os.path.join(pathOut, os.path.splitext(os.path.basename(path))[0] + "_Mesh.ply")
+
+def JournalPath(pathOut):
+    return os.path.join(pathOut, "poisson_batch.journal")
+
+def LoadJournal(pathOut):
+    """key -> event of the objects meshed by previous runs"""
+    entries = {}
+    if not os.path.exists(JournalPath(pathOut)): return entries
+    with open(JournalPath(pathOut)) as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                break #truncated last line
+            entries[event["key"]] = event
+    return entries
+
+def EstimateMemory(path, params):
+    """bytes needed to mesh a file, from its header (.ply) or its size"""
+    if os.path.splitext(path)[1].lower() == ".ply":
+        count = pcio.FileMetadata(path)["pointCount"]
+    else:
+        count = os.path.getsize(path) // BYTES_PER_TEXT_POINT
+    if params["downsample"] > 0: meshed = min(count, params["downsample"])
+    else: meshed = count
+    #auto depth: about one surface cell per poissonResolution^2 points
+    if params["poissonAutoDepth"]: cells = meshed / params["poissonResolution"] ** 2
+    else: cells = 4 ** params["poisonMaxDepth"]
+    return count * BYTES_PER_POINT + meshed * BYTES_PER_POINT + cells * BYTES_PER_OCTREE_CELL
+
+def MeshFile(task):
+    """worker: (path, pathMesh, params) -> mesh statistics"""
+    path, pathMesh, params = task
+    t = time.time()
+    if local.o3d is None: raise ImportError("open3d is required for Poisson meshing")
+    cloud = pcio.ReadPointCloud(path)
+    if cloud["normals"] is None:
+        cloud["normals"] = normalsTools.EstimateNormals(
+            cloud["points"], params["normalsNeighbours"], params["normalsOrientation"])
+    metadata = pcio.CloudMetadata(cloud)
+    spacing = None
+    if params["poissonAutoDepth"]: spacing = normalsTools.PointSpacing(cloud["points"], core.SPACING_SAMPLE)
+    meshParams = dict(params)
+    meshParams["poisonMaxDepth"] = core.PoissonDepth(spacing, metadata["boundingBox"], params)
+    vertices, faces = local.PoissonMesh(cloud, meshParams)
+    pcio.WritePlyMesh(pathMesh + ".tmp", vertices, faces)
+    cacheTools.ReplaceFile(pathMesh + ".tmp", pathMesh)
+    return {
+        "points": len(cloud["points"]),
+        "vertices": len(vertices),
+        "faces": len(faces),
+        "volume": meshTools.MeshProperties(vertices, faces)["volume"],
+        "depth": meshParams["poisonMaxDepth"],
+        "elapsed": time.time() - t,
+    }
+
+def _IgnoreInterrupt():
+    #Ctrl-C is handled by the scheduler, workers finish their object
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def IterPoissonBatch(paths, pathOut, params=None, workers=None, memoryBudget=None, cancel=None, mesher=MeshFile):
+    """meshes the files, yields one event per file as they complete:
+    {"path", "mesh", "status": "done"/"resumed"/"failed"/"cancelled",
+     "index", "total", and the mesh statistics or "error"}
+    memoryBudget: bytes (None: no limit); cancel: function returning True
+    to stop (running objects finish, the others are cancelled)"""
+    allParams = dict((k, core.DEFAULT_PARAMS[k]) for k in MESH_PARAMS)
+    allParams.update(dict((k, v) for k, v in (params or {}).items() if k in MESH_PARAMS))
+    if not os.path.exists(pathOut): os.makedirs(pathOut)
+    journalEntries = LoadJournal(pathOut)
+    total = len(paths)
+    counter = [0]
+
+    def Event(path, key, status, stats=None):
+        counter[0] += 1
+        event = {"path": path, "mesh": MeshPath(pathOut, path), "key": key, "status": status, "index": counter[0], "total": total}
+        event.update(stats or {})
+        return event
+
+    pending = deque()
+    for path in paths:
+        key = cacheTools.CacheKey(cacheTools.FileHash(path), allParams)
+        entry = journalEntries.get(key)
+        if entry is not None and os.path.exists(MeshPath(pathOut, path)):
+            stats = dict((k, entry[k]) for k in ("points", "vertices", "faces", "volume", "depth", "elapsed") if k in entry)
+            yield Event(path, key, "resumed", stats)
+        else:
+            pending.append((path, key, EstimateMemory(path, allParams)))
+
+    journal = open(JournalPath(pathOut), "a")
+    maxRunning = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=maxRunning, initializer=_IgnoreInterrupt)
+    running = {}
+    memoryUsed = 0
+    cancelled = False
+    try:
+        while pending or running:
+            if not cancelled and cancel is not None and cancel(): cancelled = True
+            # Start tasks within the memory budget
+            while not cancelled and pending and len(running) < maxRunning:
+                path, key, memory = pending[0]
+                if running and memoryBudget is not None and memoryUsed + memory > memoryBudget: break
+                pending.popleft()
+                future = executor.submit(mesher, (path, MeshPath(pathOut, path), allParams))
+                running[future] = (path, key, memory)
+                memoryUsed += memory
+            if cancelled:
+                while pending:
+                    path, key, memory = pending.popleft()
+                    yield Event(path, key, "cancelled")
+            if not running: continue
+            try:
+                done, unused = wait(list(running), timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+            except KeyboardInterrupt:
+                cancelled = True
+                continue
+            for future in done:
+                path, key, memory = running.pop(future)
+                memoryUsed -= memory
+                try:
+                    event = Event(path, key, "done", future.result())
+                except Exception as e:
+                    yield Event(path, key, "failed", {"error": repr(e)})
+                    continue
+                journal.write(json.dumps(event) + "\n")
+                journal.flush()
+                yield event
+    finally:
+        executor.shutdown(wait=True)
+        journal.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel Poisson meshing of point cloud files")
+    parser.add_argument("output", help="output folder of the meshes")
+    parser.add_argument("clouds", nargs="+", help=".ply/.xyz/.3dm point cloud files")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--memory-budget", dest="memoryBudget", type=float, default=None, help="GB for the running tasks")
+    parser.add_argument("--downsample", type=int, default=core.DEFAULT_PARAMS["downsample"])
+    parser.add_argument("--normals-neighbours", dest="normalsNeighbours", type=int, default=core.DEFAULT_PARAMS["normalsNeighbours"])
+    parser.add_argument("--normals-orientation", dest="normalsOrientation", choices=["centroid", "propagate"], default=core.DEFAULT_PARAMS["normalsOrientation"])
+    parser.add_argument("--poisson-max-depth", dest="poisonMaxDepth", type=int, default=core.DEFAULT_PARAMS["poisonMaxDepth"])
+    parser.add_argument("--poisson-min-depth", dest="poisonMinDepth", type=int, default=core.DEFAULT_PARAMS["poisonMinDepth"])
+    parser.add_argument("--poisson-scale", dest="poisonScale", type=float, default=core.DEFAULT_PARAMS["poisonScale"])
+    parser.add_argument("--poisson-linear", dest="poissonLinear", action="store_true")
+    parser.add_argument("--poisson-auto-depth", dest="poissonAutoDepth", action="store_true", help="depth fitted to the point spacing of every cloud")
+    parser.add_argument("--poisson-resolution", dest="poissonResolution", type=float, default=core.DEFAULT_PARAMS["poissonResolution"], help="auto depth: mesh cell size, in point spacings")
+    args = parser.parse_args(argv)
+
+    params = dict((k, getattr(args, k)) for k in MESH_PARAMS)
+    memoryBudget = None
+    if args.memoryBudget is not None: memoryBudget = int(args.memoryBudget * (1 << 30))
+    failed = 0
+    for event in IterPoissonBatch(args.clouds, args.output, params, args.workers, memoryBudget):
+        line = "[{}/{}] {} {}".format(event["index"], event["total"], event["path"], event["status"])
+        if "vertices" in event:
+            line += " | {:.1f}s | depth {} | {} vertices | {} faces | volume {}".format(
+                event["elapsed"], event.get("depth"), event["vertices"], event["faces"], event["volume"])
+        if "error" in event:
+            line += " | " + event["error"]
+            failed += 1
+        print(line)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
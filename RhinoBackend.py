@@ -0,0 +1,332 @@
+"""Rhino geometry backend of the catalogue core: point clouds of the active
+document processed with Cockroach commands, exported with Rhino (.3dm, Iris).
+Used by the CatalogueExporter command (IronPython).
+
+A source is the Guid of a point cloud object, the cloud/mesh/box handles are
+Guids of document objects."""
+
+import os
+import shutil
+import uuid
+
+import clr
+import System
+import System.Collections.Generic.IEnumerable as IEnumerable
+import Rhino
+
+import MeshBinary as pcm
+import MinimumBoundingBox as MinBBox
+import PointCloudBinary as pcb
+from CatalogueCore import SPACING_SAMPLE, GeometryBackend
+
+PATH_CATALOGUE_EXPORTER = os.path.dirname(os.path.realpath(__file__)) + "\\"
+
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+# SHA1 update with the raw bytes of an array of blittable structs (Point3d,
+# Vector3d): the array is pinned and copied to the hash block by block
+def _HashStructArray(sha, array, itemType, buf):
+    Marshal = System.Runtime.InteropServices.Marshal
+    handle = System.Runtime.InteropServices.GCHandle.Alloc(
+        array, System.Runtime.InteropServices.GCHandleType.Pinned)
+    try:
+        address = handle.AddrOfPinnedObject().ToInt64()
+        total = array.Length * Marshal.SizeOf(clr.GetClrType(itemType))
+        for offset in range(0, total, buf.Length):
+            size = min(buf.Length, total - offset)
+            Marshal.Copy(System.IntPtr(address + offset), buf, 0, size)
+            sha.TransformBlock(buf, 0, size, None, 0)
+    finally:
+        handle.Free()
+
+
+# SHA1 update with the ARGB values of a color array, block by block
+def _HashColorArray(sha, colors, buf):
+    count = buf.Length // 4
+    for start in range(0, colors.Length, count):
+        stop = min(start + count, colors.Length)
+        argb = System.Array[System.Int32]([colors[i].ToArgb() for i in range(start, stop)])
+        System.Buffer.BlockCopy(argb, 0, buf, 0, argb.Length * 4)
+        sha.TransformBlock(buf, 0, argb.Length * 4, None, 0)
+
+
+# Content hash of a geometry, hashed in .NET. Point clouds: points, colors
+# and normals hashed incrementally (no serialized copy of the cloud), other
+# geometry: serialized by RhinoCommon
+def GeometryHash(geometry):
+    sha = System.Security.Cryptography.SHA1.Create()
+    if isinstance(geometry, Rhino.Geometry.PointCloud):
+        buf = System.Array.CreateInstance(System.Byte, HASH_BLOCK_SIZE)
+        for value in (geometry.Count, geometry.ContainsColors, geometry.ContainsNormals):
+            header = System.BitConverter.GetBytes(value)
+            sha.TransformBlock(header, 0, header.Length, None, 0)
+        _HashStructArray(sha, geometry.GetPoints(), Rhino.Geometry.Point3d, buf)
+        if geometry.ContainsColors:
+            _HashColorArray(sha, geometry.GetColors(), buf)
+        if geometry.ContainsNormals:
+            _HashStructArray(sha, geometry.GetNormals(), Rhino.Geometry.Vector3d, buf)
+        sha.TransformFinalBlock(System.Array.CreateInstance(System.Byte, 0), 0, 0)
+        digest = sha.Hash
+    else:
+        digest = sha.ComputeHash(System.Text.Encoding.UTF8.GetBytes(
+            geometry.ToJSON(Rhino.FileIO.SerializationOptions())))
+    return System.BitConverter.ToString(digest).replace("-", "").lower()
+
+
+# Streamed copy of a JSON file behind a JS prefix (constant memory)
+def WrapJsonAsJs(pathJson, pathJs, prefix, blockSize=1 << 20):
+    with open(pathJson, "rb") as fJson:
+        with open(pathJs, "wb") as fJs:
+            fJs.write(prefix.encode("utf-8"))
+            shutil.copyfileobj(fJson, fJs, blockSize)
+
+
+class RhinoBackend(GeometryBackend):
+
+    def __init__(self, doc):
+        self.doc = doc
+
+    def DataHash(self, source):
+        return GeometryHash(self.doc.Objects.FindId(source).Geometry)
+
+    def ObjectId(self, source, label, cloud=None):
+        # Generate and set physicalObjectId to point cloud
+        objPC = self.doc.Objects.FindId(source)
+        physicalObjectId = objPC.Attributes.GetUserString("physicalObjectId")
+        if (physicalObjectId == None):
+            if (label != ""):
+                physicalObjectId = label + "_" + str(uuid.uuid4())
+            else:
+                physicalObjectId = str(uuid.uuid4())
+            objPC.Attributes.SetUserString("physicalObjectId", physicalObjectId)
+        return physicalObjectId
+
+    def LoadCloud(self, source):
+        return source
+
+    def Metadata(self, cloud):
+        # Read from the RhinoCommon point cloud, no command round-trip
+        pc = self.doc.Objects.FindId(cloud).Geometry
+        bbox = None
+        if (pc.Count > 0):
+            bb = pc.GetBoundingBox(True)
+            bbox = [[bb.Min.X, bb.Min.Y, bb.Min.Z], [bb.Max.X, bb.Max.Y, bb.Max.Z]]
+        return {
+            "pointCount": pc.Count,
+            "boundingBox": bbox,
+            "hasColors": pc.ContainsColors,
+            "hasNormals": pc.ContainsNormals,
+            "memoryBytes": int(pc.MemoryEstimate()),
+        }
+
+    def EstimateNormals(self, cloud, physicalObjectId, params, dataHash=None):
+        # Cockroach_MeshPoisson estimates the normals it needs
+        # (NormalsNeighbours), the document cloud is left unchanged
+        return cloud
+
+    def PointSpacing(self, cloud, params):
+        # Nearest neighbours of every n-th point, RhinoCommon RTree
+        points = self.doc.Objects.FindId(cloud).Geometry.GetPoints()
+        if (len(points) < 2):
+            return 0.0
+        step = max(1, len(points) // SPACING_SAMPLE)
+        needles = [points[i] for i in range(0, len(points), step)]
+        neighbours = Rhino.Geometry.RTree.Point3dKNeighbors(points, needles, 2)
+        distances = sorted(needle.DistanceTo(points[idx[1]]) for needle, idx in zip(needles, neighbours))
+        return distances[len(distances) // 2]
+
+    def PoissonMesh(self, cloud, physicalObjectId, params):
+        doc = self.doc
+        objMostRecent = doc.Objects.MostRecentObject()
+        doc.Objects.UnselectAll()
+        doc.Objects.Select(cloud)
+        Rhino.RhinoApp.RunScript(
+            "Cockroach_MeshPoisson"
+            + " Downsample="
+            + str(params["downsample"])
+            + " NormalsNeighbours="
+            + str(params["normalsNeighbours"])
+            + " PoisonMaxDepth="
+            + str(params["poisonMaxDepth"])
+            + " PoisonMinDepth="
+            + str(params["poisonMinDepth"])
+            + " PoisonScale="
+            + str(params["poisonScale"])
+            + " PoisonLinear="
+            + str(params["poissonLinear"])
+            + " -Enter"
+            + " -Enter"
+            + " -Cancel", True
+        )
+        objListLastCreated = doc.Objects.AllObjectsSince(
+            objMostRecent.RuntimeSerialNumber)
+        idMesh = None
+        for item in objListLastCreated:
+            if(item.ObjectType != Rhino.DocObjects.ObjectType.Mesh):
+                doc.Objects.Delete(item, True)
+            else:
+                item.Attributes.SetUserString("physicalObjectId", physicalObjectId)
+                idMesh = item.Id
+        return idMesh
+
+    def MeshProperties(self, mesh):
+        # RhinoCommon mass properties, unit density
+        geometry = self.doc.Objects.FindId(mesh).Geometry
+        vmp = Rhino.Geometry.VolumeMassProperties.Compute(geometry)
+        amp = Rhino.Geometry.AreaMassProperties.Compute(geometry)
+        manifold, oriented, hasBoundary = geometry.IsManifold(True)
+        c = vmp.Centroid
+        m = vmp.CentroidCoordinatesMomentsOfInertia
+        p = vmp.CentroidCoordinatesProductMoments #xy, yz, zx
+        return {
+            "volume": abs(vmp.Volume),
+            "area": amp.Area,
+            "centroid": [c.X, c.Y, c.Z],
+            "inertia": [[m.X, -p.X, -p.Z], [-p.X, m.Y, -p.Y], [-p.Z, -p.Y, m.Z]],
+            "watertight": bool(geometry.IsClosed and manifold and oriented),
+        }
+
+    def DecimateMesh(self, mesh, physicalObjectId, targetFaces, params):
+        # RhinoCommon mesh reduction of copies of the Poisson mesh
+        idsDecimated = []
+        for faces in targetFaces:
+            meshReduced = self.doc.Objects.FindId(mesh).Geometry.DuplicateMesh()
+            if (meshReduced.Faces.Count > faces):
+                meshReduced.Reduce(faces, True, 10, False)
+            attributes = Rhino.DocObjects.ObjectAttributes()
+            attributes.SetUserString("physicalObjectId", physicalObjectId)
+            idsDecimated.append(self.doc.Objects.AddMesh(meshReduced, attributes))
+        return idsDecimated
+
+    def VoxelDownsample(self, cloud, physicalObjectId, voxelSizes, params):
+        # One Cockroach pass per voxel size
+        idsDownsampled = []
+        for voxelSize in voxelSizes:
+            self.doc.Objects.UnselectAll()
+            self.doc.Objects.Select(cloud)
+            Rhino.RhinoApp.RunScript(
+                "Cockroach_VoxelDownsample"
+                + " VoxelSize="
+                + str(voxelSize)
+                + " -Enter", True
+            )
+            objPCDownsampled = self.doc.Objects.MostRecentObject()
+            objPCDownsampled.Attributes.SetUserString(
+                "physicalObjectId", physicalObjectId)
+            idsDownsampled.append(objPCDownsampled.Id)
+        return idsDownsampled
+
+    def MinBBox(self, cloud, physicalObjectId, params):
+        box, minBBoxVol, planar, boxId = MinBBox.BatchMinBB(
+            [[cloud]], hull_reduce = params["hullReduction"],
+            algorithm = params["minBBoxAlgorithm"],
+            pca_seed = params["minBBoxPcaSeed"])[0]
+        # Added here with its attributes, no lookup of the last doc object
+        attributes = Rhino.DocObjects.ObjectAttributes()
+        attributes.SetUserString("physicalObjectId", physicalObjectId)
+        if planar:
+            return self.doc.Objects.AddPolyline(box, attributes), minBBoxVol
+        return self.doc.Objects.AddBox(box, attributes), minBBoxVol
+
+    def Export(self, pathWebRoot, physicalObjectId, layers, params):
+        doc = self.doc
+        layers = [(suffix, objId) for suffix, objId in layers if objId != None]
+
+        # Arrange in layers
+        for suffix, objId in layers:
+            newLayer = Rhino.DocObjects.Layer()
+            newLayer.Name = suffix
+            doc.Layers.Add(newLayer)
+            obj = doc.Objects.Find(objId)
+            obj.Attributes.LayerIndex = doc.Layers.FindName(suffix).Index
+            obj.CommitChanges()
+
+        # Geometries export
+        path3dm = pathWebRoot + "data\\3dm\\"
+        if(not os.path.exists(path3dm)):
+            os.makedirs(path3dm)
+
+        artifacts = []
+        for suffix, objId in layers:
+            doc.Objects.UnselectAll()
+            doc.Objects.Select(objId)
+            Rhino.RhinoApp.RunScript(
+                "-Export \"" + path3dm
+                + physicalObjectId
+                + "_" + suffix
+                + ".3dm\" -Enter", True)
+            artifacts.append("data/3dm/" + physicalObjectId + "_" + suffix + ".3dm")
+
+        # Binary point clouds export (web viewer)
+        pathPcb = pathWebRoot + "data\\pcb\\"
+        if(not os.path.exists(pathPcb)):
+            os.makedirs(pathPcb)
+
+        for suffix, objId in layers:
+            pc = doc.Objects.Find(objId).Geometry
+            if (not isinstance(pc, Rhino.Geometry.PointCloud)):
+                continue
+            pcPoints = [(p.X, p.Y, p.Z) for p in pc.GetPoints()]
+            pcColors = None
+            if pc.ContainsColors:
+                pcColors = [(c.R, c.G, c.B) for c in pc.GetColors()]
+            pcNormals = None
+            if pc.ContainsNormals:
+                pcNormals = [(n.X, n.Y, n.Z) for n in pc.GetNormals()]
+            pcb.WritePcb(
+                pathPcb + physicalObjectId + "_" + suffix + ".pcb",
+                pcPoints, pcColors, pcNormals)
+            artifacts.append("data/pcb/" + physicalObjectId + "_" + suffix + ".pcb")
+
+        # Binary meshes export (web viewer)
+        pathPcm = pathWebRoot + "data\\pcm\\"
+        if(not os.path.exists(pathPcm)):
+            os.makedirs(pathPcm)
+
+        for suffix, objId in layers:
+            mesh = doc.Objects.Find(objId).Geometry
+            if (not isinstance(mesh, Rhino.Geometry.Mesh) or suffix == "MinBBox"):
+                continue
+            meshVertices = [(v.X, v.Y, v.Z) for v in mesh.Vertices]
+            meshFaces = []
+            for face in mesh.Faces:
+                meshFaces.append((face.A, face.B, face.C))
+                if (face.IsQuad):
+                    meshFaces.append((face.A, face.C, face.D))
+            pcm.WritePcm(
+                pathPcm + physicalObjectId + "_" + suffix + ".pcm",
+                meshVertices, meshFaces)
+            artifacts.append("data/pcm/" + physicalObjectId + "_" + suffix + ".pcm")
+
+        # Iris export, with the light mesh instead of the full one
+        irisLayers = layers
+        if ("Mesh_Decimated" in [suffix for suffix, objId in layers]):
+            irisLayers = [(suffix, objId) for suffix, objId in layers
+                if suffix != "Mesh" and not suffix.startswith("Mesh_Decimated_")]
+        pathIris = pathWebRoot + "data\\iris\\"
+        pathIrisData = pathIris + "data\\"
+        if(not os.path.exists(pathIrisData)):
+            os.makedirs(pathIrisData)
+
+        doc.Objects.UnselectAll()
+        doc.Objects.Select.Overloads[IEnumerable[System.Guid]](
+            [objId for suffix, objId in irisLayers])
+        pathIrisDataJson = pathIrisData + physicalObjectId + ".json"
+        Rhino.RhinoApp.RunScript(
+            "-Export \"" + pathIrisDataJson + "\" -Enter", True)
+
+        WrapJsonAsJs(pathIrisDataJson, pathIrisData + physicalObjectId + ".js", "var irisdata = ")
+        os.remove(pathIrisDataJson)
+
+        irisHtml = ""
+        with open(PATH_CATALOGUE_EXPORTER + "iris\\templates\\" + "templateUi.html") as f:
+            irisHtml = f.read()
+        irisHtml = irisHtml.replace("physicalObjectId", physicalObjectId)
+        with open(pathIris + physicalObjectId + ".html", "w") as f:
+            f.write(irisHtml)
+
+        artifacts.append("data/iris/data/" + physicalObjectId + ".js")
+        artifacts.append("data/iris/" + physicalObjectId + ".html")
+        return artifacts
@@ -0,0 +1,93 @@
+// Queries on the catalogue manifest written by the exporter
+// (data/manifest.json, see CatalogueManifest.py): items are stored column by
+// column in DataTree order, filters are binary searches and array slices.
+// Large catalogues: sharded by branch and page under data/manifest/.
+(function (global) {
+    "use strict";
+
+    function loadJson(url) {
+        return fetch(url)
+            .then(function (response) {
+                if (!response.ok) throw new Error(url + ": " + response.status);
+                return response.json();
+            })
+            .then(function (manifest) {
+                if (manifest.version !== 1) throw new Error("unsupported manifest version " + manifest.version);
+                return manifest;
+            });
+    }
+
+    function loadManifest(dataUrl) {
+        return loadJson(dataUrl + "manifest.json");
+    }
+
+    // Sharded manifest (data/manifest/): root index, then the pages of the
+    // visible branches only. Pages have the columns and sorted positions of
+    // the manifest, rangePositions and itemRow work on them.
+    function loadShardIndex(dataUrl) {
+        return loadJson(dataUrl + "manifest/index.json");
+    }
+
+    function loadBranchPages(dataUrl, index, branch) {
+        var entry = index.branches[branch];
+        if (!entry) return Promise.resolve([]);
+        return Promise.all(entry.shards.map(function (name) {
+            return loadJson(dataUrl + "manifest/" + name);
+        }));
+    }
+
+    // Item positions of a branch (descendants included)
+    function branchPositions(manifest, branch) {
+        var range = manifest.branches[branch];
+        var positions = [];
+        if (!range) return positions;
+        for (var i = range[0]; i < range[1]; i++) positions.push(i);
+        return positions;
+    }
+
+    // First index of the sorted positions whose value is >= value (or > value)
+    function lowerBound(values, sorted, value, strict) {
+        var lo = 0, hi = sorted.length;
+        while (lo < hi) {
+            var mid = (lo + hi) >> 1;
+            var v = values[sorted[mid]];
+            if (v < value || (strict && v === value)) lo = mid + 1;
+            else hi = mid;
+        }
+        return lo;
+    }
+
+    // Item positions with min <= column value <= max, by increasing value
+    // (null bounds: open range)
+    function rangePositions(manifest, column, min, max) {
+        var values = manifest.columns[column];
+        var sorted = manifest.sorted[column];
+        var start = min === null ? 0 : lowerBound(values, sorted, min, false);
+        var stop = max === null ? sorted.length : lowerBound(values, sorted, max, true);
+        return sorted.slice(start, stop);
+    }
+
+    // Range filter restricted to a branch: a position test, no scan
+    function branchRangePositions(manifest, branch, column, min, max) {
+        var range = manifest.branches[branch];
+        if (!range) return [];
+        return rangePositions(manifest, column, min, max).filter(function (i) {
+            return i >= range[0] && i < range[1];
+        });
+    }
+
+    // Row object of an item position, keyed by CSV column
+    function itemRow(manifest, position) {
+        var row = { item: manifest.items[position] };
+        for (var column in manifest.columns) row[column] = manifest.columns[column][position];
+        return row;
+    }
+
+    global.loadManifest = loadManifest;
+    global.loadShardIndex = loadShardIndex;
+    global.loadBranchPages = loadBranchPages;
+    global.branchPositions = branchPositions;
+    global.rangePositions = rangePositions;
+    global.branchRangePositions = branchRangePositions;
+    global.itemRow = itemRow;
+})(typeof window !== "undefined" ? window : this);
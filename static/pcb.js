@@ -0,0 +1,93 @@
+// Reader for the binary point clouds written by the catalogue exporter
+// (data/pcb/<physicalObjectId>_<layer>.pcb, see PointCloudBinary.py).
+// All arrays are typed-array views on the downloaded buffer, no parsing.
+(function (global) {
+    "use strict";
+
+    var FLAG_COLORS = 1;
+    var FLAG_NORMALS = 2;
+    var HEADER_SIZE = 64;
+
+    function readPcb(buffer) {
+        var view = new DataView(buffer);
+        var magic = String.fromCharCode(
+            view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+        if (magic !== "CEPC") throw new Error("not a .pcb point cloud");
+        var version = view.getUint16(4, true);
+        if (version !== 1) throw new Error("unsupported .pcb version " + version);
+        var flags = view.getUint16(6, true);
+        var count = view.getUint32(8, true);
+        var bboxMin = new Float64Array(buffer, 16, 3);
+        var bboxMax = new Float64Array(buffer, 40, 3);
+        var offset = HEADER_SIZE;
+        var cloud = {
+            count: count,
+            bboxMin: bboxMin,
+            bboxMax: bboxMax,
+            // p = bboxMin + (q + 32768) * (bboxMax - bboxMin) / 65535
+            positions: new Int16Array(buffer, offset, 3 * count),
+            colors: null,
+            normals: null
+        };
+        offset += 6 * count;
+        if (flags & FLAG_COLORS) {
+            cloud.colors = new Uint8Array(buffer, offset, 3 * count);
+            offset += 3 * count;
+        }
+        if (flags & FLAG_NORMALS) {
+            // n = q / 127
+            cloud.normals = new Int8Array(buffer, offset, 3 * count);
+        }
+        return cloud;
+    }
+
+    // Float32 positions for viewers without int16 attribute support
+    function pcbPositions(cloud) {
+        var out = new Float32Array(3 * cloud.count);
+        var scale = [0, 1, 2].map(function (k) {
+            return (cloud.bboxMax[k] - cloud.bboxMin[k]) / 65535;
+        });
+        for (var i = 0; i < out.length; i++) {
+            var k = i % 3;
+            out[i] = cloud.bboxMin[k] + (cloud.positions[i] + 32768) * scale[k];
+        }
+        return out;
+    }
+
+    function loadPcb(url) {
+        return fetch(url)
+            .then(function (response) {
+                if (!response.ok) throw new Error(url + ": " + response.status);
+                return response.arrayBuffer();
+            })
+            .then(readPcb);
+    }
+
+    // Octree level of detail (data/octree/<physicalObjectId>/, see
+    // PointCloudOctree.py): calls onNode(node, cloud) for every node, coarse
+    // to fine, up to maxLevel; resolves with the hierarchy
+    function loadPcbOctree(baseUrl, onNode, maxLevel) {
+        if (baseUrl.charAt(baseUrl.length - 1) !== "/") baseUrl += "/";
+        return fetch(baseUrl + "hierarchy.json")
+            .then(function (response) {
+                if (!response.ok) throw new Error(baseUrl + "hierarchy.json: " + response.status);
+                return response.json();
+            })
+            .then(function (hierarchy) {
+                var nodes = hierarchy.nodes.filter(function (node) {
+                    return maxLevel === undefined || node.level <= maxLevel;
+                });
+                // nodes are listed by level: load them in that order
+                return nodes.reduce(function (previous, node) {
+                    return previous
+                        .then(function () { return loadPcb(baseUrl + node.name + ".pcb"); })
+                        .then(function (cloud) { onNode(node, cloud); });
+                }, Promise.resolve()).then(function () { return hierarchy; });
+            });
+    }
+
+    global.readPcb = readPcb;
+    global.loadPcbOctree = loadPcbOctree;
+    global.pcbPositions = pcbPositions;
+    global.loadPcb = loadPcb;
+})(typeof window !== "undefined" ? window : this);
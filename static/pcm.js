@@ -0,0 +1,58 @@
+// Reader for the binary meshes written by the catalogue exporter
+// (data/pcm/<physicalObjectId>_<layer>.pcm, see MeshBinary.py).
+// All arrays are typed-array views on the downloaded buffer, no parsing.
+(function (global) {
+    "use strict";
+
+    var FLAG_UINT32 = 1;
+    var HEADER_SIZE = 64;
+
+    function readPcm(buffer) {
+        var view = new DataView(buffer);
+        var magic = String.fromCharCode(
+            view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+        if (magic !== "CEPM") throw new Error("not a .pcm mesh");
+        var version = view.getUint16(4, true);
+        if (version !== 1) throw new Error("unsupported .pcm version " + version);
+        var flags = view.getUint16(6, true);
+        var count = view.getUint32(8, true);
+        var faceCount = view.getUint32(12, true);
+        var offset = HEADER_SIZE + 6 * count;
+        offset += (4 - offset % 4) % 4;
+        return {
+            count: count,
+            faceCount: faceCount,
+            bboxMin: new Float64Array(buffer, 16, 3),
+            bboxMax: new Float64Array(buffer, 40, 3),
+            // p = bboxMin + (q + 32768) * (bboxMax - bboxMin) / 65535,
+            // pcbPositions (pcb.js) converts them to Float32
+            positions: new Int16Array(buffer, HEADER_SIZE, 3 * count),
+            // vertex indices, 3 per face
+            indices: (flags & FLAG_UINT32)
+                ? new Uint32Array(buffer, offset, 3 * faceCount)
+                : new Uint16Array(buffer, offset, 3 * faceCount)
+        };
+    }
+
+    function loadPcm(url) {
+        return fetch(url)
+            .then(function (response) {
+                if (!response.ok) throw new Error(url + ": " + response.status);
+                return response.arrayBuffer();
+            })
+            .then(readPcm);
+    }
+
+    // Mesh of a catalogue object for display: the decimated mesh, or the
+    // full resolution mesh when there is none (dataUrl: "data/")
+    function loadCatalogueMesh(dataUrl, physicalObjectId) {
+        var base = dataUrl + "pcm/" + physicalObjectId;
+        return loadPcm(base + "_Mesh_Decimated.pcm").catch(function () {
+            return loadPcm(base + "_Mesh.pcm");
+        });
+    }
+
+    global.readPcm = readPcm;
+    global.loadPcm = loadPcm;
+    global.loadCatalogueMesh = loadCatalogueMesh;
+})(typeof window !== "undefined" ? window : this);
@@ -0,0 +1,81 @@
+"""Timings of the headless modules, not collected by pytest:
+
+    python tests/benchmarks.py [name ...]"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import MeshDecimation as decimation
+import MinimumBoundingBoxNp as MinBBoxNp
+import MeshProperties as meshTools
+import PointCloudVoxel as voxel
+from test_catalogue import RandomClouds
+
+def BenchmarkVoxel(count=10000000, voxelSize=0.002, seed=0):
+    """timing of the three modes on a random surface cloud, in memory and
+    in chunks of 1M points"""
+    rng = np.random.default_rng(seed)
+    points = rng.normal(size=(count, 3))
+    points *= 0.3 / np.linalg.norm(points, axis=1)[:, None]
+    colors = rng.integers(0, 256, (count, 3)).astype(np.uint8)
+    for mode in voxel.MODES:
+        t = time.time()
+        out = voxel.VoxelDownsample(points, voxelSize, colors, mode=mode)[0]
+        inMemory = time.time() - t
+        t = time.time()
+        parts = ({"points": points[i:i + 1000000], "colors": colors[i:i + 1000000], "normals": None}
+                 for i in range(0, count, 1000000))
+        chunked = voxel.VoxelDownsampleChunks(parts, voxelSize, mode)[0]
+        print("{:8s} {} -> {} points | {:.2f}s in memory | {:.2f}s in chunks | same: {}".format(
+            mode, count, len(out), inMemory, time.time() - t, np.allclose(out, chunked)))
+    voxelSizes = [voxelSize / 2, voxelSize, voxelSize * 4, voxelSize * 16]
+    for mode in voxel.MODES:
+        t = time.time()
+        for size in voxelSizes: voxel.VoxelDownsample(points, size, colors, mode=mode)
+        separate = time.time() - t
+        t = time.time()
+        levels = voxel.VoxelPyramid(points, voxelSizes, colors, mode=mode)
+        print("{:8s} pyramid {} | {:.2f}s separate | {:.2f}s pyramid".format(
+            mode, [len(level[0]) for level in levels], separate, time.time() - t))
+
+def BenchmarkDecimation(subdivisions=7, targetFaces=5000):
+    """decimation of a fine sphere: face count, largest distance of the
+    vertices to the sphere, relative volume error, closed, seconds"""
+    vertices, faces = decimation.Icosphere(subdivisions)
+    t = time.time()
+    outVertices, outFaces = decimation.DecimateMesh(vertices, faces, targetFaces)
+    elapsed = time.time() - t
+    properties = meshTools.MeshProperties(outVertices, outFaces)
+    print("{} -> {} faces | max. distance {:.5f} | volume error {:.5f} | closed {} | {:.2f}s".format(
+        len(faces), len(outFaces), np.abs(np.linalg.norm(outVertices, axis=1) - 1).max(),
+        abs(properties["volume"] / (4 * np.pi / 3) - 1), properties["watertight"], elapsed))
+
+def BenchmarkBatchMinBB(nbClouds=16, nbPoints=5000, workers=None, seed=2):
+    """BatchMinBB against one MinBBPoints call per cloud (fresh grids)"""
+    clouds = list(RandomClouds(nbClouds, nbPoints, seed))
+    t = time.time()
+    volumes = []
+    for points in clouds:
+        MinBBoxNp._GRIDS.clear()
+        volumes.append(MinBBoxNp.MinBBPoints(points, hull_reduce=True)[1])
+    loop = time.time() - t
+    t = time.time()
+    boxes = MinBBoxNp.BatchMinBB(clouds, workers, hull_reduce=True)
+    print("one call per cloud: {:.2f}s | batch: {:.2f}s | max. volume diff. {:.2e}".format(
+        loop, time.time() - t, np.max(np.abs(boxes["volumes"] / volumes - 1.0))))
+
+BENCHMARKS = {
+    "batchminbb": BenchmarkBatchMinBB,
+    "decimation": BenchmarkDecimation,
+    "voxel": BenchmarkVoxel,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or sorted(BENCHMARKS):
+        print("== " + name)
+        BENCHMARKS[name]()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+#modules are flat at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
@@ -0,0 +1,634 @@
+"""Checks of the headless modules against known results (run with pytest
+from the repository root). Rhino-only modules are not covered here."""
+
+import json
+import math
+import os
+
+import numpy as np
+import pytest
+
+import CatalogueCore as core
+import GeometryTools as gt
+import MinimumBoundingBoxNp as MinBBoxNp
+
+def RandomRotation(rng):
+    return MinBBoxNp.RotationMatrices(rng.uniform(0, math.pi), rng.normal(size=3))[0]
+
+def RandomClouds(nbClouds, nbPoints, seed):
+    #random anisotropic, randomly rotated clouds (every other one boxier)
+    rng = np.random.RandomState(seed)
+    for k in range(nbClouds):
+        points = rng.normal(size=(nbPoints, 3)) * rng.uniform(0.2, 3.0, 3)
+        if k % 2: points = np.sign(points) * np.abs(points) ** 0.5
+        yield points.dot(RandomRotation(rng).T)
+
+def BoxClouds(nbClouds, nbPoints, seed):
+    #points inside randomly rotated boxes, corners included: (points, volume)
+    rng = np.random.RandomState(seed)
+    for k in range(nbClouds):
+        size = rng.uniform(0.5, 3.0, 3)
+        corners = np.array([[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype=float)
+        points = np.r_[corners, rng.uniform(size=(nbPoints, 3))] * size
+        yield points.dot(RandomRotation(rng).T) + rng.normal(size=3), float(np.prod(size))
+
+# Minimum bounding box
+
+def test_min_area_rectangle_calipers():
+    rng = np.random.RandomState(0)
+    for k in range(20):
+        pts = (rng.normal(size=(200, 2)) * rng.uniform(0.2, 3.0, 2)).tolist()
+        area = gt.MinAreaRectangle2D(pts)[0]
+        #brute force: every hull edge direction
+        hull = [pts[i] for i in gt.ConvexHull2D(pts)]
+        areas = []
+        for i in range(len(hull)):
+            u = np.subtract(hull[(i + 1) % len(hull)], hull[i])
+            u /= np.linalg.norm(u)
+            local = np.dot(hull, np.array([u, [-u[1], u[0]]]).T)
+            areas.append(np.prod(np.ptp(local, axis=0)))
+        assert area == pytest.approx(min(areas), rel=1e-12)
+    #rotated rectangle with inner points
+    angle = 0.3
+    u, v = np.array([math.cos(angle), math.sin(angle)]), np.array([-math.sin(angle), math.cos(angle)])
+    pts = [tuple(a * 2.0 * u + b * 0.5 * v) for a, b in rng.uniform(size=(100, 2))]
+    pts += [tuple(a * 2.0 * u + b * 0.5 * v) for a in (0, 1) for b in (0, 1)]
+    assert gt.MinAreaRectangle2D(pts)[0] == pytest.approx(1.0, rel=1e-12)
+
+def test_min_area_rectangle_degenerate():
+    assert gt.MinAreaRectangle2D([])[0] == 0.0
+    assert gt.MinAreaRectangle2D([(0, 0), (0, 0), (0, 0)]) == (0.0, (1.0, 0.0), (0.0, 0.0, 0.0, 0.0))
+    area, u, ext = gt.MinAreaRectangle2D([(0, 0), (1, 1), (1, 1), (0, 0)])
+    assert area == 0.0 and ext[1] - ext[0] == pytest.approx(math.sqrt(2))
+    assert gt.MinAreaRectangle2D([(0, 0), (2, 0), (2, 1), (0, 1), (0, 0), (2, 1)])[0] == pytest.approx(2.0)
+
+def test_hullface_pure_python_equivalence():
+    #same hull face search in NumPy and in pure Python (IronPython engine)
+    for points in RandomClouds(6, 500, 0):
+        points = MinBBoxNp.HullReduce(points)
+        plane, volume = MinBBoxNp.MinBoxHullFaces(points)
+        volumePy, axes = gt.MinBoxHullFaces(points.tolist())
+        assert volume == pytest.approx(volumePy, rel=1e-9)
+        assert MinBBoxNp.BoxVolume(MinBBoxNp.BoundingBoxPlane(points, plane)) == pytest.approx(volume, rel=1e-9)
+
+def test_min_bbox_engines_find_boxes():
+    #the minimum box of a box is the box: one of its faces is a hull face,
+    #sampling is a heuristic and never goes below it
+    for points, volume in BoxClouds(6, 2000, 1):
+        assert MinBBoxNp.MinBBPoints(points, hull_reduce=True, algorithm="hullface")[1] == pytest.approx(volume, rel=1e-9)
+        assert MinBBoxNp.MinBBPoints(points, hull_reduce=True)[1] >= volume * (1 - 1e-9)
+
+@pytest.mark.parametrize("scale", [1.0, 0.05, 0.02])
+def test_seeded_search_never_worse(scale):
+    #seeded volumes are never above the World XY + octant grid ones, at any
+    #scale (stones in metres: volumes far below the length tolerance)
+    for points in RandomClouds(12, 3000, 1):
+        points = MinBBoxNp.HullReduce(points * scale)
+        assert gt.HullVolume(points.tolist()) == pytest.approx(MinBBoxNp.HullVolume(points), rel=1e-9)
+        volume = MinBBoxNp.MinBBPoints(points)[1]
+        assert MinBBoxNp.MinBBPoints(points, pca_seed=True)[1] <= volume
+
+@pytest.mark.parametrize("scale", [1.0, 0.02])
+def test_seeded_search_skips_octant_for_boxes(scale):
+    #the seed box is the hull: the octant pass is skipped
+    for points, volume in BoxClouds(4, 2000, 3):
+        points = points * scale
+        MinBBoxNp.STATS["evaluations"] = 0
+        MinBBoxNp.MinBBPoints(points, hull_reduce=True)
+        evaluations = MinBBoxNp.STATS["evaluations"]
+        MinBBoxNp.STATS["evaluations"] = 0
+        assert MinBBoxNp.MinBBPoints(points, hull_reduce=True, pca_seed=True)[1] == pytest.approx(volume * scale ** 3, rel=1e-4)
+        assert MinBBoxNp.STATS["evaluations"] < evaluations
+
+def test_batch_min_bbox():
+    #same boxes as one call per cloud, corners of the batch arrays
+    clouds = list(RandomClouds(6, 2000, 2))
+    boxes = MinBBoxNp.BatchMinBB(clouds, workers=2, hull_reduce=True)
+    corners = MinBBoxNp.BatchCorners(boxes)
+    for k, points in enumerate(clouds):
+        box, volume, passes = MinBBoxNp.MinBBPoints(points, hull_reduce=True)
+        assert boxes["volumes"][k] == pytest.approx(volume, rel=1e-12)
+        np.testing.assert_allclose(corners[k], MinBBoxNp.BoxCorners(box), atol=1e-9)
+
+# Octree
+
+def CheckOctree(pathOut, points=None):
+    """consistency of a written octree: every point once, nodes within
+    budget (except at MAX_DEPTH) and inside their cube
+    returns a list of errors, empty if none"""
+    import PointCloudBinary as pcb
+    import PointCloudOctree as octree
+    with open(os.path.join(pathOut, "hierarchy.json")) as f:
+        hierarchy = json.load(f)
+    cubeMin, size = np.array(hierarchy["cube"][0]), hierarchy["cube"][1]
+    errors = []
+    clouds = []
+    names = set(node["name"] for node in hierarchy["nodes"])
+    for node in hierarchy["nodes"]:
+        cloud = pcb.ReadPcb(os.path.join(pathOut, node["name"] + ".pcb"))
+        if len(cloud["points"]) != node["count"]: errors.append(node["name"] + ": count")
+        if node["count"] > hierarchy["budget"] and node["level"] <= octree.MAX_DEPTH: errors.append(node["name"] + ": budget")
+        for octant in range(8):
+            if bool(node["children"] & (1 << octant)) != ((node["name"] + str(octant)) in names):
+                errors.append(node["name"] + ": children mask")
+        nodeMin, nodeSize = cubeMin, size
+        for digit in node["name"][1:]:
+            nodeMin, nodeSize = octree._ChildCube(nodeMin, nodeSize, int(digit))
+        tol = 1e-6 * size + nodeSize / 65535.0
+        if node["count"] and ((cloud["points"] < nodeMin - tol).any() or (cloud["points"] > nodeMin + nodeSize + tol).any()):
+            errors.append(node["name"] + ": outside its cube")
+        clouds.append(cloud["points"])
+    allPoints = np.concatenate(clouds)
+    if len(allPoints) != hierarchy["pointCount"]: errors.append("point count")
+    if points is not None and len(allPoints) == len(points):
+        #same coordinates up to the quantization of the nodes (sorting per
+        #axis keeps the distance between the sorted values within that bound)
+        if np.abs(np.sort(allPoints, axis=0) - np.sort(points, axis=0)).max() > size / 65535.0:
+            errors.append("points differ")
+    return errors
+
+def test_octree_from_file_and_cloud(tmp_path):
+    import PointCloudBinary as pcb
+    import PointCloudIO as pcio
+    import PointCloudOctree as octree
+    rng = np.random.RandomState(4)
+    points = rng.normal(size=(30000, 3))
+    colors = rng.randint(0, 256, size=(30000, 3))
+    path = str(tmp_path / "cloud.xyz")
+    np.savetxt(path, np.column_stack((points, colors)))
+    #streamed from the file (command line)
+    pathFile = str(tmp_path / "file")
+    hierarchy = octree.OctreeFromFile(path, pathFile, budget=2000, chunkBudget=8000, chunkPoints=5000)
+    assert hierarchy["pointCount"] == len(points)
+    assert CheckOctree(pathFile, points) == []
+    #in-memory cloud with normals (catalogue export): same nodes
+    cloud = pcio.ReadPointCloud(path)
+    cloud["normals"] = points / np.linalg.norm(points, axis=1)[:, None]
+    pathCloud = str(tmp_path / "cloud")
+    assert octree.OctreeFromCloud(cloud, pathCloud, budget=2000, chunkBudget=8000, chunkPoints=5000)["nodes"] == hierarchy["nodes"]
+    assert CheckOctree(pathCloud, points) == []
+    root = pcb.ReadPcb(os.path.join(pathCloud, "r.pcb"))
+    directions = root["points"] / np.linalg.norm(root["points"], axis=1)[:, None]
+    assert (directions * root["normals"]).sum(axis=1).min() > 0.99
+
+# Voxel downsampling
+
+VOXEL_POINTS = np.array([
+    [0.1, 0.1, 0.1], [0.9, 0.9, 0.9], [0.6, 0.4, 0.5], #voxel (0,0,0), centre 0.5
+    [1.2, 0.2, 0.2], [1.4, 0.4, 0.4],                  #voxel (1,0,0)
+    [-0.5, 0.5, 0.5],                                  #voxel (-1,0,0)
+])
+VOXEL_COLORS = np.array([[0, 0, 0], [30, 30, 30], [60, 60, 60], [10, 20, 30], [20, 40, 60], [255, 255, 255]], dtype=np.uint8)
+VOXEL_EXPECTED = {
+    "first": [[0.1, 0.1, 0.1], [1.2, 0.2, 0.2], [-0.5, 0.5, 0.5]],
+    "centroid": [[1.6 / 3, 1.4 / 3, 1.5 / 3], [1.3, 0.3, 0.3], [-0.5, 0.5, 0.5]],
+    "nearest": [[0.6, 0.4, 0.5], [1.4, 0.4, 0.4], [-0.5, 0.5, 0.5]],
+}
+
+@pytest.mark.parametrize("mode", ["first", "centroid", "nearest"])
+def test_voxel_reference(mode):
+    import PointCloudVoxel as voxel
+    points, colors = VOXEL_POINTS, VOXEL_COLORS
+    out, outColors, unused = voxel.VoxelDownsample(points, 1.0, colors, mode=mode)
+    np.testing.assert_allclose(out, VOXEL_EXPECTED[mode])
+    #same result from parts of the cloud
+    parts = [{"points": points[i:i + 2], "colors": colors[i:i + 2], "normals": None} for i in range(0, 6, 2)]
+    chunked, chunkedColors, unused = voxel.VoxelDownsampleChunks(parts, 1.0, mode)
+    np.testing.assert_allclose(chunked, out)
+    np.testing.assert_array_equal(chunkedColors, outColors)
+    #pyramid levels match separate downsamplings
+    sizes = [2.0, 1.0, 0.5]
+    for level, voxelSize in zip(voxel.VoxelPyramid(points, sizes, colors, mode=mode), sizes):
+        reference = voxel.VoxelDownsample(points, voxelSize, colors, mode=mode)
+        np.testing.assert_allclose(level[0], reference[0])
+        np.testing.assert_array_equal(level[1], reference[1])
+
+def test_voxel_centroid_colors():
+    import PointCloudVoxel as voxel
+    colors = voxel.VoxelDownsample(VOXEL_POINTS, 1.0, VOXEL_COLORS, mode="centroid")[1]
+    assert colors.tolist() == [[30, 30, 30], [15, 30, 45], [255, 255, 255]]
+
+# Normals
+
+def test_normals_sphere():
+    import PointCloudNormals as normalsTools
+    rng = np.random.default_rng(0)
+    exact = rng.normal(size=(20000, 3))
+    exact /= np.linalg.norm(exact, axis=1)[:, None]
+    points = exact + rng.normal(scale=0.002, size=exact.shape)
+    cos = (normalsTools.EstimateNormals(points, 30, "propagate") * exact).sum(axis=1)
+    assert np.abs(cos).mean() > 0.999
+    #propagation orients all the normals the same way (outward)
+    assert (cos > 0).all()
+
+def test_normals_cache_reuses_data_hash(tmp_path, monkeypatch):
+    import CatalogueCache as cacheTools
+    import CatalogueCore as core
+    from LocalBackend import LocalBackend
+    rng = np.random.RandomState(5)
+    sources = []
+    for k in range(2):
+        sources.append(str(tmp_path / "cloud{}.xyz".format(k)))
+        np.savetxt(sources[-1], rng.normal(size=(2000, 3)))
+    hashed = []
+    fileHash = cacheTools.FileHash
+    monkeypatch.setattr(cacheTools, "FileHash", lambda path: hashed.append(path) or fileHash(path))
+    pathWebRoot = str(tmp_path / "catalogue")
+    for folder in ("3dm", "pcb", "pcm"):
+        os.makedirs(os.path.join(pathWebRoot, "data", folder))
+    backend = LocalBackend(os.path.join(pathWebRoot, "data", "cache", "normals"))
+    rows = core.ExportCatalogue(backend, sources, pathWebRoot, {"meshTargetFaces": [], "octreeBudget": 0})
+    assert len(rows) == 2
+    assert sorted(hashed) == sorted(sources)
+    assert len(os.listdir(os.path.join(pathWebRoot, "data", "cache", "normals"))) == 2
+
+# Mesh decimation and binary meshes
+
+def test_decimation_sphere():
+    import MeshDecimation as decimation
+    import MeshProperties as meshTools
+    vertices, faces = decimation.Icosphere(5)
+    outVertices, outFaces = decimation.DecimateMesh(vertices, faces, 2000)
+    assert len(outFaces) <= 2000
+    assert np.abs(np.linalg.norm(outVertices, axis=1) - 1).max() < 0.005
+    properties = meshTools.MeshProperties(outVertices, outFaces)
+    assert properties["watertight"]
+    assert properties["volume"] == pytest.approx(4 * math.pi / 3, rel=0.005)
+
+def test_pcm_round_trip():
+    import MeshBinary as pcm
+    import MeshDecimation as decimation
+    vertices, faces = decimation.Icosphere(3)
+    mesh = pcm.DecodePcm(pcm.EncodePcm(vertices, faces))
+    np.testing.assert_array_equal(mesh["faces"], faces)
+    assert np.abs(mesh["vertices"] - vertices).max() <= 2.0 / 65535
+    #pure Python encoding, same bytes
+    assert pcm.EncodePcm(vertices.tolist(), faces.tolist()) == pcm.EncodePcm(vertices, faces)
+
+def test_pcb_round_trip(tmp_path, monkeypatch):
+    import PointCloudBinary as pcb
+    rng = np.random.RandomState(7)
+    points = rng.normal(size=(1000, 3)) * [1.0, 0.1, 3.0] + 100.0
+    colors = rng.randint(0, 256, size=(1000, 3)).astype(np.uint8)
+    normals = rng.normal(size=(1000, 3))
+    normals /= np.linalg.norm(normals, axis=1)[:, None]
+    path = str(tmp_path / "cloud.pcb")
+    pcb.WritePcb(path, points, colors, normals)
+    cloud = pcb.ReadPcb(path)
+    #positions within half a quantization step of the bbox
+    step = np.ptp(points, axis=0) / 65535
+    assert (np.abs(cloud["points"] - points) <= step / 2 + 1e-9).all()
+    np.testing.assert_array_equal(cloud["colors"], colors)
+    assert np.abs(cloud["normals"] - normals).max() <= 0.5 / 127 + 1e-9
+    #pure Python encoding, same bytes
+    data = pcb.EncodePcb(points, colors, normals)
+    assert pcb.EncodePcb(points.tolist(), colors.tolist(), normals.tolist()) == data
+    assert pcb.EncodePcb(points.tolist()) == pcb.EncodePcb(points)
+    #pure Python decoding, same values
+    monkeypatch.setattr(pcb, "np", None)
+    pure = pcb.DecodePcb(data)
+    np.testing.assert_allclose(pure["points"], cloud["points"], rtol=0, atol=1e-12)
+    assert [list(c) for c in pure["colors"]] == colors.tolist()
+    np.testing.assert_allclose(pure["normals"], cloud["normals"], rtol=0, atol=1e-12)
+
+def test_pcb_empty_cloud():
+    import PointCloudBinary as pcb
+    cloud = pcb.DecodePcb(pcb.EncodePcb(np.zeros((0, 3)), np.zeros((0, 3), dtype=np.uint8)))
+    assert len(cloud["points"]) == 0 and len(cloud["colors"]) == 0
+    assert cloud["normals"] is None
+    assert pcb.EncodePcb([]) == pcb.EncodePcb(np.zeros((0, 3)))
+
+# Mesh properties
+
+def BoxMesh(size, corner):
+    #closed box mesh, outward faces
+    corners = np.array([[x, y, z] for z in (0, 1) for y in (0, 1) for x in (0, 1)], dtype=float) * size + corner
+    faces = np.array([[0, 2, 1], [1, 2, 3], [4, 5, 6], [5, 7, 6], [0, 1, 4], [1, 5, 4],
+        [2, 6, 3], [3, 6, 7], [0, 4, 2], [2, 4, 6], [1, 3, 5], [3, 7, 5]])
+    return corners, faces
+
+@pytest.mark.parametrize("inward", [False, True])
+def test_mesh_properties_box(inward):
+    import MeshProperties as meshTools
+    size = np.array([1.0, 2.0, 3.0])
+    vertices, faces = BoxMesh(size, (10.0, -5.0, 2.0))
+    #face orientation does not change the properties
+    if inward: faces = faces[:, ::-1]
+    p = meshTools.MeshProperties(vertices, faces)
+    m = size.prod()
+    inertia = np.diag([m / 12 * (size[1] ** 2 + size[2] ** 2), m / 12 * (size[0] ** 2 + size[2] ** 2), m / 12 * (size[0] ** 2 + size[1] ** 2)])
+    assert p["volume"] == pytest.approx(m, rel=1e-12)
+    assert p["area"] == pytest.approx(22.0, rel=1e-12)
+    np.testing.assert_allclose(p["centroid"], [10.5, -4.0, 3.5], rtol=1e-12)
+    np.testing.assert_allclose(p["inertia"], inertia, rtol=1e-9, atol=1e-9)
+    assert p["watertight"]
+
+def test_mesh_watertight():
+    import MeshProperties as meshTools
+    faces = BoxMesh((1.0, 1.0, 1.0), (0.0, 0.0, 0.0))[1]
+    assert meshTools.IsWatertight(faces)
+    #open, and inconsistently oriented
+    assert not meshTools.IsWatertight(faces[1:])
+    assert not meshTools.IsWatertight(np.r_[faces[:1, ::-1], faces[1:]])
+
+# Incremental export
+
+def test_export_skips_unchanged(tmp_path, monkeypatch):
+    from LocalBackend import LocalBackend
+    rng = np.random.RandomState(9)
+    sources = []
+    for k in range(2):
+        sources.append(str(tmp_path / "cloud{}.xyz".format(k)))
+        np.savetxt(sources[-1], rng.normal(size=(1000, 3)))
+    pathWebRoot = str(tmp_path / "catalogue")
+    for folder in ("3dm", "pcb", "pcm"):
+        os.makedirs(os.path.join(pathWebRoot, "data", folder))
+    processed = []
+    processTask = core._ProcessTask
+    monkeypatch.setattr(core, "_ProcessTask", lambda task: processed.append(task[1]) or processTask(task))
+    #no mesh without open3d: poisonMaxDepth is still part of the cache key
+    params = {"meshTargetFaces": [], "octreeBudget": 0, "poisonMaxDepth": 5}
+    def Export(params):
+        del processed[:]
+        rows = core.ExportCatalogue(LocalBackend(), sources, pathWebRoot, params, "Stones")
+        assert [row[1] for row in rows] == ["Stones", "Stones"]
+        return sorted(processed)
+    assert Export(params) == sources
+    assert Export(params) == []
+    #other parameters: everything again
+    params["poisonMaxDepth"] = 6
+    assert Export(params) == sources
+    #other points in one file, or a missing artifact of the other
+    np.savetxt(sources[0], rng.normal(size=(1000, 3)))
+    assert Export(params) == sources[:1]
+    for name in os.listdir(os.path.join(pathWebRoot, "data", "pcb")):
+        os.remove(os.path.join(pathWebRoot, "data", "pcb", name))
+    assert Export(params) == sources
+
+# Batch command
+
+def test_batch_branch_conflict(tmp_path, capsys):
+    import CatalogueBatch
+    path = str(tmp_path / "cloud.xyz")
+    np.savetxt(path, np.random.RandomState(6).normal(size=(500, 3)))
+    pathWebRoot = str(tmp_path / "catalogue")
+    args = [pathWebRoot, path, "--workers", "1", "--mesh-target-faces", "--octree-budget", "0"]
+    assert CatalogueBatch.main(args + ["--branch", "Stones.Basalt"]) == 0
+    #Basalt is already a child of Stones: reported, no traceback
+    capsys.readouterr()
+    assert CatalogueBatch.main(args + ["--branch", "Rocks.Basalt"]) == 1
+    assert "Basalt is already used under Stones" in capsys.readouterr().err
+    #other errors are not reported as conflicts
+    pathBad = str(tmp_path / "cloud.unknown")
+    open(pathBad, "w").close()
+    with pytest.raises(ValueError, match="unsupported point cloud format"):
+        CatalogueBatch.main([pathWebRoot, pathBad, "--workers", "1", "--branch", "Stones.Basalt"])
+
+# Catalogue store
+
+def test_store_journal_replay(tmp_path, monkeypatch):
+    import csv
+    import CatalogueStore as storeTools
+    pathWebRoot = str(tmp_path)
+    store = storeTools.CatalogueStore(pathWebRoot)
+    store.UpsertMany([["Stones", "root"], ["a", "Stones", "", 10], ["b", "Stones", "", 20]])
+    store.Commit()
+    assert not os.path.exists(store.pathJournal)
+    #interrupted run: rows journaled, no commit, last line cut mid-write
+    store = storeTools.CatalogueStore(pathWebRoot)
+    store.Upsert(["Rocks", "root"])
+    store.Upsert(["b", "Rocks", "", 21])
+    store.Upsert(["c", "Rocks", "", 30])
+    store.journal.close()
+    with open(store.pathJournal, "a") as f:
+        f.write('["d", "Roc')
+    #the CSV is still the committed one
+    with open(store.pathCsv) as f:
+        assert [row[0] for row in csv.reader(f)] == ["item", "Stones", "a", "b"]
+    store = storeTools.CatalogueStore(pathWebRoot)
+    assert [row[0] for row in store.Rows()] == ["Stones", "a", "b", "Rocks", "c"]
+    assert store.Get("b") == ["b", "Rocks", "", 21]
+    assert "d" not in store
+    #old and new parents of the replayed rows
+    assert store.replayedParents == set(["root", "Stones", "Rocks"])
+    #failed commit: previous CSV and journal kept
+    def Fail(pathTmp, path): raise OSError("disk full")
+    monkeypatch.setattr(storeTools, "ReplaceFile", Fail)
+    with pytest.raises(OSError):
+        store.Commit()
+    with open(store.pathCsv) as f:
+        assert len(list(csv.reader(f))) == 4
+    assert os.path.exists(store.pathJournal)
+    monkeypatch.undo()
+    storeTools.CatalogueStore(pathWebRoot).Commit()
+    with open(store.pathCsv) as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["item", "parent", "label", "original_point_cloud_count", "minimal_bounding_box_volume",
+        "mesh_volume", "date_created", "user", "poisson_depth", "surface_area", "watertight", "sphericity",
+        "elongation", "flatness"]
+    assert [row[0] for row in rows[1:]] == ["Stones", "a", "b", "Rocks", "c"]
+    assert rows[3] == ["b", "Rocks", "", "21"]
+    assert not os.path.exists(store.pathJournal)
+    assert not os.path.exists(store.pathCsv + ".tmp")
+
+# Catalogue manifest
+
+def ObjectRow(item, parent, count, volume, watertight="True"):
+    return [item, parent, "", count, volume, volume, "2024-01-01T00:00:00Z", "user", 6, 1.0, watertight, 0.9, 0.8, 0.7]
+
+def test_manifest_columns():
+    import CatalogueManifest as manifestTools
+    import CatalogueTree as treeTools
+    rows = [["Stones", "root"], ["Basalt", "Stones"], ["Granite", "Stones"],
+        ObjectRow("a", "Basalt", 10, 3.0), ObjectRow("b", "Basalt", 20, 1.0, "False"),
+        ObjectRow("c", "Granite", 30, ""), ObjectRow("d", "Granite", 40, 2.0)]
+    manifest = manifestTools.BuildManifest(rows, treeTools.CatalogueTree.FromRows(rows))
+    assert manifest["items"] == ["a", "b", "c", "d"]
+    assert manifest["branches"] == {"root": [0, 4], "Stones": [0, 4], "Basalt": [0, 2], "Granite": [2, 4]}
+    volumes = manifest["columns"]["minimal_bounding_box_volume"]
+    assert volumes == [3, 1, None, 2]
+    assert manifest["columns"]["watertight"] == [True, False, True, True]
+    #missing values are left out of the sorted positions
+    assert manifest["sorted"]["minimal_bounding_box_volume"] == [1, 3, 0]
+    assert manifest["sorted"]["original_point_cloud_count"] == [0, 1, 2, 3]
+    histogram = manifest["histograms"]["minimal_bounding_box_volume"]
+    assert (histogram["min"], histogram["max"]) == (1, 3)
+    assert len(histogram["counts"]) == 32
+    assert histogram["counts"][0] == 1 and histogram["counts"][16] == 1 and histogram["counts"][31] == 1
+    assert sum(histogram["counts"]) == 3
+
+def ShardRows(counts):
+    #one branch per (name, item count) under root
+    rows = []
+    for name, count in counts:
+        rows.append([name, "root"])
+        rows.extend(ObjectRow("{}_{}".format(name, i), name, i, float(i)) for i in range(count))
+    return rows
+
+def test_manifest_shards(tmp_path):
+    import CatalogueManifest as manifestTools
+    import CatalogueTree as treeTools
+    pathWebRoot = str(tmp_path)
+    pathShards = manifestTools.ShardsPath(pathWebRoot)
+    def Update(rows, touched=None):
+        return sorted(manifestTools.UpdateShards(pathWebRoot, rows, treeTools.CatalogueTree.FromRows(rows), touched))
+    rows = ShardRows([("Big", 2500), ("Small", 10)])
+    assert Update(rows) == ["Big_0.json", "Big_1.json", "Big_2.json", "Small_0.json"]
+    index = manifestTools.LoadShardIndex(pathWebRoot)
+    assert (index["pageSize"], index["count"], index["root"]) == (1000, 2510, "root")
+    assert index["branches"]["Big"]["shards"] == ["Big_0.json", "Big_1.json", "Big_2.json"]
+    assert (index["branches"]["Big"]["items"], index["branches"]["root"]["total"]) == (2500, 2510)
+    assert sum(index["histograms"]["original_point_cloud_count"]["counts"]) == 2510
+    with open(os.path.join(pathShards, "Big_2.json")) as f:
+        shard = json.load(f)
+    assert (shard["branch"], shard["page"], len(shard["items"])) == ("Big", 2, 500)
+    assert shard["items"][0] == "Big_2000"
+    #one changed item: only its page is rewritten
+    rows[rows.index(ObjectRow("Big_1500", "Big", 1500, 1500.0))] = ObjectRow("Big_1500", "Big", 1500, 0.5)
+    assert Update(rows, touched=set(["Big"])) == ["Big_1.json"]
+    assert Update(rows, touched=set(["Big"])) == []
+    #fewer items: the pages beyond the last one are deleted, and the
+    #shards of a branch that is gone
+    rows = ShardRows([("Big", 900)])
+    assert Update(rows, touched=set(["Big"])) == ["Big_0.json"]
+    assert sorted(os.listdir(pathShards)) == ["Big_0.json", "index.json"]
+
+# Precompression
+
+def test_compress_tree(tmp_path, monkeypatch):
+    import CatalogueCompression as compression
+    root = tmp_path / "catalogue"
+    (root / "data" / "cache").mkdir(parents=True)
+    text = b"catalogue " * 500
+    (root / "index.html").write_bytes(text)
+    (root / "small.js").write_bytes(b"x" * 100)
+    (root / "image.png").write_bytes(text)
+    (root / "random.js").write_bytes(np.random.RandomState(8).bytes(4096))
+    (root / "data" / "cache.json").write_bytes(text)
+    (root / "data" / "cache" / "normals.json").write_bytes(text)
+    (root / "data" / "database.csv").write_bytes(text)
+    pathRoot = str(root)
+    written = compression.CompressTree(pathRoot, workers=1, useBrotli=False)
+    assert sorted(os.path.relpath(p, pathRoot) for p in written) == [os.path.join("data", "database.csv.gz"), "index.html.gz"]
+    import gzip
+    assert gzip.decompress((root / "index.html.gz").read_bytes()) == text
+    #random bytes do not shrink: no variant, and not compressed again
+    assert not (root / "random.js.gz").exists()
+    compressed = []
+    compress = compression.Compress
+    monkeypatch.setattr(compression, "Compress", lambda data, suffix: compressed.append(len(data)) or compress(data, suffix))
+    assert compression.CompressTree(pathRoot, workers=1, useBrotli=False) == []
+    assert compressed == []
+    #changed files are compressed again
+    (root / "random.js").write_bytes(text)
+    assert compression.CompressTree(pathRoot, workers=2, useBrotli=False) == [str(root / "random.js.gz")]
+    #variants of removed files are removed
+    (root / "index.html").unlink()
+    (root / "gone.js.br").write_bytes(b"")
+    compression.CompressTree(pathRoot, workers=1, useBrotli=False)
+    assert not (root / "index.html.gz").exists()
+    assert sorted(os.listdir(pathRoot)) == ["data", "image.png", "random.js", "random.js.gz", "small.js"]
+
+# Static assets
+
+def test_sync_static(tmp_path, monkeypatch):
+    import CatalogueAssets as assets
+    static = tmp_path / "static"
+    (static / "js").mkdir(parents=True)
+    (static / "index.html").write_text("<html></html>")
+    (static / "js" / "app.js").write_text("var a = 1;")
+    (static / "js" / "app.js.map").write_text("{}")
+    target = tmp_path / "catalogue"
+    target.mkdir()
+    #identical file already in the catalogue, unknown to the manifest
+    (target / "index.html").write_text("<html></html>")
+    counts = assets.SyncStatic(str(static), str(target))
+    assert (counts["copied"], counts["skipped"], counts["removed"]) == (2, 1, 0)
+    #second run: nothing to copy, no target read
+    monkeypatch.setattr(assets, "FileHash", lambda path: pytest.fail("hashed " + path))
+    counts = assets.SyncStatic(str(static), str(target))
+    assert (counts["copied"], counts["linked"], counts["skipped"], counts["bytes"]) == (0, 0, 3, 0)
+    monkeypatch.undo()
+    #production: dev-only files synced before are removed
+    counts = assets.SyncStatic(str(static), str(target), production=True)
+    assert (counts["skipped"], counts["removed"]) == (2, 1)
+    assert not (target / "js" / "app.js.map").exists()
+    #changed source, hard link
+    (static / "js" / "app.js").write_text("var a = 2;")
+    counts = assets.SyncStatic(str(static), str(target), production=True, link="hardlink")
+    assert counts["linked"] == 1
+    assert os.path.samefile(str(static / "js" / "app.js"), str(target / "js" / "app.js"))
+    #hard link not possible (e.g. across devices): copied instead
+    def NoLink(source, target): raise OSError("cross-device link")
+    monkeypatch.setattr(os, "link", NoLink)
+    (static / "index.html").write_text("<html>2</html>")
+    counts = assets.SyncStatic(str(static), str(target), production=True, link="hardlink")
+    assert (counts["copied"], counts["linked"], counts["skipped"]) == (1, 0, 1)
+    assert (target / "index.html").read_text() == "<html>2</html>"
+    assert not os.path.samefile(str(static / "index.html"), str(target / "index.html"))
+
+# Poisson batch and depth
+
+def FakeMesher(task):
+    #PoissonBatch worker without open3d: records when it ran
+    import time
+    path, pathMesh, params = task
+    start = time.time()
+    time.sleep(0.3)
+    with open(pathMesh, "w") as f:
+        f.write("ply\n")
+    return {"points": 0, "vertices": 0, "faces": 0, "volume": 0.0, "depth": params["poisonMaxDepth"],
+        "elapsed": time.time() - start, "start": start, "stop": time.time()}
+
+def PoissonInputs(tmp_path, count):
+    paths = []
+    for k in range(count):
+        paths.append(str(tmp_path / "cloud{}.xyz".format(k)))
+        np.savetxt(paths[-1], np.random.RandomState(k).normal(size=(200, 3)))
+    return paths
+
+def test_poisson_batch_cancel_resume(tmp_path):
+    import PoissonBatch
+    paths = PoissonInputs(tmp_path, 3)
+    pathOut = str(tmp_path / "meshes")
+    events = []
+    for event in PoissonBatch.IterPoissonBatch(paths, pathOut, workers=1, cancel=lambda: len(events) > 0, mesher=FakeMesher):
+        events.append(event)
+    assert [e["status"] for e in events] == ["done", "cancelled", "cancelled"]
+    statuses = dict((e["path"], e["status"]) for e in PoissonBatch.IterPoissonBatch(paths, pathOut, workers=1, mesher=FakeMesher))
+    assert statuses == {paths[0]: "resumed", paths[1]: "done", paths[2]: "done"}
+    #other meshing parameters: meshed again
+    events = list(PoissonBatch.IterPoissonBatch(paths, pathOut, {"poisonMaxDepth": 7}, workers=1, mesher=FakeMesher))
+    assert [e["status"] for e in events] == ["done"] * 3
+    assert [e["depth"] for e in events] == [7] * 3
+
+def test_poisson_batch_memory_budget(tmp_path):
+    import PoissonBatch
+    paths = PoissonInputs(tmp_path, 2)
+    params = dict((k, core.DEFAULT_PARAMS[k]) for k in PoissonBatch.MESH_PARAMS)
+    memory = PoissonBatch.EstimateMemory(paths[0], params)
+    def Intervals(pathOut, memoryBudget):
+        events = PoissonBatch.IterPoissonBatch(paths, str(tmp_path / pathOut), workers=2,
+            memoryBudget=memoryBudget, mesher=FakeMesher)
+        return sorted((e["start"], e["stop"]) for e in events)
+    #one task at a time within the budget, both at once without
+    first, second = Intervals("budget", int(memory * 1.5))
+    assert second[0] >= first[1]
+    first, second = Intervals("nobudget", None)
+    assert second[0] < first[1]
+
+def test_poisson_depth():
+    params = dict(core.DEFAULT_PARAMS)
+    params.update({"poissonAutoDepth": True, "poissonResolution": 2.0, "poisonScale": 1.0, "poisonMaxDepth": 9})
+    box = ([0.0, 0.0, 0.0], [1.0, 0.5, 0.25])
+    #1 / (2 * spacing) cells along the longest side
+    assert core.PoissonDepth(1.0 / 2 / 100, box, params) == 7
+    assert core.PoissonDepth(1.0 / 2 / 200, box, params) == 8
+    assert core.PoissonDepth(1e-9, box, params) == core.AUTO_DEPTH_MAX
+    assert core.PoissonDepth(0.1, box, params) == core.AUTO_DEPTH_MIN
+    assert core.PoissonDepth(10.0, box, params) == core.AUTO_DEPTH_MIN
+    #fixed depth: no auto depth, or no spacing
+    assert core.PoissonDepth(None, box, params) == 9
+    assert core.PoissonDepth(0.0, box, params) == 9
+    params["poissonAutoDepth"] = False
+    assert core.PoissonDepth(1.0 / 2 / 100, box, params) == 9